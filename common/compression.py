@@ -1,9 +1,105 @@
+import zlib
+
 import brotli
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+IDENTITY = 'identity'
+BROTLI = 'br'
+DEFLATE = 'deflate'
+ZSTD = 'zstd'
+
+# Messages published without a content_encoding were always compressed with brotli
+DEFAULT_CONTENT_ENCODING = BROTLI
+
+DEFAULT_LEVELS = {
+    BROTLI: 5,
+    DEFLATE: 6,
+    ZSTD: 3
+}
+
+
+def to_bytes(string):
+    return string if isinstance(string, bytes) else str.encode(string)
+
+
+def compress_bytes(data, codec=BROTLI, level=None):
+    if level is None:
+        level = DEFAULT_LEVELS.get(codec)
+
+    if codec == IDENTITY:
+        return data
+
+    if codec == BROTLI:
+        return brotli.compress(data, mode=brotli.MODE_TEXT, quality=level)
+
+    if codec == DEFLATE:
+        return zlib.compress(data, level)
+
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        return zstandard.ZstdCompressor(level=level).compress(data)
+
+    raise ValueError(f'Unknown compression codec: {codec}')
+
+
+def decompress_bytes(data, content_encoding=None):
+    content_encoding = content_encoding or DEFAULT_CONTENT_ENCODING
+
+    if content_encoding == IDENTITY:
+        return data
+
+    if content_encoding == BROTLI:
+        return brotli.decompress(data)
+
+    if content_encoding == DEFLATE:
+        return zlib.decompress(data)
+
+    if content_encoding == ZSTD:
+        if zstandard is None:
+            raise ValueError('zstd decompression requires the zstandard package')
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError(f'Unknown content encoding: {content_encoding}')
+
+
+def compress(string, codec=BROTLI, level=None):
+    return compress_bytes(to_bytes(string), codec=codec, level=level)
+
+
+def decompress(bytes, content_encoding=None):
+    return decompress_bytes(bytes, content_encoding).decode()
+
+
+class Compressor:
+    """
+    Compresses payloads with a configured codec. Payloads smaller than min_size are not worth
+    the CPU and are sent as they are. The returned content encoding tells decompress how to
+    decode the payload.
+    """
+
+    def __init__(self, codec=BROTLI, level=None, min_size=0):
+        if codec == ZSTD and zstandard is None:
+            raise ValueError('zstd compression requires the zstandard package')
+        if codec not in (IDENTITY, BROTLI, DEFLATE, ZSTD):
+            raise ValueError(f'Unknown compression codec: {codec}')
+
+        self.codec = codec
+        self.level = DEFAULT_LEVELS.get(codec) if level is None else level
+        self.min_size = min_size
 
-def compress(string):
-    return brotli.compress(string=str.encode(string), mode=brotli.MODE_TEXT, quality=11)
+    def compress(self, payload):
+        """
+        :return: The compressed payload and its content encoding.
+        """
+        data = to_bytes(payload)
 
+        if len(data) < self.min_size:
+            return data, IDENTITY
 
-def decompress(bytes):
-    return brotli.decompress(bytes).decode()
+        return compress_bytes(data, codec=self.codec, level=self.level), self.codec
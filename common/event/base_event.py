@@ -3,6 +3,7 @@ import json
 from datetime import datetime
 
 from common.log import get_logger
+from common.serialization import loads
 from common.utils import get_utc_now
 
 logger = get_logger(__name__)
@@ -120,7 +121,10 @@ class BaseEvent:
         return col['value']
 
     def load_wal2json_payload(self, body):
-        pl = json.loads(body)
+        """
+        :param body: A wal2json change, either the raw payload or the payload parsed already.
+        """
+        pl = body if isinstance(body, dict) else loads(body)
         logger.debug('got payload %s', body)
         self.recorded_at = get_utc_now()
 
@@ -149,11 +153,12 @@ class BaseEvent:
         return "Event <table_name: %s>" % self.table_name
 
     def from_dict(self, payload_dict):
+        """Load an event, sections left out by the event shape of its table are empty"""
         self.table_name = payload_dict.get('table_name')
-        self.old = payload_dict.get('old')
-        self.new = payload_dict.get('new')
+        self.old = payload_dict.get('old') or {}
+        self.new = payload_dict.get('new') or {}
         self.id = payload_dict.get('id')
-        self.diff = payload_dict.get('diff')
+        self.diff = payload_dict.get('diff') or {}
         self.action = payload_dict.get('action')
         self.recorded_at = get_utc_now()
 
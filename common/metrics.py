@@ -0,0 +1,334 @@
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Sequence, Tuple, Union
+
+from common.log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Seconds, from a tenth of a millisecond to five seconds
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+SIZE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+BYTE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    """
+    A metric with an optional set of label names. Values are kept per combination of label
+    values, a child returned by labels() updates the values of one combination.
+    """
+    type_name = None
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def _default(self):
+        return self.labels()
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+        with self._lock:
+            children = list(self._children.items())
+
+        for values, child in children:
+            lines.extend(child.render(self.name, format_labels(self.labelnames, values), self.labelnames, values))
+
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0
+
+    def render(self, name, labels, _labelnames, _values):
+        return [f'{name}{labels} {self.value}']
+
+
+class _CounterValue(_Value):
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class _GaugeValue(_Value):
+    def set(self, value):
+        self.value = value
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labels, labelnames, values):
+        lines = []
+
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            bucket_labels = format_labels(labelnames, values, f'le="{bound}"')
+            lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+
+        bucket_labels = format_labels(labelnames, values, 'le="+Inf"')
+        lines.append(f'{name}_bucket{bucket_labels} {self.count}')
+        lines.append(f'{name}_sum{labels} {self.sum}')
+        lines.append(f'{name}_count{labels} {self.count}')
+
+        return lines
+
+
+class Counter(Metric):
+    type_name = 'counter'
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(Metric):
+    type_name = 'gauge'
+
+    def _new_child(self):
+        return _GaugeValue()
+
+    def set(self, value):
+        self._default().set(value)
+
+
+class Histogram(Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=TIME_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Metrics:
+    """Registry of metrics, rendered in the Prometheus text exposition format"""
+    enabled = True
+
+    def __init__(self):
+        self.__metrics: Dict[str, Metric] = {}
+
+    def __register(self, cls, name, *args, **kwargs):
+        metric = self.__metrics.get(name)
+        if metric is None:
+            metric = cls(name, *args, **kwargs)
+            self.__metrics[name] = metric
+
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.__register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.__register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets=TIME_BUCKETS) -> Histogram:
+        return self.__register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.__metrics.values()):
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+
+class _NoopMetric:
+    """Stands in for every metric when metrics are disabled, every update does nothing"""
+
+    def labels(self, *_values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return nullcontext()
+
+
+NOOP_METRIC = _NoopMetric()
+
+
+class NoopMetrics:
+    """Takes the arguments of Metrics, every metric is NOOP_METRIC"""
+
+    enabled = False
+
+    def counter(self, *_args, **_kwargs):
+        return NOOP_METRIC
+
+    def gauge(self, *_args, **_kwargs):
+        return NOOP_METRIC
+
+    def histogram(self, *_args, **_kwargs):
+        return NOOP_METRIC
+
+    def render(self) -> str:
+        return ''
+
+
+NOOP_METRICS = NoopMetrics()
+
+
+class MetricsServer:
+    """Serves the metrics on http://<host>:<port>/metrics from a daemon thread"""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = ''):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # pylint: disable=invalid-name
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.__server.server_address[1]
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    def start(self):
+        logger.info('Serving metrics on port %s', self.port)
+        self.__thread.start()
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+
+class MetricsFileWriter:
+    """
+    Writes the metrics to a file every interval seconds, e.g. for the node exporter textfile
+    collector. The file is replaced atomically so readers never see a partial file.
+    """
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 10):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+
+        self.__stopped = threading.Event()
+        self.__thread = threading.Thread(target=self.__run, daemon=True)
+
+    def write(self):
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render())
+        os.replace(tmp_path, self.path)
+
+    def __run(self):
+        while not self.__stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logger.error('Error writing metrics to %s: %s', self.path, e)
+
+    def start(self):
+        logger.info('Writing metrics to %s every %s seconds', self.path, self.interval)
+        self.__thread.start()
+
+    def stop(self):
+        self.__stopped.set()
+        self.write()
+
+
+def create_metrics(port: Union[int, None] = None, path: Union[str, None] = None,
+                   interval: float = 10) -> Tuple[Union[Metrics, NoopMetrics], List]:
+    """
+    Create the metrics registry and start exporting it over HTTP and/or to a text file.
+
+    :return: The registry, NOOP_METRICS when neither a port nor a path is given, and the started exporters.
+    """
+    if not port and not path:
+        return NOOP_METRICS, []
+
+    metrics = Metrics()
+    exporters = []
+
+    if port:
+        exporters.append(MetricsServer(metrics, port))
+    if path:
+        exporters.append(MetricsFileWriter(metrics, path, interval))
+
+    for exporter in exporters:
+        exporter.start()
+
+    return metrics, exporters
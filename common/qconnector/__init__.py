@@ -1,2 +1,4 @@
 from .q_connector import QConnector
+from .async_q_connector import AsyncQConnector
 from .rabbitmq_connector import RabbitMQConnector
+from .async_rabbitmq_connector import AsyncRabbitMQConnector
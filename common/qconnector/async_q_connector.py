@@ -0,0 +1,34 @@
+from abc import abstractmethod
+
+from common.qconnector.q_connector import BaseQConnector
+
+
+class AsyncQConnector(BaseQConnector):
+    """
+    Connector running on an asyncio event loop. Publishing only hands messages to the loop,
+    connecting, waiting for confirms and consuming are coroutines.
+    """
+
+    @abstractmethod
+    async def connect(self):
+        pass
+
+    @property
+    def connection_lost(self):
+        """True once the connection was closed by anything but disconnect()"""
+        return False
+
+    async def reconnect(self):
+        """Connect again after the connection was lost"""
+        await self.connect()
+
+    async def wait_for_confirms(self):
+        """Wait until every published message has been confirmed, a no-op without publisher confirms"""
+
+    @abstractmethod
+    async def consume_stream(self, callback_fn):
+        pass
+
+    @abstractmethod
+    async def consume_all(self):
+        pass
@@ -0,0 +1,369 @@
+import asyncio
+import functools
+import inspect
+from collections import deque
+from typing import List
+
+import pika
+from pika.adapters.asyncio_connection import AsyncioConnection
+
+from common.compression import Compressor
+from common.log import get_logger
+from common.qconnector import AsyncQConnector
+from common.qconnector.confirm_tracker import ConfirmTracker
+from common.serialization import decode_body
+
+logger = get_logger(__name__)
+
+# consume_all gives up on a message that disappeared from the queue after this many seconds
+GET_TIMEOUT = 5
+
+
+class AsyncRabbitMQConnector(AsyncQConnector):
+    """
+    RabbitMQ connector running on an asyncio event loop with pika's asyncio adapter.
+
+    Publishing never blocks: frames are handed to the event loop and, with publisher confirms,
+    confirms are collected in the background while further messages are published. Messages
+    are spread over several channels by routing key, so messages with the same routing key
+    keep their order. Setting up the connection and consuming are coroutines.
+
+    A lost connection is re-established once by reconnect(), like the blocking connector retries
+    once. Unconfirmed messages are published again then. Without publisher confirms a message
+    counts as published once its frame is buffered, so messages still buffered when the broker
+    drops the connection are lost, only messages published while it was down are sent again.
+    """
+
+    def __init__(self, rabbitmq_url, rabbitmq_exchange, queue_name=None, binding_keys=None, prefetch_count=1,
+                 publisher_confirms=False, channels=1, compression_codec='br', compression_level=None,
+                 compression_min_size=0, content_type=None):
+        self.__rabbitmq_url = rabbitmq_url
+        self.__rabbitmq_exchange = rabbitmq_exchange
+        self.__queue_name = queue_name
+        self.__binding_keys = binding_keys
+        self.__prefetch_count = prefetch_count
+
+        self.__publisher_confirms = publisher_confirms
+        self.__channel_count = channels
+
+        self.__compressor = Compressor(codec=compression_codec, level=compression_level, min_size=compression_min_size)
+
+        # how the published payloads are serialized, consumers parse them accordingly
+        self.__content_type = content_type
+
+        self.__connection = None
+        self.__blocked = False
+        self.__closed = None
+        self.__disconnecting = False
+
+        # messages published while the connection was down, without confirms they are not tracked
+        self.__unsent = deque()
+        self.__channels = []
+        self.__consume_channel = None
+        self.__tasks = set()
+
+        # one tracker per publishing channel, mapped onto sequence numbers across all channels
+        self.__trackers: List[ConfirmTracker] = []
+        self.__sequences = deque()
+        self.__published_sequence = 0
+        self.__confirmed_sequence = 0
+        self.__confirmed = None
+
+        super().__init__()
+
+    @staticmethod
+    async def __call(fn, callback_name='callback', **kwargs):
+        """Run a pika method that reports completion through a callback argument"""
+        future = asyncio.get_running_loop().create_future()
+
+        def on_done(*args):
+            if not future.done():
+                future.set_result(args[0] if args else None)
+
+        fn(**{callback_name: on_done}, **kwargs)
+        return await future
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        opened = loop.create_future()
+        self.__closed = loop.create_future()
+        self.__disconnecting = False
+        if self.__confirmed is None:
+            self.__confirmed = asyncio.Event()
+
+        def on_open_error(connection, error):
+            if not opened.done():
+                opened.set_exception(pika.exceptions.AMQPConnectionError(error))
+
+        def on_close(connection, reason):
+            logger.warning('Connection closed: %s', reason)
+            if not opened.done():
+                opened.set_exception(pika.exceptions.AMQPConnectionError(reason))
+            if not self.__closed.done():
+                self.__closed.set_result(reason)
+
+            # confirms for the channels of this connection will never arrive
+            self.__confirmed.set()
+
+        self.__connection = AsyncioConnection(
+            parameters=pika.URLParameters(self.__rabbitmq_url),
+            on_open_callback=opened.set_result,
+            on_open_error_callback=on_open_error,
+            on_close_callback=on_close,
+            custom_ioloop=loop
+        )
+        await opened
+
+        self.__blocked = False
+        self.__connection.add_on_connection_blocked_callback(self.__on_blocked)
+        self.__connection.add_on_connection_unblocked_callback(self.__on_unblocked)
+
+        self.__channels = []
+        for index in range(self.__channel_count):
+            self.__channels.append(await self.__open_channel(index))
+
+        # confirms for messages published before the connection was lost will never arrive
+        for index, tracker in enumerate(self.__trackers):
+            for sequence, message in tracker.reset():
+                self.__basic_publish(index, message)
+                tracker.add(message, sequence=sequence)
+
+        while self.__unsent:
+            message = self.__unsent.popleft()
+            self.__basic_publish(hash(message[0]) % len(self.__channels), message)
+
+        await self.__call(
+            self.__channels[0].exchange_declare,
+            exchange=self.__rabbitmq_exchange,
+            exchange_type='topic',
+            durable=True
+        )
+
+        # if messages are to be consumed from the connection
+        if self.__queue_name and self.__binding_keys:
+            await self.__declare_queue()
+
+    async def __open_channel(self, index):
+        channel = await self.__call(self.__connection.channel, callback_name='on_open_callback')
+        channel.add_on_close_callback(lambda ch, reason: logger.warning('Channel %s closed: %s', index, reason))
+
+        if self.__publisher_confirms:
+            # trackers are kept on a reconnect, they hold the messages to publish again
+            if index == len(self.__trackers):
+                self.__trackers.append(ConfirmTracker())
+            await self.__call(
+                channel.confirm_delivery,
+                ack_nack_callback=functools.partial(self.__on_delivery_confirmation, index)
+            )
+
+        return channel
+
+    async def __declare_queue(self):
+        self.__consume_channel = await self.__call(self.__connection.channel, callback_name='on_open_callback')
+        await self.__call(self.__consume_channel.basic_qos, prefetch_count=self.__prefetch_count)
+
+        frame = await self.__call(
+            self.__consume_channel.queue_declare,
+            queue=self.__queue_name,
+            durable=True,
+            exclusive=False,
+            auto_delete=False
+        )
+        self.__queue_name = frame.method.queue
+        logger.info('queue declared: %s', self.__queue_name)
+
+        for binding_key in self.__binding_keys.split(','):
+            logger.info('binding to exchange %s with queue %s and binding_key %s',
+                        self.__rabbitmq_exchange, self.__queue_name, binding_key)
+
+            await self.__call(
+                self.__consume_channel.queue_bind,
+                queue=self.__queue_name,
+                exchange=self.__rabbitmq_exchange,
+                routing_key=binding_key
+            )
+
+    def disconnect(self):
+        self.__disconnecting = True
+        if self.__connection and not (self.__connection.is_closing or self.__connection.is_closed):
+            self.__connection.close()
+
+    @property
+    def connection_lost(self):
+        """The connection was closed by anything but disconnect()"""
+        return self.__closed is not None and self.__closed.done() and not self.__disconnecting
+
+    async def reconnect(self):
+        """Connect again once after the connection was lost, a failure is raised"""
+        logger.info('Connection lost, reconnecting and publishing unconfirmed messages again')
+        await super().reconnect()
+
+    @property
+    def encoder(self):
+        return self.__compressor.compress
+
+    @property
+    def blocked(self):
+        return self.__blocked
+
+    def __on_blocked(self, connection, frame):
+        logger.warning('Connection blocked by the broker: %s', frame.method.reason)
+        self.__blocked = True
+
+    def __on_unblocked(self, connection, frame):
+        logger.info('Connection unblocked by the broker')
+        self.__blocked = False
+
+    def publish(self, routing_key, payload):
+        """
+        Hand a message to the event loop without waiting for it to be sent.
+
+        :return: The sequence number of the message when publisher confirms are enabled.
+        """
+        body, content_encoding = self.encode(payload)
+        return self.publish_encoded(routing_key=routing_key, body=body, content_encoding=content_encoding)
+
+    def publish_encoded(self, *, routing_key, body, content_encoding=None):
+        index = hash(routing_key) % len(self.__channels)
+        message = (routing_key, body, content_encoding)
+
+        # while the connection is down messages are only kept, reconnect() publishes them
+        if not self.connection_lost:
+            self.__basic_publish(index, message)
+        elif not self.__publisher_confirms:
+            self.__unsent.append(message)
+
+        if not self.__publisher_confirms:
+            return None
+
+        local_sequence = self.__trackers[index].add(message)
+        self.__published_sequence += 1
+        self.__sequences.append((self.__published_sequence, index, local_sequence))
+
+        return self.__published_sequence
+
+    def publish_batch(self, messages):
+        """Hand a batch of messages to the event loop, await wait_for_confirms to know they are stored"""
+        for routing_key, payload in messages:
+            self.publish(routing_key=routing_key, payload=payload)
+
+    def __basic_publish(self, index, message):
+        routing_key, body, content_encoding = message
+        self.__channels[index].basic_publish(
+            exchange=self.__rabbitmq_exchange,
+            routing_key=routing_key,
+            body=body,
+            properties=pika.BasicProperties(
+                delivery_mode=2, content_encoding=content_encoding, content_type=self.__content_type
+            )
+        )
+
+    def __on_delivery_confirmation(self, index, frame):
+        method = frame.method
+        tracker = self.__trackers[index]
+
+        if isinstance(method, pika.spec.Basic.Ack):
+            tracker.ack(method.delivery_tag, multiple=method.multiple)
+        else:
+            tracker.nack(method.delivery_tag, multiple=method.multiple)
+
+            for sequence, message in tracker.take_nacked():
+                logger.info('publishing message %s again after nack', sequence)
+                self.__basic_publish(index, message)
+                tracker.add(message, sequence=sequence)
+
+        self.__confirmed.set()
+
+    @property
+    def confirmed_sequence(self):
+        if not self.__publisher_confirms:
+            return None
+
+        while self.__sequences:
+            sequence, index, local_sequence = self.__sequences[0]
+            if self.__trackers[index].confirmed_sequence < local_sequence:
+                break
+
+            self.__sequences.popleft()
+            self.__confirmed_sequence = sequence
+
+        return self.__confirmed_sequence
+
+    async def wait_for_confirms(self):
+        """Wait until every published message has been confirmed by the broker"""
+        if not self.__publisher_confirms:
+            return
+
+        while self.confirmed_sequence < self.__published_sequence:
+            if self.connection_lost:
+                await self.reconnect()
+                continue
+
+            self.__confirmed.clear()
+            await self.__confirmed.wait()
+
+    async def consume_stream(self, callback_fn):
+        """
+        Consume messages until the connection closes. callback_fn may be a coroutine function,
+        its coroutines run concurrently, bounded by the prefetch count.
+        """
+        loop = asyncio.get_running_loop()
+
+        def stream_consumer(ch, method, properties, body):
+            result = callback_fn(
+                routing_key=method.routing_key,
+                payload=decode_body(body, properties.content_encoding, properties.content_type),
+                delivery_tag=method.delivery_tag
+            )
+
+            if inspect.isawaitable(result):
+                task = loop.create_task(result)
+                self.__tasks.add(task)
+                task.add_done_callback(self.__on_task_done)
+
+            self.check_shutdown()
+
+        self.__consume_channel.basic_consume(
+            queue=self.__queue_name,
+            on_message_callback=stream_consumer,
+            auto_ack=False
+        )
+        await self.__closed
+
+    def __on_task_done(self, task):
+        self.__tasks.discard(task)
+
+        if not task.cancelled() and task.exception() is not None:
+            logger.error('Error processing message: %s', task.exception(), exc_info=task.exception())
+
+    async def consume_all(self):
+        routing_key_events = []
+
+        frame = await self.__call(self.__consume_channel.queue_declare, queue=self.__queue_name, passive=True)
+
+        for _ in range(frame.method.message_count):
+            future = asyncio.get_running_loop().create_future()
+            self.__consume_channel.basic_get(
+                self.__queue_name,
+                lambda ch, method, properties, body, future=future: future.set_result((method, properties, body)),
+                auto_ack=True
+            )
+
+            try:
+                method, properties, body = await asyncio.wait_for(future, GET_TIMEOUT)
+            except asyncio.TimeoutError:
+                break
+
+            routing_key_events.append(
+                (method.routing_key, decode_body(body, properties.content_encoding, properties.content_type))
+            )
+
+        return routing_key_events
+
+    def acknowledge_message(self, delivery_tag, multiple=False):
+        """Acknowledge a message has been processed successfully"""
+        self.__consume_channel.basic_ack(delivery_tag=delivery_tag, multiple=multiple)
+
+    def reject_message(self, delivery_tag, requeue=False):
+        """Reject a message that couldn't be processed"""
+        self.__consume_channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
@@ -0,0 +1,119 @@
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+from common.log import get_logger
+
+logger = get_logger(__name__)
+
+
+class ConfirmTracker:
+    """
+    Keeps track of messages published on a channel in confirm mode.
+
+    Every message gets a sequence number that stays the same when it has to be published
+    again, after a nack or on a new channel, while the broker's delivery tags restart with
+    every channel. The highest contiguously confirmed sequence number tells up to which
+    message everything is safely stored by the broker.
+    """
+
+    def __init__(self):
+        self.__next_sequence = 1
+        self.__confirmed_sequence = 0
+
+        # sequence -> message, for every message that is not confirmed yet
+        self.__unconfirmed: Dict[int, Any] = {}
+        self.__order = deque()
+
+        # delivery tag -> sequence, for the current channel
+        self.__delivery_tags: Dict[int, int] = {}
+        self.__delivery_tag_order = deque()
+        self.__last_delivery_tag = 0
+
+        self.__nacked: List[int] = []
+
+    @property
+    def inflight(self) -> int:
+        """Number of published messages still waiting for a confirm"""
+        return len(self.__unconfirmed)
+
+    @property
+    def published_sequence(self) -> int:
+        return self.__next_sequence - 1
+
+    @property
+    def confirmed_sequence(self) -> int:
+        """Highest sequence number up to which every message has been confirmed"""
+        while self.__order and self.__order[0] not in self.__unconfirmed:
+            self.__confirmed_sequence = self.__order.popleft()
+
+        if not self.__order:
+            self.__confirmed_sequence = self.published_sequence
+
+        return self.__confirmed_sequence
+
+    def add(self, message: Any, sequence: int = None) -> int:
+        """
+        Record a message that was just published on the current channel.
+
+        :param message: Whatever is needed to publish the message again.
+        :param sequence: Sequence number of a message that is published again.
+        :return: The sequence number of the message.
+        """
+        if sequence is None:
+            sequence = self.__next_sequence
+            self.__next_sequence += 1
+            self.__order.append(sequence)
+
+        self.__unconfirmed[sequence] = message
+
+        self.__last_delivery_tag += 1
+        self.__delivery_tags[self.__last_delivery_tag] = sequence
+        self.__delivery_tag_order.append(self.__last_delivery_tag)
+
+        return sequence
+
+    def __resolve(self, delivery_tag: int, multiple: bool) -> List[int]:
+        """Return and forget the sequence numbers a delivery tag refers to"""
+        if not multiple:
+            sequence = self.__delivery_tags.pop(delivery_tag, None)
+
+            # tags resolved at the head are dropped, resolved ones behind an open tag follow once it resolves
+            while self.__delivery_tag_order and self.__delivery_tag_order[0] not in self.__delivery_tags:
+                self.__delivery_tag_order.popleft()
+
+            return [] if sequence is None else [sequence]
+
+        sequences = []
+        while self.__delivery_tag_order and self.__delivery_tag_order[0] <= delivery_tag:
+            sequence = self.__delivery_tags.pop(self.__delivery_tag_order.popleft(), None)
+            if sequence is not None:
+                sequences.append(sequence)
+
+        return sequences
+
+    def ack(self, delivery_tag: int, multiple: bool = False) -> None:
+        for sequence in self.__resolve(delivery_tag, multiple):
+            self.__unconfirmed.pop(sequence, None)
+
+    def nack(self, delivery_tag: int, multiple: bool = False) -> None:
+        sequences = self.__resolve(delivery_tag, multiple)
+        logger.warning('broker rejected %s messages up to delivery tag %s', len(sequences), delivery_tag)
+        self.__nacked.extend(sequences)
+
+    def take_nacked(self) -> List[Tuple[int, Any]]:
+        """Return the rejected messages that have to be published again"""
+        nacked = [(sequence, self.__unconfirmed[sequence]) for sequence in sorted(self.__nacked)]
+        self.__nacked = []
+        return nacked
+
+    def reset(self) -> List[Tuple[int, Any]]:
+        """
+        Start over on a new channel. Confirms for the old channel will never arrive, so every
+        unconfirmed message is returned to be published again.
+        """
+        self.__delivery_tags = {}
+        self.__delivery_tag_order = deque()
+        self.__last_delivery_tag = 0
+        self.__nacked = []
+
+        return sorted(self.__unconfirmed.items())
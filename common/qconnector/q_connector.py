@@ -1,33 +1,80 @@
 from abc import ABC, abstractmethod
 
 from common.log import get_logger
+from common.metrics import NOOP_METRICS
 
 logger = get_logger(__name__)
 
 
-class QConnector(ABC):
+def identity_encoder(payload):
+    return payload, None
+
+
+class BaseQConnector(ABC):
+    """
+    Publishing, acknowledging and shutting down, shared by blocking and asyncio connectors.
+    Connecting and consuming are up to QConnector and AsyncQConnector.
+    """
+
     def __init__(self):
         self.__shutdown = False
+        self.use_metrics(NOOP_METRICS)
+        self.use_wait_callback(None)
 
-    @abstractmethod
-    def connect(self):
-        pass
+    def use_metrics(self, metrics):
+        """Record metrics in the given registry, they are discarded by default"""
+        self.metrics = metrics
+
+    def use_wait_callback(self, callback):
+        """Call callback regularly while waiting for the broker, e.g. to keep other connections alive"""
+        self.wait_callback = callback
 
     @abstractmethod
     def disconnect(self):
         pass
 
     @abstractmethod
-    def publish(self, *, routing_key, body):
+    def publish(self, routing_key, payload):
         pass
 
-    @abstractmethod
-    def consume_stream(self, callback_fn):
-        pass
+    @property
+    def encoder(self):
+        """
+        Callable turning a payload into (body, content_encoding) the way publish would. It is
+        handed to encoding workers, so it has to be picklable.
+        """
+        return identity_encoder
 
-    @abstractmethod
-    def consume_all(self):
-        pass
+    def encode(self, payload):
+        return self.encoder(payload)
+
+    def publish_encoded(self, *, routing_key, body, content_encoding=None):
+        """
+        Publish a body that was already encoded with encode(). The default encoder leaves payloads
+        as they are, connectors that compress have to publish the content encoding themselves.
+        """
+        if content_encoding is not None:
+            raise ValueError(f'{type(self).__name__} can not publish bodies with content encoding {content_encoding}')
+
+        return self.publish(routing_key=routing_key, payload=body)
+
+    def publish_batch(self, messages):
+        """Publish (routing_key, payload) pairs, returns once all of them are published"""
+        for routing_key, payload in messages:
+            self.publish(routing_key=routing_key, payload=payload)
+
+    @property
+    def confirmed_sequence(self):
+        """
+        Highest sequence number, as returned by publish, up to which every message has been
+        confirmed by the broker. None when the connector does not use publisher confirms.
+        """
+        return None
+
+    @property
+    def blocked(self):
+        """True while the broker blocks publishing on the connection, e.g. on a memory or disk alarm"""
+        return False
 
     def shutdown(self):
         logger.warning('Shutdown has been requested')
@@ -39,9 +86,41 @@ class QConnector(ABC):
             self.disconnect()
 
     @abstractmethod
-    def acknowledge_message(self, delivery_tag):
+    def acknowledge_message(self, delivery_tag, multiple=False):
         pass
 
     @abstractmethod
     def reject_message(self, delivery_tag, requeue=False):
-        pass
\ No newline at end of file
+        pass
+
+
+class QConnector(BaseQConnector):
+    def fileno(self):
+        """File descriptor of the broker connection to select() on, None when it has none"""
+        return None
+
+    @abstractmethod
+    def connect(self):
+        pass
+
+    def wait_for_confirms(self):
+        """Block until every published message has been confirmed, a no-op without publisher confirms"""
+
+    def process_events(self, time_limit=0):
+        """Give the connection a chance to process incoming events such as confirms and heartbeats"""
+
+    @abstractmethod
+    def consume_stream(self, callback_fn):
+        pass
+
+    @abstractmethod
+    def consume_all(self):
+        pass
+
+    @abstractmethod
+    def consume_batches(self, callback_fn, batch_size, batch_timeout_ms):
+        """
+        Consume messages in batches of up to batch_size, a smaller batch is handed over once its
+        first message waited batch_timeout_ms. callback_fn receives the messages as a list of
+        (routing_key, payload, delivery_tag) and is responsible for acknowledging them.
+        """
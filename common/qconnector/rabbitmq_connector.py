@@ -1,20 +1,43 @@
+import functools
+import threading
+import time
+
 import pika
 from common.qconnector import QConnector
+from common.qconnector.confirm_tracker import ConfirmTracker
 
-from common.compression import compress, decompress
+from common.compression import Compressor, to_bytes
+from common.metrics import BYTE_BUCKETS
 from common.log import get_logger
+from common.serialization import decode_body
 
 logger = get_logger(__name__)
 
+# How long to wait for broker events at a time while waiting for publisher confirms
+CONFIRM_POLL_INTERVAL = 0.1
+
 
 class RabbitMQConnector(QConnector):
-    def __init__(self, rabbitmq_url, rabbitmq_exchange, queue_name=None, binding_keys=None, prefetch_count=1):
+    def __init__(self, rabbitmq_url, rabbitmq_exchange, queue_name=None, binding_keys=None, prefetch_count=1,
+                 publisher_confirms=False, max_inflight=1000, compression_codec='br', compression_level=None,
+                 compression_min_size=0, content_type=None):
         self.__rabbitmq_url = rabbitmq_url
         self.__rabbitmq_exchange = rabbitmq_exchange
         self.__prefetch_count = prefetch_count
 
+        # With publisher confirms up to max_inflight messages may wait for their confirm
+        self.__confirms = ConfirmTracker() if publisher_confirms else None
+        self.__max_inflight = max_inflight
+
+        self.__compressor = Compressor(codec=compression_codec, level=compression_level, min_size=compression_min_size)
+
+        # how the published payloads are serialized, consumers parse them accordingly
+        self.__content_type = content_type
+
         self.__rmq_conn = None
+        self.__blocked = False
         self.__rmq_channel = None
+        self.__connection_thread = None
         self.__queue_name = queue_name
         self.__binding_keys = binding_keys
 
@@ -25,31 +48,190 @@ class RabbitMQConnector(QConnector):
             self.__rmq_conn.close()
 
     def publish(self, routing_key, payload):
-        """Publish with connection/channel state verification and message preservation"""
-        compressed_body = compress(payload)
+        """
+        Publish with connection/channel state verification and message preservation.
+
+        :return: The sequence number of the message when publisher confirms are enabled.
+        """
+        compressed_body, content_encoding = self.encode(payload)
+
+        return self.publish_encoded(routing_key=routing_key, body=compressed_body, content_encoding=content_encoding)
+
+    def use_metrics(self, metrics):
+        super().use_metrics(metrics)
+
+        self.__compress_seconds = metrics.histogram('pgevents_compress_seconds', 'Time spent compressing events')
+        self.__publish_seconds = metrics.histogram('pgevents_publish_seconds', 'Time spent publishing an event')
+        self.__payload_bytes = metrics.histogram('pgevents_payload_bytes', 'Event size before compression', buckets=BYTE_BUCKETS)
+        self.__compressed_bytes = metrics.histogram('pgevents_compressed_bytes', 'Event size after compression', buckets=BYTE_BUCKETS)
+
+    @property
+    def encoder(self):
+        return self.__compressor.compress
+
+    def encode(self, payload):
+        data = to_bytes(payload)
+        with self.__compress_seconds.time():
+            body, content_encoding = self.__compressor.compress(data)
+
+        self.__payload_bytes.observe(len(data))
+        self.__compressed_bytes.observe(len(body))
+        return body, content_encoding
+
+    def publish_encoded(self, *, routing_key, body, content_encoding=None):
+        """Publish a body compressed with encode(), see publish"""
         logger.info('sending message with routing_key %s compressed_body bytes %s ',
-                  routing_key, len(compressed_body))
-        
+                  routing_key, len(body))
+
+        with self.__publish_seconds.time():
+            try:
+                return self.__send(routing_key, body, content_encoding)
+            except Exception:
+                logger.info(f"First try failed, reconnecting and publishing again")
+                self.connect()
+                return self.__send(routing_key, body, content_encoding)
+
+    def publish_batch(self, messages):
+        """
+        Publish a batch of messages and, with publisher confirms, wait until the broker confirmed all of them.
+        Without confirms the whole batch is sent again if the connection had to be re-established.
+        """
+        compressed_messages = [
+            (routing_key, *self.encode(payload)) for routing_key, payload in messages
+        ]
+        logger.info('sending batch of %s messages', len(compressed_messages))
+
+        sent = 0
         try:
-            self.basic_publish(routing_key, compressed_body)
+            for message in compressed_messages:
+                self.__send(*message)
+                sent += 1
         except Exception:
-            logger.info(f"First try failed, reconnecting and publishing again")
+            logger.info('First try failed, reconnecting and publishing the batch again')
             self.connect()
-            self.basic_publish(routing_key, compressed_body)
 
-    def basic_publish(self, routing_key, payload):
+            # unconfirmed messages are published again by connect()
+            remaining = compressed_messages[sent:] if self.__confirms is not None else compressed_messages
+            for message in remaining:
+                self.__send(*message)
+
+        self.wait_for_confirms()
+
+    def __send(self, routing_key, body, content_encoding):
+        if self.__confirms is None:
+            self.basic_publish(routing_key, body, content_encoding)
+            return None
+
+        # keep the window of unconfirmed messages bounded
+        self.__wait_for_inflight(self.__max_inflight - 1)
+
+        self.basic_publish(routing_key, body, content_encoding)
+        return self.__confirms.add((routing_key, body, content_encoding))
+
+    def __wait_for_inflight(self, limit):
+        """Process broker events until at most limit messages are unconfirmed"""
+        while True:
+            self.__republish_nacked()
+
+            if self.__confirms.inflight <= limit:
+                return
+
+            self.__rmq_conn.process_data_events(time_limit=CONFIRM_POLL_INTERVAL)
+            if self.wait_callback is not None:
+                self.wait_callback()
+
+    def __republish_nacked(self):
+        for sequence, message in self.__confirms.take_nacked():
+            logger.info('publishing message %s again after nack', sequence)
+            self.basic_publish(*message)
+            self.__confirms.add(message, sequence=sequence)
+
+    def __on_delivery_confirmation(self, frame):
+        method = frame.method
+
+        if isinstance(method, pika.spec.Basic.Ack):
+            self.__confirms.ack(method.delivery_tag, multiple=method.multiple)
+        else:
+            self.__confirms.nack(method.delivery_tag, multiple=method.multiple)
+
+    def __enable_confirms(self):
+        select_ok = []
+
+        # Confirm mode is enabled on the underlying channel so publishes are pipelined
+        # instead of waiting for every single confirm like BlockingChannel.confirm_delivery
+        self.__rmq_channel._impl.confirm_delivery(  # pylint: disable=protected-access
+            ack_nack_callback=self.__on_delivery_confirmation,
+            callback=select_ok.append
+        )
+        while not select_ok:
+            self.__rmq_conn.process_data_events(time_limit=CONFIRM_POLL_INTERVAL)
+
+        # Confirms for messages published on a previous channel will never arrive
+        for sequence, message in self.__confirms.reset():
+            self.basic_publish(*message)
+            self.__confirms.add(message, sequence=sequence)
+
+    def wait_for_confirms(self):
+        """Block until every published message has been confirmed by the broker"""
+        if self.__confirms is None:
+            return
+
+        try:
+            self.__wait_for_inflight(0)
+        except Exception:
+            logger.info('Waiting for confirms failed, reconnecting and publishing unconfirmed messages again')
+            self.connect()
+            self.__wait_for_inflight(0)
+
+    @property
+    def confirmed_sequence(self):
+        if self.__confirms is None:
+            return None
+
+        return self.__confirms.confirmed_sequence
+
+    @property
+    def blocked(self):
+        return self.__blocked
+
+    def fileno(self):
+        if self.__rmq_conn is None:
+            return None
+
+        # BlockingConnection doesn't expose its socket, it is taken from the underlying transport
+        transport = getattr(self.__rmq_conn._impl, '_transport', None)  # pylint: disable=protected-access
+        sock = getattr(transport, '_sock', None)
+        return sock.fileno() if sock is not None else None
+
+    def __on_blocked(self, connection, frame):
+        logger.warning('Connection blocked by the broker: %s', frame.method.reason)
+        self.__blocked = True
+
+    def __on_unblocked(self, connection, frame):
+        logger.info('Connection unblocked by the broker')
+        self.__blocked = False
+
+    def process_events(self, time_limit=0):
+        self.__rmq_conn.process_data_events(time_limit=time_limit)
+
+        if self.__confirms is not None:
+            self.__republish_nacked()
+
+    def basic_publish(self, routing_key, payload, content_encoding=None):
         self.__rmq_channel.basic_publish(
                 exchange=self.__rabbitmq_exchange,
                 routing_key=routing_key,
                 body=payload,
-                properties=pika.BasicProperties(delivery_mode=2)
+                properties=pika.BasicProperties(
+                    delivery_mode=2, content_encoding=content_encoding, content_type=self.__content_type
+                )
             )
 
     def consume_stream(self, callback_fn):
         def stream_consumer(ch, method, properties, body):
             callback_fn(
                 routing_key=method.routing_key,
-                payload=decompress(body),
+                payload=decode_body(body, properties.content_encoding, properties.content_type),
                 delivery_tag=method.delivery_tag
             )
             self.check_shutdown()
@@ -61,18 +243,49 @@ class RabbitMQConnector(QConnector):
         )
         self.__rmq_channel.start_consuming()
 
+    def consume_batches(self, callback_fn, batch_size, batch_timeout_ms):
+        batch = []
+        batch_started_at = None
+        timeout = batch_timeout_ms / 1000
+
+        def flush():
+            nonlocal batch
+            messages, batch = batch, []
+            callback_fn(messages=messages)
+            self.check_shutdown()
+
+        # yields (None, None, None) whenever nothing arrived for the timeout
+        for method, properties, body in self.__rmq_channel.consume(
+            queue=self.__queue_name,
+            auto_ack=False,
+            inactivity_timeout=timeout
+        ):
+            if method is not None:
+                if not batch:
+                    batch_started_at = time.monotonic()
+
+                batch.append((
+                    method.routing_key,
+                    decode_body(body, properties.content_encoding, properties.content_type),
+                    method.delivery_tag
+                ))
+
+            idle = method is None
+            if batch and (idle or len(batch) >= batch_size or time.monotonic() - batch_started_at >= timeout):
+                flush()
+
     def consume_all(self):
         routing_key_events = []
 
         while True:
-            method, _, body = self.__rmq_channel.basic_get(
+            method, properties, body = self.__rmq_channel.basic_get(
                 self.__queue_name, True
             )
             if method is None:
                 break
 
             routing_key_events.append(
-                (method.routing_key, decompress(body))
+                (method.routing_key, decode_body(body, properties.content_encoding, properties.content_type))
             )
 
         return routing_key_events
@@ -81,6 +294,12 @@ class RabbitMQConnector(QConnector):
         self.__rmq_conn = pika.BlockingConnection(
             parameters=pika.URLParameters(self.__rabbitmq_url)
         )
+        self.__connection_thread = threading.get_ident()
+
+        self.__blocked = False
+        self.__rmq_conn.add_on_connection_blocked_callback(self.__on_blocked)
+        self.__rmq_conn.add_on_connection_unblocked_callback(self.__on_unblocked)
+
         self.__rmq_channel = self.__rmq_conn.channel()
 
         # Set QoS prefetch count
@@ -92,6 +311,9 @@ class RabbitMQConnector(QConnector):
             durable=True
         )
 
+        if self.__confirms is not None:
+            self.__enable_confirms()
+
         # if messages are to be consumed from the connection
         if self.__queue_name and self.__binding_keys:
             res = self.__rmq_channel.queue_declare(
@@ -114,10 +336,24 @@ class RabbitMQConnector(QConnector):
                     routing_key=binding_key
                 )
 
-    def acknowledge_message(self, delivery_tag):
-        """Acknowledge a message has been processed successfully"""
-        self.__rmq_channel.basic_ack(delivery_tag=delivery_tag)
+    def __on_connection_thread(self, fn, **kwargs):
+        """
+        Channels may only be used by the thread that opened the connection, calls from any other
+        thread, e.g. consumer workers, are handed over to it.
+        """
+        if self.__connection_thread is None or threading.get_ident() == self.__connection_thread:
+            fn(**kwargs)
+        else:
+            self.__rmq_conn.add_callback_threadsafe(functools.partial(fn, **kwargs))
+
+    def acknowledge_message(self, delivery_tag, multiple=False):
+        """
+        Acknowledge a message has been processed successfully, safe to call from any thread.
+
+        :param multiple: Acknowledge every outstanding message up to and including delivery_tag.
+        """
+        self.__on_connection_thread(self.__rmq_channel.basic_ack, delivery_tag=delivery_tag, multiple=multiple)
 
     def reject_message(self, delivery_tag, requeue=False):
-        """Reject a message that couldn't be processed"""
-        self.__rmq_channel.basic_reject(delivery_tag=delivery_tag, requeue=requeue)
+        """Reject a message that couldn't be processed, safe to call from any thread"""
+        self.__on_connection_thread(self.__rmq_channel.basic_reject, delivery_tag=delivery_tag, requeue=requeue)
@@ -0,0 +1,108 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from common.compression import decompress_bytes
+
+
+JSON = 'json'
+ORJSON = 'orjson'
+MSGPACK = 'msgpack'
+
+SERIALIZERS = (JSON, ORJSON, MSGPACK)
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+
+CONTENT_TYPES = {
+    JSON: JSON_CONTENT_TYPE,
+    ORJSON: JSON_CONTENT_TYPE,
+    MSGPACK: MSGPACK_CONTENT_TYPE
+}
+
+# Messages published without a content_type were always JSON
+DEFAULT_CONTENT_TYPE = JSON_CONTENT_TYPE
+
+
+def dumps(obj, serializer=JSON) -> bytes:
+    if serializer == JSON:
+        return json.dumps(obj).encode('utf-8')
+
+    if serializer == ORJSON:
+        if orjson is None:
+            raise ValueError('orjson serialization requires the orjson package')
+        return orjson.dumps(obj)  # pylint: disable=no-member
+
+    if serializer == MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack serialization requires the msgpack package')
+        return msgpack.packb(obj, use_bin_type=True)
+
+    raise ValueError(f'Unknown serializer: {serializer}')
+
+
+def is_json(content_type) -> bool:
+    return (content_type or DEFAULT_CONTENT_TYPE) == JSON_CONTENT_TYPE
+
+
+def loads(data, content_type=None):
+    """
+    Parse a payload of the given content type, JSON is parsed with orjson when it is installed.
+    A content type with a serializer suffix, e.g. application/vnd.pgevents.compact+msgpack, is
+    parsed with that serializer.
+    """
+    _, _, suffix = (content_type or '').partition('+')
+    content_type = CONTENT_TYPES.get(suffix, content_type)
+
+    if is_json(content_type):
+        return orjson.loads(data) if orjson is not None else json.loads(data)  # pylint: disable=no-member
+
+    if content_type == MSGPACK_CONTENT_TYPE:
+        if msgpack is None:
+            raise ValueError('msgpack deserialization requires the msgpack package')
+        return msgpack.unpackb(data, raw=False)
+
+    raise ValueError(f'Unknown content type: {content_type}')
+
+
+def decode_body(body, content_encoding=None, content_type=None):
+    """
+    Decompress a message body. JSON is handed on as a string the way it always was, any other
+    content type is deserialized here already since it can't be passed around as text.
+    """
+    data = decompress_bytes(body, content_encoding)
+
+    if is_json(content_type):
+        return data.decode()
+
+    return loads(data, content_type)
+
+
+class Serializer:
+    """
+    Turns events into message bodies with a configured serializer, the content type tells
+    consumers how to parse them. Only holds the name of the serializer, so it can be handed
+    to encoding workers.
+    """
+
+    def __init__(self, serializer=JSON):
+        if serializer not in SERIALIZERS:
+            raise ValueError(f'Unknown serializer: {serializer}')
+        if serializer == ORJSON and orjson is None:
+            raise ValueError('orjson serialization requires the orjson package')
+        if serializer == MSGPACK and msgpack is None:
+            raise ValueError('msgpack serialization requires the msgpack package')
+
+        self.name = serializer
+        self.content_type = CONTENT_TYPES[serializer]
+
+    def dumps(self, obj) -> bytes:
+        return dumps(obj, self.name)
@@ -1,3 +1,5 @@
+import json
+import zlib
 from typing import Union, List, Dict, Any
 from datetime import datetime, timezone
 
@@ -12,3 +14,7 @@ class DeserializerUtils:
 
 def get_utc_now() -> datetime:
     return datetime.now(timezone.utc)
+
+def key_hash_bucket(key: Any, buckets: int) -> int:
+    """Bucket of an event id, stable across processes so every event of a row lands in the same one"""
+    return zlib.crc32(json.dumps(key, sort_keys=True, default=str).encode('utf-8')) % buckets
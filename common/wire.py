@@ -0,0 +1,149 @@
+import json
+import zlib
+from typing import Any, Dict, List, Union
+
+from common.serialization import Serializer
+
+
+ENVELOPE = 'envelope'
+COMPACT = 'compact'
+
+WIRE_FORMATS = (ENVELOPE, COMPACT)
+
+COMPACT_CONTENT_TYPE = 'application/vnd.pgevents.compact'
+
+SCHEMA_MESSAGE = 's'
+EVENT_MESSAGE = 'e'
+
+# keys of an event that have a position of their own in a compact event
+EVENT_KEYS = ('table_name', 'action', 'id', 'old', 'new', 'diff', 'recorded_at')
+
+
+class UnknownSchemaError(ValueError):
+    pass
+
+
+def compact_content_type(serializer: Serializer) -> str:
+    """Content type of compact messages, the serializer of the arrays is its suffix"""
+    return f'{COMPACT_CONTENT_TYPE}+{serializer.name}'
+
+
+def schema_id(table_name: str, columns: List[str]) -> int:
+    """Stable id of a column layout, the same layout gets the same id after a restart"""
+    return zlib.crc32(json.dumps([table_name, columns]).encode('utf-8'))
+
+
+def bitmap(columns: List[str], present) -> str:
+    """Bitmap over the columns, as hex so it fits every serializer however many columns there are"""
+    bits = 0
+    for position, column in enumerate(columns):
+        if column in present:
+            bits |= 1 << position
+
+    return format(bits, 'x')
+
+
+def bitmap_columns(columns: List[str], bits: str) -> List[str]:
+    bits = int(bits, 16)
+    return [column for position, column in enumerate(columns) if bits >> position & 1]
+
+
+class CompactTemplate:
+    """
+    Serializes the events of one relation as arrays referencing its column layout, with
+    positional values instead of column names. Consumers rebuild the events with a
+    SchemaRegistry from the schema message published for the layout.
+
+    An event is ['e', schema_id, action, id, old, new, diff, recorded_at, extra], old and new
+    are a bitmap of the columns they hold and the values of those columns, diff is a bitmap
+    over the columns of new, or a tuple like old when new is left out, and extra holds any
+    further keys of the event. Sections left out of the event are None.
+    """
+
+    def __init__(self, serializer: Serializer, table_name: str, columns: List[str]):
+        self.serializer = serializer
+        self.table_name = table_name
+        self.columns = columns
+        self.schema_id = schema_id(table_name, columns)
+
+        self.__positions = {column: position for position, column in enumerate(columns)}
+
+    def schema_message(self) -> bytes:
+        return self.serializer.dumps([SCHEMA_MESSAGE, self.schema_id, self.table_name, self.columns])
+
+    def __tuple(self, values: Union[Dict[str, Any], None]):
+        if values is None:
+            return None
+
+        return [bitmap(self.columns, values), [values[column] for column in self.columns if column in values]]
+
+    def dumps(self, event: dict) -> bytes:
+        """Serialize an event, events that don't fit the layout are serialized as they are"""
+        if event.get('table_name') != self.table_name:
+            return self.serializer.dumps(event)
+
+        for key in ('old', 'new', 'diff'):
+            if any(column not in self.__positions for column in event.get(key) or ()):
+                return self.serializer.dumps(event)
+
+        new, diff = event.get('new'), event.get('diff')
+        if diff is not None and new is not None:
+            diff = bitmap(self.columns, diff)
+        else:
+            diff = self.__tuple(diff)
+
+        extra = {key: value for key, value in event.items() if key not in EVENT_KEYS}
+        return self.serializer.dumps([
+            EVENT_MESSAGE, self.schema_id, event.get('action'), event.get('id'),
+            self.__tuple(event.get('old')), self.__tuple(new), diff, event.get('recorded_at'), extra or None
+        ])
+
+
+class SchemaRegistry:
+    """Column layouts of the compact messages received so far, rebuilds their events as dicts"""
+
+    def __init__(self):
+        self.__schemas: Dict[int, tuple] = {}
+
+    def __len__(self):
+        return len(self.__schemas)
+
+    def register(self, schema: int, table_name: str, columns: List[str]) -> None:
+        self.__schemas[schema] = (table_name, columns)
+
+    @staticmethod
+    def __tuple(columns, values):
+        return dict(zip(bitmap_columns(columns, values[0]), values[1]))
+
+    def decode(self, message: Union[list, dict]) -> Union[dict, None]:
+        """
+        :return: The event of a compact event message, None for schema messages which are registered.
+        """
+        if isinstance(message, dict):
+            return message
+
+        if message[0] == SCHEMA_MESSAGE:
+            _, schema, table_name, columns = message
+            self.register(schema, table_name, columns)
+            return None
+
+        _, schema, action, event_id, old, new, diff, recorded_at, extra = message
+        if schema not in self.__schemas:
+            raise UnknownSchemaError(f'Unknown schema id: {schema}')
+
+        table_name, columns = self.__schemas[schema]
+        event = {'table_name': table_name}
+        if new is not None:
+            event['new'] = new = self.__tuple(columns, new)
+        event['id'] = event_id
+        if old is not None:
+            event['old'] = self.__tuple(columns, old)
+        if isinstance(diff, str):
+            event['diff'] = {column: new[column] for column in bitmap_columns(columns, diff)}
+        elif diff is not None:
+            event['diff'] = self.__tuple(columns, diff)
+        event['action'] = action
+        event['recorded_at'] = recorded_at
+        event.update(extra or {})
+
+        return event
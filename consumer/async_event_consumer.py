@@ -0,0 +1,54 @@
+from typing import List
+
+from common import log
+from common.event import BaseEvent
+from consumer.event_consumer import EventConsumer
+
+
+logger = log.get_logger(__name__)
+
+
+class AsyncEventConsumer(EventConsumer):
+    """
+    EventConsumer running on an asyncio event loop, meant to be used with AsyncRabbitMQConnector.
+
+    Events are handed to the coroutines process_message_async and process_transaction_async.
+    Every delivered message is processed in its own task, so up to prefetch_count messages are
+    processed concurrently. Await connect_async() and start_consuming_async() instead of calling
+    connect() and start_consuming().
+    """
+
+    async def process_message_async(self, routing_key, event: BaseEvent, delivery_tag: int):
+        logger.info('routing_key %s', routing_key)
+        logger.info('event %s', event)
+        logger.info('event %s', event.to_dict())
+
+    async def process_transaction_async(self, routing_key, transaction: dict, events: List[BaseEvent], delivery_tag: int):
+        for event in events:
+            await self.process_message_async(routing_key, event, delivery_tag)
+
+    def connect(self):
+        raise TypeError('AsyncEventConsumer connects on the event loop, await connect_async() instead')
+
+    async def connect_async(self):
+        await self.qconnector.connect()
+
+    def start_consuming(self):
+        raise TypeError('AsyncEventConsumer consumes on the event loop, await start_consuming_async() instead')
+
+    async def start_consuming_async(self):
+        async def stream_consumer(routing_key, payload, properties=None, delivery_tag=None):
+            transaction, events = self.load_payload(payload)
+
+            if not events:
+                # schema messages of the compact format are only registered
+                if delivery_tag is not None:
+                    self.qconnector.acknowledge_message(delivery_tag)
+            elif transaction is not None:
+                await self.process_transaction_async(routing_key, transaction, events, delivery_tag)
+            else:
+                await self.process_message_async(routing_key, events[0], delivery_tag)
+
+        await self.qconnector.consume_stream(
+            callback_fn=stream_consumer
+        )
@@ -1,21 +1,48 @@
-import json
 from abc import ABC
-from typing import Type
+from typing import List, Tuple, Type, Union
 
 from common.event import BaseEvent
 from common.qconnector import QConnector
+from common.serialization import loads
+from common.wire import SchemaRegistry
 from common import log
+from consumer.worker_pool import WorkerPool
 
 
 logger = log.get_logger(__name__)
 
+# Events with the same ordering key are processed one after the other by the same worker
+ORDERING_KEYS = ('table_name', 'id')
+
 
 class EventConsumer(ABC):
 
-    def __init__(self, *, qconnector_cls, event_cls, **kwargs):
+    def __init__(self, *, qconnector_cls, event_cls, workers=1, ordering_key=None, batch_size=1,
+                 batch_timeout_ms=1000, **kwargs):
         self.__shutdown = False
         self.event_cls = event_cls
 
+        if ordering_key is not None and ordering_key not in ORDERING_KEYS:
+            raise ValueError(f'Unknown ordering key: {ordering_key}, expected one of {", ".join(ORDERING_KEYS)}')
+
+        # process_message runs on a pool of threads, every worker needs a prefetched message to work on
+        self.__ordering_key = ordering_key
+        self.__pool = None
+        if workers > 1:
+            kwargs.setdefault('prefetch_count', workers)
+            self.__pool = WorkerPool(workers=workers, ordered=ordering_key is not None)
+
+        # events are handed to process_batch, a batch can only fill up as far as the prefetch allows
+        self.__batch_size = batch_size
+        self.__batch_timeout_ms = batch_timeout_ms
+        if batch_size > 1:
+            if self.__pool is not None:
+                raise ValueError('Batch consumption can not be combined with concurrent workers')
+            kwargs.setdefault('prefetch_count', batch_size)
+
+        # column layouts of compact messages, learned from the schema messages of the producer
+        self.__schemas = SchemaRegistry()
+
         self.qconnector_cls: Type[QConnector] = qconnector_cls
         self.qconnector: QConnector = qconnector_cls(**kwargs)
 
@@ -24,17 +51,149 @@ class EventConsumer(ABC):
         logger.info('event %s' % event)
         logger.info('event %s' % event.to_dict())
 
+    def process_batch(self, events: List[BaseEvent]) -> Union[List[BaseEvent], None]:
+        """
+        Called with a batch of events when consuming in batches. The messages of the batch are
+        acknowledged together once it returns.
+
+        :return: The events that could not be processed, their messages are rejected, None if all succeeded.
+        """
+        logger.info('batch of %s events', len(events))
+        for event in events:
+            logger.info('event %s', event.to_dict())
+
+    def process_transaction(self, routing_key, transaction: dict, events: List[BaseEvent], delivery_tag: int):
+        """
+        Called for envelopes holding all events of a table written by one transaction.
+        Processes the events one by one unless overridden.
+
+        :param transaction: xid, commit_lsn and commit_ts of the transaction.
+        """
+        for event in events:
+            self.process_message(routing_key, event, delivery_tag)
+
     def connect(self):
         self.qconnector.connect()
 
-    def start_consuming(self):
-        def stream_consumer(routing_key, payload, properties=None, delivery_tag=None):
-            payload_dict = json.loads(payload)
+    def load_payload(self, payload) -> Tuple[Union[dict, None], List[BaseEvent]]:
+        """
+        Build the events held by a message.
+
+        :return: The transaction and its events for transaction envelopes, None and the single event otherwise.
+            Schema messages of the compact format hold no events.
+        """
+        if isinstance(payload, list):
+            payload = self.__schemas.decode(payload)
+            if payload is None:
+                return None, []
+
+        payload_dict = payload if isinstance(payload, dict) else loads(payload)
+
+        event_dicts = payload_dict.pop('events') if 'events' in payload_dict else None
+        if event_dicts is None:
+            event_dicts, payload_dict = [payload_dict], None
+        else:
+            payload_dict.pop('table_name', None)
 
+        events = []
+        for event_dict in event_dicts:
             event: BaseEvent = self.event_cls()
-            event.from_dict(payload_dict)
+            event.from_dict(event_dict)
+            events.append(event)
+
+        return payload_dict, events
+
+    def __process_payload(self, routing_key, payload, delivery_tag):
+        transaction, events = self.load_payload(payload)
+
+        if not events:
+            if delivery_tag is not None:
+                self.qconnector.acknowledge_message(delivery_tag)
+        elif transaction is not None:
+            self.process_transaction(routing_key, transaction, events, delivery_tag)
+        else:
+            self.process_message(routing_key, events[0], delivery_tag)
+
+    def __process_concurrently(self, routing_key, payload, delivery_tag):
+        """Runs on a worker thread, a message that fails there is rejected instead of stopping the consumer"""
+        try:
+            self.__process_payload(routing_key, payload, delivery_tag)
+        except Exception as e:
+            logger.error('Error processing message with routing_key %s: %s', routing_key, e, exc_info=True)
+            if delivery_tag is not None:
+                self.qconnector.reject_message(delivery_tag, requeue=False)
+
+    def __ordering_key_of(self, routing_key, payload):
+        """
+        Events are routed by table, so the routing key stands in for the table name. Ordering
+        by id needs the payload to be parsed here already, it is handed to the worker parsed.
+        """
+        if self.__ordering_key == 'table_name':
+            return routing_key, payload
+
+        payload_dict = payload if isinstance(payload, dict) else loads(payload)
+        return (routing_key, str(payload_dict.get('id'))), payload_dict
+
+    def __process_messages(self, messages):
+        """
+        Hand a batch to process_batch, reject the messages of failed events and acknowledge the
+        rest with a single multiple ack. A batch that raises is rejected as a whole instead of
+        stopping the consumer.
+        """
+        events = []
+        delivery_tags = []
+        try:
+            for _, payload, delivery_tag in messages:
+                _, message_events = self.load_payload(payload)
+                events.extend(message_events)
+                delivery_tags.extend([delivery_tag] * len(message_events))
+
+            failed = (self.process_batch(events) if events else None) or []
+        except Exception as e:
+            logger.error('Error processing batch of %s messages: %s', len(messages), e, exc_info=True)
+            for _, _, delivery_tag in messages:
+                self.qconnector.reject_message(delivery_tag, requeue=False)
+            return
+
+        failed_ids = {id(event) for event in failed}
+        failed_tags = {tag for event, tag in zip(events, delivery_tags) if id(event) in failed_ids}
+
+        # rejected messages are settled, so the multiple ack below leaves them alone
+        for delivery_tag in sorted(failed_tags):
+            self.qconnector.reject_message(delivery_tag, requeue=False)
+
+        succeeded_tags = [tag for _, _, tag in messages if tag not in failed_tags]
+        if succeeded_tags:
+            self.qconnector.acknowledge_message(max(succeeded_tags), multiple=True)
 
-            self.process_message(routing_key, event, delivery_tag)
+    def start_consuming(self):
+        if self.__batch_size > 1:
+            self.qconnector.consume_batches(
+                callback_fn=self.__process_messages,
+                batch_size=self.__batch_size,
+                batch_timeout_ms=self.__batch_timeout_ms
+            )
+            return
+
+        def stream_consumer(routing_key, payload, properties=None, delivery_tag=None):
+            # compact messages are expanded in the order they arrive, before schema messages are
+            # acknowledged or events are handed to a worker
+            if isinstance(payload, list):
+                payload = self.__schemas.decode(payload)
+                if payload is None:
+                    if delivery_tag is not None:
+                        self.qconnector.acknowledge_message(delivery_tag)
+                    self.check_shutdown()
+                    return
+
+            if self.__pool is None:
+                self.__process_payload(routing_key, payload, delivery_tag)
+            else:
+                key = None
+                if self.__ordering_key is not None:
+                    key, payload = self.__ordering_key_of(routing_key, payload)
+
+                self.__pool.submit(key, self.__process_concurrently, routing_key, payload, delivery_tag)
 
             self.check_shutdown()
 
@@ -44,6 +203,8 @@ class EventConsumer(ABC):
 
     def shutdown(self):
         self.__shutdown = True
+        if self.__pool is not None:
+            self.__pool.shutdown(wait=False)
         self.qconnector.shutdown()
 
     def check_shutdown(self):
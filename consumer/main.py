@@ -15,14 +15,26 @@ logger = log.get_logger(__name__)
 @click.option('--rabbitmq-exchange', default=lambda: os.environ.get('RABBITMQ_EXCHANGE', None), required=True, help='RabbitMQ exchange ($RABBITMQ_EXCHANGE)')
 @click.option('--binding-keys', default=lambda: os.environ.get('RABBITMQ_BINDING_KEYS', '#'), required=True, help='RabbitMQ binding keys ($RABBITMQ_BINDING_KEYS, "#")')
 @click.option('--queue-name', default=lambda: os.environ.get('RABBITMQ_QUEUE_NAME', ''), required=True, help='RabbitMQ queue name ($RABBITMQ_QUEUE_NAME, "")')
-def consume(rabbitmq_url, rabbitmq_exchange, binding_keys, queue_name):
+@click.option('--prefetch-count', default=lambda: os.environ.get('RABBITMQ_PREFETCH_COUNT', None), required=False, type=int, help='Unacknowledged messages the broker may send ahead ($RABBITMQ_PREFETCH_COUNT, number of workers)')
+@click.option('--workers', default=lambda: os.environ.get('CONSUMER_WORKERS', 1), required=False, type=int, help='Threads processing messages concurrently ($CONSUMER_WORKERS, 1)')
+@click.option('--ordering-key', default=lambda: os.environ.get('CONSUMER_ORDERING_KEY', None), required=False, type=click.Choice(['table_name', 'id']), help='Process events with the same key in order with concurrent workers ($CONSUMER_ORDERING_KEY)')
+@click.option('--batch-size', default=lambda: os.environ.get('CONSUMER_BATCH_SIZE', 1), required=False, type=int, help='Hand events to process_batch in batches of up to this size ($CONSUMER_BATCH_SIZE, 1)')
+@click.option('--batch-timeout-ms', default=lambda: os.environ.get('CONSUMER_BATCH_TIMEOUT_MS', 1000), required=False, type=int, help='Max time a batch waits to fill up ($CONSUMER_BATCH_TIMEOUT_MS, 1000)')
+def consume(rabbitmq_url, rabbitmq_exchange, binding_keys, queue_name, prefetch_count, workers, ordering_key, batch_size, batch_timeout_ms):
+    kwargs = {'prefetch_count': prefetch_count} if prefetch_count else {}
+
     event_logger = EventConsumer(
         qconnector_cls=RabbitMQConnector,
         event_cls=BaseEvent,
         rabbitmq_url=rabbitmq_url,
         rabbitmq_exchange=rabbitmq_exchange,
         queue_name=queue_name,
-        binding_keys=binding_keys
+        binding_keys=binding_keys,
+        workers=workers,
+        ordering_key=ordering_key,
+        batch_size=batch_size,
+        batch_timeout_ms=batch_timeout_ms,
+        **kwargs
     )
 
     def signal_handler(signum, frame):
@@ -0,0 +1,31 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable, List, Union
+
+
+class WorkerPool:
+    """
+    Runs message handlers on a pool of threads.
+
+    Unordered, any idle worker picks up the next message. Ordered, every key is always handled
+    by the same single threaded worker, so messages with the same key are processed one after
+    the other in the order they were received while different keys still run concurrently.
+    """
+
+    def __init__(self, workers: int, ordered: bool = False):
+        self.workers = workers
+        self.ordered = ordered
+
+        if ordered:
+            self.__executors: List[ThreadPoolExecutor] = [
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'worker-{i}') for i in range(workers)
+            ]
+        else:
+            self.__executors = [ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')]
+
+    def submit(self, key: Union[Hashable, None], fn: Callable, *args) -> Future:
+        executor = self.__executors[hash(key) % len(self.__executors)] if self.ordered else self.__executors[0]
+        return executor.submit(fn, *args)
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in self.__executors:
+            executor.shutdown(wait=wait)
@@ -2,10 +2,14 @@ from .delete import DeleteMessage
 from .insert import InsertMessage
 from .update import UpdateMessage
 from .relation import RelationMessage
+from .decoder import BytesIODecoder, MemoryViewDecoder, get_decoder
 
 __all__ = [
     'DeleteMessage',
     'InsertMessage',
     'UpdateMessage',
-    'RelationMessage'
+    'RelationMessage',
+    'BytesIODecoder',
+    'MemoryViewDecoder',
+    'get_decoder'
 ]
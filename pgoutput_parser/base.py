@@ -1,25 +1,48 @@
 import io
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from common.utils import DeserializerUtils, get_utc_now
 from common.log import get_logger
 
+from .plan import COLUMN_SKIP, ID_COLUMN, DecodePlan, project_value
+from .types import binary_to_hex
+
 
 logger = get_logger(__name__)
 
 
+class _Unchanged:
+    """Value of an unchanged TOASTed column, postgres does not send it again on updates"""
+
+    def __repr__(self):
+        return 'UNCHANGED'
+
+    def __reduce__(self):
+        return 'UNCHANGED'
+
+
+UNCHANGED = _Unchanged()
+
+# column flag of relation messages, set for the columns of the replica identity key
+KEY_FLAG = 1
+
+REPLICA_IDENTITY_FULL = 'f'
+
+
 class BaseMessage:
     """Base class for decoding PostgreSQL logical replication messages."""
 
-    def __init__(self, table_name: str, message: bytes, schema: dict) -> None:
+    def __init__(self, table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> None:
         """
         Initialize the BaseMessage instance.
 
         :param table_name: The name of the table being replicated.
         :param message: The raw message payload from the replication stream.
+        :param plan: The decode plan of the relation, if any.
         """
         self.message = message
         self.table_name = table_name
+        self.plan = plan
         self.buffer = io.BytesIO(message)
         self.message_type = self.read_utf_8(length=1)
         self.relation_id = self.read_int32()
@@ -66,6 +89,52 @@ class BaseMessage:
                 diff[key] = new_tuple_values[key]
         return diff
 
+    @staticmethod
+    def event_id(schema: dict, *tuples: Dict[str, Any]) -> Any:
+        """
+        Id of the row of an event, the value of its key column or the list of values of a
+        composite key, from the first tuple that has it. The key comes from the replica identity
+        of the relation. With REPLICA IDENTITY FULL every column is flagged, the id column is used then.
+        """
+        key_columns = schema.get('key_columns') if schema.get('replica_identity') != REPLICA_IDENTITY_FULL else None
+
+        for values in tuples:
+            if not key_columns:
+                key = values.get(ID_COLUMN)
+            elif len(key_columns) == 1:
+                key = values.get(key_columns[0])
+            else:
+                key = [values.get(column) for column in key_columns]
+                if all(value is None for value in key):
+                    key = None
+
+            if key is not None:
+                return key
+
+        return None
+
+    @staticmethod
+    def resolve_unchanged(old_tuple_values: Dict[str, Any], new_tuple_values: Dict[str, Any]) -> List[str]:
+        """
+        Take unchanged TOASTed columns out of the tuples, so they are not reported as changed.
+        Their value is kept when the old tuple has it.
+
+        :return: The names of the unchanged columns.
+        """
+        unchanged = [key for key, value in new_tuple_values.items() if value is UNCHANGED]
+
+        for key in unchanged:
+            old_value = old_tuple_values.get(key, UNCHANGED)
+            if old_value is UNCHANGED:
+                del new_tuple_values[key]
+            else:
+                new_tuple_values[key] = old_value
+
+        for key in [key for key, value in old_tuple_values.items() if value is UNCHANGED]:
+            del old_tuple_values[key]
+
+        return unchanged
+
     def decode_tuple(self) -> dict:
         """
         Decode a tuple from the message.
@@ -76,21 +145,44 @@ class BaseMessage:
 
         data = {}
         columns = self.schema['columns']
+        converters = self.plan.converters if self.plan else None
+        binary_converters = self.plan.binary_converters if self.plan else None
+        actions = self.plan.actions if self.plan else None
 
         for i in range(n_columns):
             col_type = self.read_utf_8(length=1)
 
-            if col_type == 'n':
+            if actions and actions[i]:
+                self.project_column(data, columns[i]['name'], col_type, actions[i])
+            elif col_type == 'n':
                 data[columns[i]['name']] = None
             elif col_type == 'u':
-                data[columns[i]['name']] = None
+                data[columns[i]['name']] = UNCHANGED
             elif col_type == 't':
                 length = self.read_int32()
                 value = self.read_utf_8(length=length)
+                if converters and converters[i]:
+                    value = converters[i](value)
                 data[columns[i]['name']] = value
+            elif col_type == 'b':
+                length = self.read_int32()
+                value = self.buffer.read(length)
+                converter = binary_converters[i] if binary_converters else binary_to_hex
+                data[columns[i]['name']] = converter(value)
 
         return data
 
+    def project_column(self, data: dict, name: str, col_type: str, action: int) -> None:
+        """Step over the value of a skipped column, or replace the value of a redacted or hashed one."""
+        if col_type in ('t', 'b'):
+            length = self.read_int32()
+            if action == COLUMN_SKIP:
+                self.buffer.seek(length, io.SEEK_CUR)
+            else:
+                data[name] = project_value(action, self.buffer.read(length))
+        elif action != COLUMN_SKIP:
+            data[name] = UNCHANGED if col_type == 'u' else None
+
     def decode_insert_message(self):
         """Placeholder for decoding insert messages. Should be overridden by subclass."""
         raise NotImplementedError('This method should be overridden by subclass')
@@ -0,0 +1,252 @@
+import struct
+from typing import Any, Dict, Tuple
+
+from common.utils import get_utc_now
+from common.log import get_logger
+
+from .base import KEY_FLAG, UNCHANGED, BaseMessage
+from .delete import DeleteMessage
+from .insert import InsertMessage
+from .plan import COLUMN_SKIP, DecodePlan, project_value
+from .relation import RelationMessage
+from .types import binary_to_hex
+from .update import UpdateMessage
+
+
+logger = get_logger(__name__)
+
+INT16 = struct.Struct('>h')
+INT32 = struct.Struct('>i')
+# flags (int8) + column name are read separately, type id + type modifier in one go
+TYPE_ID_AND_MODIFIER = struct.Struct('>ii')
+
+TUPLE_TEXT = ord('t')
+TUPLE_BINARY = ord('b')
+TUPLE_NULL = ord('n')
+TUPLE_UNCHANGED = ord('u')
+
+NO_COLUMN_SETTINGS = ()
+
+
+class BytesIODecoder:
+    """Decoder engine backed by the io.BytesIO based message classes."""
+
+    name = 'bytesio'
+
+    @staticmethod
+    def decode_relation_message(message: bytes) -> dict:
+        return RelationMessage(table_name=None, message=message, schema=None).decode_relation_message()
+
+    @staticmethod
+    def decode_insert_message(table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        return InsertMessage(table_name=table_name, message=message, schema=schema, plan=plan).decode_insert_message()
+
+    @staticmethod
+    def decode_update_message(table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        return UpdateMessage(table_name=table_name, message=message, schema=schema, plan=plan).decode_update_message()
+
+    @staticmethod
+    def decode_delete_message(table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        return DeleteMessage(table_name=table_name, message=message, schema=schema, plan=plan).decode_delete_message()
+
+
+class MemoryViewDecoder:
+    """
+    Decoder engine that reads a message through a single memoryview.
+
+    Integers are read with precompiled struct unpackers and null-terminated strings are located
+    with bytes.find, so no intermediate buffers are built. The decoded output is identical to
+    the one produced by BytesIODecoder.
+    """
+
+    name = 'memoryview'
+
+    @staticmethod
+    def read_string(message: bytes, view: memoryview, offset: int) -> Tuple[str, int]:
+        """Read a null-terminated string starting at offset, return it with the offset past the terminator."""
+        end = message.find(b'\x00', offset)
+        return str(view[offset:end], 'utf-8'), end + 1
+
+    @staticmethod
+    def decode_tuple(view: memoryview, offset: int, schema: dict, plan: DecodePlan = None) -> Tuple[Dict[str, Any], int]:
+        """
+        Decode a tuple starting at offset.
+
+        :return: The decoded data and the offset of the first byte after the tuple.
+        """
+        n_columns, = INT16.unpack_from(view, offset)
+        offset += 2
+
+        data = {}
+        columns = schema['columns']
+        # settings the plan leaves out are empty, so the per column lookups need no None checks
+        converters = (plan.converters if plan else None) or NO_COLUMN_SETTINGS
+        binary_converters = (plan.binary_converters if plan else None) or NO_COLUMN_SETTINGS
+        actions = (plan.actions if plan else None) or NO_COLUMN_SETTINGS
+
+        for i in range(n_columns):
+            col_type = view[offset]
+            offset += 1
+
+            if actions and actions[i]:
+                if col_type in (TUPLE_TEXT, TUPLE_BINARY):
+                    length, = INT32.unpack_from(view, offset)
+                    offset += 4
+                    if actions[i] != COLUMN_SKIP:
+                        data[columns[i]['name']] = project_value(actions[i], view[offset:offset + length])
+                    offset += length
+                elif actions[i] != COLUMN_SKIP:
+                    data[columns[i]['name']] = UNCHANGED if col_type == TUPLE_UNCHANGED else None
+            elif col_type == TUPLE_TEXT:
+                length, = INT32.unpack_from(view, offset)
+                offset += 4
+                value = str(view[offset:offset + length], 'utf-8')
+                if converters and converters[i]:
+                    value = converters[i](value)
+                data[columns[i]['name']] = value
+                offset += length
+            elif col_type == TUPLE_BINARY:
+                length, = INT32.unpack_from(view, offset)
+                offset += 4
+                converter = binary_converters[i] if binary_converters else binary_to_hex
+                data[columns[i]['name']] = converter(view[offset:offset + length])
+                offset += length
+            elif col_type == TUPLE_NULL:
+                data[columns[i]['name']] = None
+            elif col_type == TUPLE_UNCHANGED:
+                data[columns[i]['name']] = UNCHANGED
+
+        return data, offset
+
+    @classmethod
+    def decode_relation_message(cls, message: bytes) -> dict:
+        view = memoryview(message)
+
+        if view[0] != ord('R'):
+            return None
+
+        relation_id, = INT32.unpack_from(view, 1)
+
+        schema, offset = cls.read_string(message, view, 5)
+        table_name, offset = cls.read_string(message, view, offset)
+
+        replica_identity = chr(view[offset])
+        offset += 1
+
+        n_columns, = INT16.unpack_from(view, offset)
+        offset += 2
+
+        columns = []
+        key_columns = []
+        for _ in range(n_columns):
+            flags = view[offset]
+            offset += 1
+
+            column_name, offset = cls.read_string(message, view, offset)
+            if flags & KEY_FLAG:
+                key_columns.append(column_name)
+
+            type_id, _ = TYPE_ID_AND_MODIFIER.unpack_from(view, offset)
+            offset += TYPE_ID_AND_MODIFIER.size
+
+            columns.append({'name': column_name, 'type_id': type_id})
+
+        return {
+            'relation_id': relation_id,
+            'table_name': f'{schema}.{table_name}',
+            'columns': columns,
+            'replica_identity': replica_identity,
+            'key_columns': key_columns
+        }
+
+    @classmethod
+    def decode_insert_message(cls, table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        view = memoryview(message)
+
+        if view[0] != ord('I'):
+            return None
+
+        recorded_at = get_utc_now()
+
+        # message type, relation id and the 'N' marker
+        new_tuple_values, _ = cls.decode_tuple(view, 6, schema, plan)
+
+        return {
+            'table_name': table_name,
+            'new': new_tuple_values,
+            'id': BaseMessage.event_id(schema, new_tuple_values),
+            'old': {},
+            'diff': BaseMessage.calculate_diff({}, new_tuple_values),
+            'action': 'I',
+            'recorded_at': recorded_at.isoformat()
+        }
+
+    @classmethod
+    def decode_update_message(cls, table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        view = memoryview(message)
+
+        if view[0] != ord('U'):
+            return None
+
+        recorded_at = get_utc_now()
+
+        # Without an 'O' or 'K' tuple there is nothing to diff against, same as UpdateMessage
+        if view[5] == ord('N'):
+            return None
+
+        old_tuple_values, offset = cls.decode_tuple(view, 6, schema, plan)
+        new_tuple_values, _ = cls.decode_tuple(view, offset + 1, schema, plan)
+        unchanged = BaseMessage.resolve_unchanged(old_tuple_values, new_tuple_values)
+
+        diff = BaseMessage.calculate_diff(old_tuple_values, new_tuple_values)
+        if not diff or not new_tuple_values:
+            return None
+
+        message = {
+            'table_name': table_name,
+            'id': BaseMessage.event_id(schema, new_tuple_values, old_tuple_values),
+            'old': old_tuple_values,
+            'new': new_tuple_values,
+            'diff': diff,
+            'action': 'U',
+            'recorded_at': recorded_at.isoformat()
+        }
+        if unchanged:
+            message['unchanged'] = unchanged
+
+        return message
+
+    @classmethod
+    def decode_delete_message(cls, table_name: str, message: bytes, schema: dict, plan: DecodePlan = None) -> dict:
+        view = memoryview(message)
+
+        if view[0] != ord('D'):
+            return None
+
+        recorded_at = get_utc_now()
+
+        old_tuple_values, _ = cls.decode_tuple(view, 6, schema, plan)
+
+        return {
+            'table_name': table_name,
+            'action': 'D',
+            'old': old_tuple_values,
+            'id': BaseMessage.event_id(schema, old_tuple_values),
+            'new': {},
+            'diff': {},
+            'recorded_at': recorded_at.isoformat()
+        }
+
+
+DECODERS = {
+    BytesIODecoder.name: BytesIODecoder,
+    MemoryViewDecoder.name: MemoryViewDecoder
+}
+
+
+def get_decoder(name: str):
+    """Return the decoder engine registered under name."""
+    try:
+        return DECODERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown pgoutput decoder: {name}, expected one of {", ".join(DECODERS)}') from None
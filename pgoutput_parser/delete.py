@@ -25,7 +25,7 @@ class DeleteMessage(BaseMessage):
                 'table_name': self.table_name,
                 'action': message_type,
                 'old': old_tuple_values,
-                'id': old_tuple_values['id'],
+                'id': self.event_id(self.schema, old_tuple_values),
                 'new': {},
                 'diff': {},
                 'recorded_at': self.recorded_at.isoformat()
@@ -24,7 +24,7 @@ class InsertMessage(BaseMessage):
             return {
                 'table_name': self.table_name,
                 'new': new_tuple_values,
-                'id': new_tuple_values['id'],
+                'id': self.event_id(self.schema, new_tuple_values),
                 'old': {},
                 'diff': self.calculate_diff({}, new_tuple_values),
                 'action': self.message_type,
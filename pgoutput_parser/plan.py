@@ -0,0 +1,114 @@
+import hashlib
+from typing import Callable, Iterable, List, Union
+
+
+# What is done with the value of a column while decoding
+COLUMN_KEEP = 0
+COLUMN_SKIP = 1
+COLUMN_REDACT = 2
+COLUMN_HASH = 3
+
+REDACTED = '[redacted]'
+
+# the event id is read from this column when the relation has no key, it is never skipped
+ID_COLUMN = 'id'
+
+# Sections of the events of a table that are published
+SHAPE_FULL = 'full'
+SHAPE_NEW_DIFF = 'new+diff'
+SHAPE_DIFF_ONLY = 'diff-only'
+SHAPE_KEY_ONLY = 'key-only'
+
+# sections dropped from the events of each shape, the id is always kept
+SHAPE_DROPS = {
+    SHAPE_FULL: (),
+    SHAPE_NEW_DIFF: ('old',),
+    SHAPE_DIFF_ONLY: ('old', 'new'),
+    SHAPE_KEY_ONLY: ('old', 'new', 'diff')
+}
+
+EVENT_SHAPES = tuple(SHAPE_DROPS)
+
+
+def column_actions(columns: List[str], include: Union[Iterable[str], None] = None,
+                   exclude: Union[Iterable[str], None] = None, redact: Union[Iterable[str], None] = None,
+                   hash: Union[Iterable[str], None] = None,  # pylint: disable=redefined-builtin
+                   key_columns: Union[Iterable[str], None] = None) -> Union[List[int], None]:
+    """
+    Compile the projection of a relation into one action per column.
+
+    :param columns: Column names of the relation, in order.
+    :param include: Only these columns are decoded, every column when None.
+    :param exclude: These columns are skipped.
+    :param redact: The values of these columns are replaced by REDACTED.
+    :param hash: The values of these columns are replaced by the sha256 of their raw bytes.
+    :param key_columns: Columns of the key, never skipped as the event id is read from them.
+    :return: None when every column is kept as it is.
+    """
+    include = set(include) if include is not None else None
+    exclude, redact, hash = set(exclude or []), set(redact or []), set(hash or [])
+    keep = {ID_COLUMN, *(key_columns or [])}
+
+    actions = []
+    for name in columns:
+        if name not in keep and ((include is not None and name not in include) or name in exclude):
+            actions.append(COLUMN_SKIP)
+        elif name in hash:
+            actions.append(COLUMN_HASH)
+        elif name in redact:
+            actions.append(COLUMN_REDACT)
+        else:
+            actions.append(COLUMN_KEEP)
+
+    if not any(actions):
+        return None
+
+    return actions
+
+
+def validate_shape(shape: str) -> str:
+    if shape not in SHAPE_DROPS:
+        raise ValueError(f'Unknown event shape: {shape}, expected one of {", ".join(EVENT_SHAPES)}')
+
+    return shape
+
+
+def shape_event(event: dict, shape: str = SHAPE_FULL) -> dict:
+    """Drop the sections of an event its shape doesn't publish, before it is serialized"""
+    for section in SHAPE_DROPS[shape]:
+        event.pop(section, None)
+
+    return event
+
+
+def project_value(action: int, raw) -> str:
+    """Value of a redacted or hashed column, computed from its raw bytes without decoding them"""
+    if action == COLUMN_HASH:
+        return hashlib.sha256(raw).hexdigest()
+
+    return REDACTED
+
+
+class DecodePlan:
+    """
+    Per relation decoding settings. A plan is built once when the relation message arrives
+    and then reused for every tuple of that relation.
+    """
+
+    def __init__(self, converters: Union[List[Callable[[str], object]], None] = None,
+                 binary_converters: Union[List[Callable[[bytes], object]], None] = None, included: bool = True,
+                 actions: Union[List[int], None] = None, shape: str = SHAPE_FULL):
+        # one entry per column, None for columns whose text value is kept as it is
+        self.converters = converters
+
+        # one entry per column, used for values sent in binary format
+        self.binary_converters = binary_converters
+
+        # False when the relation is filtered out, its changes are dropped without being decoded
+        self.included = included
+
+        # one entry per column from column_actions, None when every column is kept
+        self.actions = actions
+
+        # sections of the decoded events that are published
+        self.shape = shape
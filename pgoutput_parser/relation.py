@@ -1,7 +1,7 @@
 from common.log import get_logger
 from common.utils import DeserializerUtils
 
-from pgoutput_parser.base import BaseMessage
+from pgoutput_parser.base import KEY_FLAG, BaseMessage
 
 
 logger = get_logger(__name__)
@@ -24,29 +24,31 @@ class RelationMessage(BaseMessage):
             schema = self.read_string()
             table_name = f'{schema}.{self.read_string()}'
 
-            # replica_identity
-            self.read_int8()
+            replica_identity = chr(self.read_int8())
 
             n_columns = self.read_int16()
 
             columns = []
+            key_columns = []
 
             for _ in range(n_columns):
-                # Flags
-                self.read_int8()
+                flags = self.read_int8()
 
                 column_name = self.read_string()
+                if flags & KEY_FLAG:
+                    key_columns.append(column_name)
 
-                # Type ID
-                self.read_int32()
+                type_id = self.read_int32()
 
                 # Type modifier
                 self.read_int32()
 
-                columns.append({'name': column_name})
+                columns.append({'name': column_name, 'type_id': type_id})
             
             return {
                 'relation_id': relation_id,
                 'table_name': table_name,
-                'columns': columns
+                'columns': columns,
+                'replica_identity': replica_identity,
+                'key_columns': key_columns
             }
@@ -0,0 +1,563 @@
+import ipaddress
+import json
+import math
+import struct
+import uuid
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Callable, Dict, Iterable, List, Union
+
+from common.log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Built-in type OIDs from pg_type.dat
+BOOL = 16
+BYTEA = 17
+CHAR = 18
+NAME = 19
+INT8 = 20
+INT2 = 21
+INT4 = 23
+TEXT = 25
+OID = 26
+JSON = 114
+XML = 142
+CIDR = 650
+FLOAT4 = 700
+FLOAT8 = 701
+INET = 869
+BPCHAR = 1042
+VARCHAR = 1043
+DATE = 1082
+TIME = 1083
+TIMESTAMP = 1114
+TIMESTAMPTZ = 1184
+INTERVAL = 1186
+TIMETZ = 1266
+NUMERIC = 1700
+UUID = 2950
+JSONB = 3802
+
+# Array type OID -> element type OID, for the built-in types with a binary reader
+ARRAY_TYPES = {
+    199: JSON,
+    143: XML,
+    651: CIDR,
+    1000: BOOL,
+    1001: BYTEA,
+    1002: CHAR,
+    1003: NAME,
+    1005: INT2,
+    1007: INT4,
+    1009: TEXT,
+    1014: BPCHAR,
+    1015: VARCHAR,
+    1016: INT8,
+    1021: FLOAT4,
+    1022: FLOAT8,
+    1028: OID,
+    1041: INET,
+    1115: TIMESTAMP,
+    1182: DATE,
+    1183: TIME,
+    1185: TIMESTAMPTZ,
+    1187: INTERVAL,
+    1231: NUMERIC,
+    1270: TIMETZ,
+    2951: UUID,
+    3807: JSONB
+}
+
+TYPE_OIDS = {
+    'bool': BOOL,
+    'int2': INT2,
+    'int4': INT4,
+    'int8': INT8,
+    'oid': OID,
+    'float4': FLOAT4,
+    'float8': FLOAT8,
+    'numeric': NUMERIC,
+    'timestamp': TIMESTAMP,
+    'timestamptz': TIMESTAMPTZ,
+    'json': JSON,
+    'jsonb': JSONB
+}
+
+
+def text_to_bool(value: str) -> bool:
+    return value == 't'
+
+
+def text_to_float(value: str) -> float:
+    return float(value)
+
+
+def text_to_numeric(value: str) -> Union[int, str]:
+    """
+    Integral numerics become ints. Fractional ones, NaN and the infinities stay the string postgres
+    sent, a float would round amounts and every serializer takes a string as it is.
+    """
+    if '.' in value or value in NUMERIC_SPECIAL:
+        return value
+
+    return int(value)
+
+
+def text_to_timestamp(value: str) -> str:
+    """Convert timestamps to ISO 8601, which datetime.fromisoformat reads everywhere"""
+    try:
+        return datetime.fromisoformat(value).isoformat()
+    except ValueError:
+        # infinity, BC dates and the like stay as postgres sent them
+        return value
+
+
+NUMERIC_SPECIAL = ('NaN', 'Infinity', '-Infinity')
+
+
+TEXT_CONVERTERS: Dict[int, Callable[[str], object]] = {
+    BOOL: text_to_bool,
+    INT2: int,
+    INT4: int,
+    INT8: int,
+    OID: int,
+    FLOAT4: text_to_float,
+    FLOAT8: text_to_float,
+    NUMERIC: text_to_numeric,
+    TIMESTAMP: text_to_timestamp,
+    TIMESTAMPTZ: text_to_timestamp,
+    JSON: json.loads,
+    JSONB: json.loads
+}
+
+
+INT2_BINARY = struct.Struct('>h')
+INT4_BINARY = struct.Struct('>i')
+INT8_BINARY = struct.Struct('>q')
+OID_BINARY = struct.Struct('>I')
+FLOAT4_BINARY = struct.Struct('>f')
+FLOAT8_BINARY = struct.Struct('>d')
+# microseconds, days, months
+INTERVAL_BINARY = struct.Struct('>qii')
+# microseconds, zone offset in seconds west of UTC
+TIMETZ_BINARY = struct.Struct('>qi')
+# family, bits, is_cidr, address length
+INET_HEADER_BINARY = struct.Struct('>BBBB')
+# ndim, has nulls, element type OID
+ARRAY_HEADER_BINARY = struct.Struct('>iiI')
+ARRAY_DIMENSION_BINARY = struct.Struct('>ii')
+# ndigits, weight, sign, dscale
+NUMERIC_HEADER_BINARY = struct.Struct('>hhHh')
+
+NUMERIC_NAN = 0xC000
+NUMERIC_PINF = 0xD000
+NUMERIC_NINF = 0xF000
+NUMERIC_NEG = 0x4000
+
+TIMESTAMP_INFINITY = 2 ** 63 - 1
+TIMESTAMP_NEG_INFINITY = -2 ** 63
+
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+POSTGRES_EPOCH_TZ = datetime(2000, 1, 1, tzinfo=timezone.utc)
+POSTGRES_EPOCH_DATE = date(2000, 1, 1)
+
+# days between 0000-03-01 and the postgres epoch, in the proleptic gregorian calendar
+POSTGRES_EPOCH_CIVIL_DAYS = 730425
+
+MICROSECONDS_PER_DAY = 86400 * 1000000
+
+PGSQL_AF_INET = 2
+
+
+def binary_to_text(value) -> str:
+    return str(value, 'utf-8')
+
+
+def binary_to_hex(value) -> str:
+    """Same representation as bytea_output = hex"""
+    return '\\x' + value.hex()
+
+
+def binary_to_bool(value) -> bool:
+    return value[0] != 0
+
+
+def binary_to_int2(value) -> int:
+    return INT2_BINARY.unpack_from(value)[0]
+
+
+def binary_to_int4(value) -> int:
+    return INT4_BINARY.unpack_from(value)[0]
+
+
+def binary_to_int8(value) -> int:
+    return INT8_BINARY.unpack_from(value)[0]
+
+
+def binary_to_oid(value) -> int:
+    return OID_BINARY.unpack_from(value)[0]
+
+
+def binary_to_float4(value) -> float:
+    return FLOAT4_BINARY.unpack_from(value)[0]
+
+
+def binary_to_float8(value) -> float:
+    return FLOAT8_BINARY.unpack_from(value)[0]
+
+
+def binary_to_numeric(value) -> Union[int, str]:
+    """Same result as text_to_numeric on the text representation"""
+    ndigits, weight, sign, dscale = NUMERIC_HEADER_BINARY.unpack_from(value)
+
+    if sign == NUMERIC_NAN:
+        return 'NaN'
+    if sign == NUMERIC_PINF:
+        return 'Infinity'
+    if sign == NUMERIC_NINF:
+        return '-Infinity'
+
+    digits = struct.unpack_from(f'>{ndigits}h', value, NUMERIC_HEADER_BINARY.size)
+
+    # every digit holds four decimal digits, the first one is multiplied by 10000^weight
+    number = 0
+    for digit in digits:
+        number = number * 10000 + digit
+
+    number = Decimal(number).scaleb(4 * (weight - ndigits + 1))
+    if sign == NUMERIC_NEG:
+        number = -number
+
+    if dscale > 0:
+        # the display scale gives the digits postgres prints, trailing zeros included
+        return f'{number:.{dscale}f}'
+
+    return int(number)
+
+
+def postgres_date_text(days: int) -> str:
+    """
+    Text representation of a date postgres stores as days since its epoch. Used for dates outside
+    of the years 1 to 9999 python can represent, e.g. 10000-01-01 or 0044-03-15 BC.
+    """
+    # civil from days, with eras of 400 years starting on 0000-03-01
+    days += POSTGRES_EPOCH_CIVIL_DAYS
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524 - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    month = month_index + 3 if month_index < 10 else month_index - 9
+    year = year_of_era + era * 400 + (month <= 2)
+
+    if year <= 0:
+        return f'{1 - year:04d}-{month:02d}-{day:02d} BC'
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+
+def postgres_timestamp_text(microseconds: int, zone: str = '') -> str:
+    """Text representation of a timestamp python can't represent, see postgres_date_text"""
+    days, microseconds = divmod(microseconds, MICROSECONDS_PER_DAY)
+    seconds, microseconds = divmod(microseconds, 1000000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+
+    text = postgres_date_text(days)
+    day, bc = (text[:-3], ' BC') if text.endswith(' BC') else (text, '')
+    fraction = f'.{microseconds:06d}'.rstrip('0') if microseconds else ''
+
+    return f'{day} {hours:02d}:{minutes:02d}:{seconds:02d}{fraction}{zone}{bc}'
+
+
+def binary_to_timestamp(value) -> str:
+    microseconds = INT8_BINARY.unpack_from(value)[0]
+
+    if microseconds == TIMESTAMP_INFINITY:
+        return 'infinity'
+    if microseconds == TIMESTAMP_NEG_INFINITY:
+        return '-infinity'
+
+    try:
+        return (POSTGRES_EPOCH + timedelta(microseconds=microseconds)).isoformat()
+    except OverflowError:
+        return postgres_timestamp_text(microseconds)
+
+
+def binary_to_timestamptz(value) -> str:
+    microseconds = INT8_BINARY.unpack_from(value)[0]
+
+    if microseconds == TIMESTAMP_INFINITY:
+        return 'infinity'
+    if microseconds == TIMESTAMP_NEG_INFINITY:
+        return '-infinity'
+
+    try:
+        return (POSTGRES_EPOCH_TZ + timedelta(microseconds=microseconds)).isoformat()
+    except OverflowError:
+        return postgres_timestamp_text(microseconds, '+00')
+
+
+def binary_to_date(value) -> str:
+    days = INT4_BINARY.unpack_from(value)[0]
+
+    # date infinities are the extremes of int32
+    if days == 2 ** 31 - 1:
+        return 'infinity'
+    if days == -2 ** 31:
+        return '-infinity'
+
+    try:
+        return (POSTGRES_EPOCH_DATE + timedelta(days=days)).isoformat()
+    except OverflowError:
+        return postgres_date_text(days)
+
+
+def binary_to_time(value) -> str:
+    microseconds = INT8_BINARY.unpack_from(value)[0]
+
+    # 24:00:00 is a valid time in postgres
+    if microseconds == MICROSECONDS_PER_DAY:
+        return '24:00:00'
+
+    seconds, microseconds = divmod(microseconds, 1000000)
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60, microseconds).isoformat()
+
+
+def binary_to_timetz(value) -> str:
+    microseconds, zone = TIMETZ_BINARY.unpack_from(value)
+
+    seconds, microseconds = divmod(microseconds, 1000000)
+    tzinfo = timezone(timedelta(seconds=-zone))
+    if seconds == 86400:
+        return '24:00:00' + time(tzinfo=tzinfo).isoformat()[8:]
+
+    return time(seconds // 3600, seconds // 60 % 60, seconds % 60, microseconds, tzinfo=tzinfo).isoformat()
+
+
+def binary_to_interval(value) -> str:
+    """Same representation as IntervalStyle = postgres, e.g. 1 year 2 mons -3 days +04:05:06.5"""
+    microseconds, days, months = INTERVAL_BINARY.unpack_from(value)
+
+    parts = []
+    negative_before = False
+    for amount, unit in ((int(months / 12), 'year'), (months - int(months / 12) * 12, 'mon'), (days, 'day')):
+        if amount:
+            sign = '+' if negative_before and amount > 0 else ''
+            parts.append(f'{sign}{amount} {unit}{"" if amount == 1 else "s"}')
+            negative_before = amount < 0
+
+    if microseconds or not parts:
+        sign = '-' if microseconds < 0 else '+' if negative_before else ''
+        seconds, fraction = divmod(abs(microseconds), 1000000)
+        fraction = f'.{fraction:06d}'.rstrip('0') if fraction else ''
+        parts.append(f'{sign}{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}{fraction}')
+
+    return ' '.join(parts)
+
+
+def binary_to_inet(value) -> str:
+    family, bits, is_cidr, length = INET_HEADER_BINARY.unpack_from(value)
+    address = bytes(value[INET_HEADER_BINARY.size:INET_HEADER_BINARY.size + length])
+
+    address = ipaddress.IPv4Address(address) if family == PGSQL_AF_INET else ipaddress.IPv6Address(address)
+    if is_cidr or bits != address.max_prefixlen:
+        return f'{address}/{bits}'
+
+    return str(address)
+
+
+def binary_to_array(value, element_converter: Union[Callable[[bytes], object], None] = None) -> list:
+    """
+    Read an array as nested lists, NULL elements become None. Without an element converter the
+    elements are read with the converter of the element type named in the value.
+    """
+    ndim, _, element_type = ARRAY_HEADER_BINARY.unpack_from(value)
+    if ndim == 0:
+        return []
+
+    offset = ARRAY_HEADER_BINARY.size
+    dimensions = []
+    for _ in range(ndim):
+        dimensions.append(ARRAY_DIMENSION_BINARY.unpack_from(value, offset)[0])
+        offset += ARRAY_DIMENSION_BINARY.size
+
+    converter = element_converter or BINARY_CONVERTERS.get(element_type, binary_to_hex)
+    elements = []
+    for _ in range(math.prod(dimensions)):
+        length = INT4_BINARY.unpack_from(value, offset)[0]
+        offset += 4
+        if length < 0:
+            elements.append(None)
+        else:
+            elements.append(converter(value[offset:offset + length]))
+            offset += length
+
+    # fold the flat elements into the inner dimensions, last dimension first
+    for size in reversed(dimensions[1:]):
+        elements = [elements[i:i + size] for i in range(0, len(elements), size)]
+
+    return elements
+
+
+def array_reader(element_converter: Callable[[bytes], object]) -> Callable[[bytes], list]:
+    def read(value):
+        return binary_to_array(value, element_converter)
+    return read
+
+
+def binary_to_uuid(value) -> str:
+    return str(uuid.UUID(bytes=bytes(value)))
+
+
+def binary_to_json(value):
+    return json.loads(bytes(value))
+
+
+def binary_to_jsonb(value):
+    # the first byte is the jsonb format version
+    return json.loads(bytes(value[1:]))
+
+
+# Readers of the built-in types, other types are resolved from pg_type with resolve_binary_types
+BINARY_CONVERTERS: Dict[int, Callable[[bytes], object]] = {
+    BOOL: binary_to_bool,
+    BYTEA: binary_to_hex,
+    CHAR: binary_to_text,
+    NAME: binary_to_text,
+    INT8: binary_to_int8,
+    INT2: binary_to_int2,
+    INT4: binary_to_int4,
+    TEXT: binary_to_text,
+    OID: binary_to_oid,
+    JSON: binary_to_json,
+    XML: binary_to_text,
+    CIDR: binary_to_inet,
+    FLOAT4: binary_to_float4,
+    FLOAT8: binary_to_float8,
+    INET: binary_to_inet,
+    BPCHAR: binary_to_text,
+    VARCHAR: binary_to_text,
+    DATE: binary_to_date,
+    TIME: binary_to_time,
+    TIMESTAMP: binary_to_timestamp,
+    TIMESTAMPTZ: binary_to_timestamptz,
+    INTERVAL: binary_to_interval,
+    TIMETZ: binary_to_timetz,
+    NUMERIC: binary_to_numeric,
+    UUID: binary_to_uuid,
+    JSONB: binary_to_jsonb
+}
+BINARY_CONVERTERS.update({array_type: binary_to_array for array_type in ARRAY_TYPES})
+
+PG_TYPE_QUERY = 'SELECT oid, typtype, typbasetype, typelem, typcategory FROM pg_type WHERE oid = ANY(%s)'
+
+
+def unknown_binary_types(schema: dict, types: Union[Dict[int, Callable[[bytes], object]], None] = None) -> List[int]:
+    """Type OIDs of the columns of a relation that have no binary reader"""
+    types = types or {}
+    return sorted({
+        column.get('type_id') for column in schema['columns']
+        if column.get('type_id') not in BINARY_CONVERTERS and column.get('type_id') not in types
+    })
+
+
+def resolve_binary_types(cursor, type_ids: List[int]) -> Dict[int, Callable[[bytes], object]]:
+    """
+    Find binary readers for types that aren't built in: enums are sent as their label, domains
+    like their base type and arrays element by element. Types that can't be resolved, like
+    composite or range types, are left out and their values are sent on as hex.
+
+    :param cursor: Cursor on a regular connection to the database.
+    :return: Type OID -> reader, for the types that could be resolved.
+    """
+    # oid -> typtype, typbasetype, typelem, typcategory; domains and arrays refer to further types
+    types = {}
+    pending = set(type_ids)
+    while pending:
+        cursor.execute(PG_TYPE_QUERY, (sorted(pending),))
+        fetched = {row[0]: row[1:] for row in cursor.fetchall()}
+        types.update(fetched)
+        pending = {
+            type_id for _, base_type, element_type, _ in fetched.values() for type_id in (base_type, element_type)
+            if type_id and type_id not in BINARY_CONVERTERS and type_id not in types
+        }
+
+    def reader(type_id):
+        if type_id in BINARY_CONVERTERS:
+            return BINARY_CONVERTERS[type_id]
+        if type_id not in types:
+            return None
+
+        typtype, base_type, element_type, category = types[type_id]
+        if typtype == 'e':
+            return binary_to_text
+        if typtype == 'd':
+            return reader(base_type)
+        if category == 'A' and element_type:
+            element_reader = reader(element_type)
+            return array_reader(element_reader) if element_reader else None
+        return None
+
+    resolved = {}
+    for type_id in type_ids:
+        converter = reader(type_id)
+        if converter is None:
+            logger.warning('No binary reader for type %s, its values are sent as hex', type_id)
+        else:
+            resolved[type_id] = converter
+
+    return resolved
+
+
+def binary_column_converters(schema: dict, types: Union[Dict[int, Callable[[bytes], object]], None] = None) \
+        -> List[Callable[[bytes], object]]:
+    """
+    Build the converters for values a relation receives in binary format, one per column.
+
+    :param types: Readers of further types, from resolve_binary_types.
+    """
+    types = types or {}
+    return [
+        BINARY_CONVERTERS.get(column.get('type_id')) or types.get(column.get('type_id'), binary_to_hex)
+        for column in schema['columns']
+    ]
+
+
+class TypeRegistry:
+    """
+    Converters from the text representation of a value to a native python value, keyed by type OID.
+    Only the types that are asked for are converted, every other value stays a string.
+    """
+
+    def __init__(self, type_names: Union[str, Iterable[str], None] = None):
+        self.converters: Dict[int, Callable[[str], object]] = {}
+
+        if isinstance(type_names, str):
+            type_names = [name.strip() for name in type_names.split(',') if name.strip()]
+
+        for name in type_names or []:
+            if name == 'all':
+                self.converters.update(TEXT_CONVERTERS)
+            elif name in TYPE_OIDS:
+                self.register(TYPE_OIDS[name], TEXT_CONVERTERS[TYPE_OIDS[name]])
+            else:
+                raise ValueError(f'No converter for type: {name}, expected one of all, {", ".join(TYPE_OIDS)}')
+
+    def register(self, type_id: int, converter: Callable[[str], object]) -> None:
+        self.converters[type_id] = converter
+
+    def column_converters(self, schema: dict) -> Union[List[Callable[[str], object]], None]:
+        """
+        Build the converters for a relation, one per column and None for columns that stay text.
+
+        :return: None when no column of the relation is converted.
+        """
+        converters = [self.converters.get(column.get('type_id')) for column in schema['columns']]
+
+        if not any(converters):
+            return None
+
+        return converters
@@ -24,17 +24,22 @@ class UpdateMessage(BaseMessage):
             old_tuple_values = self.decode_tuple()
             new_tuple = self.read_utf_8(length=1)
             new_tuple_values = self.decode_tuple()
+            unchanged = self.resolve_unchanged(old_tuple_values, new_tuple_values)
 
             diff = self.calculate_diff(old_tuple_values, new_tuple_values)
             if not diff or not new_tuple_values:
                 return None
 
-            return {
+            message = {
                 'table_name': self.table_name,
-                'id': new_tuple_values.get('id') or old_tuple_values.get('id'),
+                'id': self.event_id(self.schema, new_tuple_values, old_tuple_values),
                 'old': old_tuple_values,
                 'new': new_tuple_values,
                 'diff': diff,
                 'action': self.message_type,
                 'recorded_at': self.recorded_at.isoformat()
             }
+            if unchanged:
+                message['unchanged'] = unchanged
+
+            return message
@@ -0,0 +1,58 @@
+import os
+
+import click
+import psycopg2
+
+from common import log
+from producer.checkpoint import LsnCheckpoint
+
+logger = log.get_logger(__name__)
+
+
+def drop_replication_slot(*, pg_host, pg_port, pg_database, pg_user, pg_password, pg_replication_slot) -> bool:
+    """
+    Drop a replication slot, e.g. one kept by a producer running with a persistent slot.
+
+    :return: False if the slot did not exist.
+    """
+    conn = psycopg2.connect(
+        host=pg_host,
+        port=pg_port,
+        dbname=pg_database,
+        user=pg_user,
+        password=pg_password
+    )
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_drop_replication_slot(%s);", (pg_replication_slot,))
+            conn.commit()
+            logger.info('Replication slot %s dropped successfully.', pg_replication_slot)
+            return True
+    except psycopg2.errors.UndefinedObject:
+        logger.warning('Replication slot %s does not exist', pg_replication_slot)
+        return False
+    finally:
+        conn.close()
+
+
+@click.command()
+@click.option('--pg_host', default=lambda: os.environ.get('PGHOST', None), required=True, help='Postgresql Host ($PGHOST)')
+@click.option('--pg_port', default=lambda: os.environ.get('PGPORT', 5432), required=True, help='Postgresql Host ($PGPORT)')
+@click.option('--pg_database', default=lambda: os.environ.get('PGDATABASE', None), required=True, help='Postgresql Database ($PGDATABASE)')
+@click.option('--pg_user', default=lambda: os.environ.get('PGUSER', None), required=True, help='Postgresql User ($PGUSER)')
+@click.option('--pg_password', default=lambda: os.environ.get('PGPASSWORD', None), required=True, help='Postgresql Password ($PGPASSWORD)')
+@click.option('--pg_replication_slot', default=lambda: os.environ.get('PGREPLICATIONSLOT', None), required=True, help='Postgresql Replication Slot Name ($PGREPLICATIONSLOT)')
+@click.option('--lsn_checkpoint_file', default=lambda: os.environ.get('LSNCHECKPOINTFILE', None), required=False, help='Remove the LSN checkpoint of the slot as well ($LSNCHECKPOINTFILE)')
+def drop_slot(pg_host, pg_port, pg_database, pg_user, pg_password, pg_replication_slot, lsn_checkpoint_file):
+    drop_replication_slot(
+        pg_host=pg_host,
+        pg_port=pg_port,
+        pg_database=pg_database,
+        pg_user=pg_user,
+        pg_password=pg_password,
+        pg_replication_slot=pg_replication_slot
+    )
+
+    if lsn_checkpoint_file:
+        LsnCheckpoint(path=lsn_checkpoint_file, slot_name=pg_replication_slot).remove()
+        logger.info('Removed LSN checkpoint %s', lsn_checkpoint_file)
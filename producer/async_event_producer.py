@@ -0,0 +1,116 @@
+import asyncio
+
+from common.log import get_logger
+from producer.event_producer import EventProducer
+from producer.replication_loop import BLOCKED_POLL_TIMEOUT
+
+
+logger = get_logger(__name__)
+
+
+class AsyncEventProducer(EventProducer):
+    """
+    EventProducer running on an asyncio event loop, meant to be used with AsyncRabbitMQConnector.
+
+    Publishing only hands messages to the event loop, so the next replication messages are read
+    and decoded while earlier events are still being written to the broker and confirmed. The
+    loop waits for the replication connection with add_reader instead of blocking in select.
+
+    Without publisher confirms an LSN is acknowledged as soon as its events are buffered, so
+    events still buffered when the broker drops the connection are lost. Enable publisher
+    confirms to only acknowledge LSNs whose events the broker stored.
+
+    Connecting and consuming are coroutines: await connect_async() and start_consuming_async()
+    instead of calling connect() and start_consuming().
+    """
+
+    def __init__(self, **kwargs):
+        # batches and transactions are acknowledged right after publish_batch, which does not wait for confirms here
+        if kwargs.get('publisher_confirms') and (kwargs.get('publish_batch_size', 1) > 1 or kwargs.get('transaction_mode')):
+            raise ValueError('Publisher confirms can not be combined with batching or transaction mode when running on asyncio')
+
+        if not kwargs.get('publisher_confirms'):
+            logger.warning('Publisher confirms are disabled, events buffered when the broker connection drops are lost')
+
+        self.__loop = None
+        super().__init__(**kwargs)
+
+    def connect(self):
+        raise TypeError('AsyncEventProducer connects on the event loop, await connect_async() instead')
+
+    async def connect_async(self):
+        self.__loop = asyncio.get_running_loop()
+        await self.qconnector.connect()
+
+        # connecting and creating the slot are blocking calls, a backfill publishes through the loop
+        await self.__loop.run_in_executor(None, self.connect_db)
+
+    def __on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.__loop
+        except RuntimeError:
+            return False
+
+    async def __publish_confirmed(self, publish, **kwargs):
+        result = publish(**kwargs)
+        await self.qconnector.wait_for_confirms()
+        return result
+
+    def __handover(self, publish, **kwargs):
+        """
+        The connection may only be used on the event loop. Publishing from another thread, e.g.
+        the backfill run by connect_async(), is handed over to the loop and waits until the messages
+        are confirmed, like publishing with the blocking connector does.
+        """
+        if self.__loop is None or self.__on_loop():
+            return publish(**kwargs)
+
+        return asyncio.run_coroutine_threadsafe(self.__publish_confirmed(publish, **kwargs), self.__loop).result()
+
+    def publish(self, **kwargs):
+        return self.__handover(self.qconnector.publish, **kwargs)
+
+    def publish_batch(self, messages):
+        self.__handover(self.qconnector.publish_batch, messages=messages)
+
+    def publish_encoded(self, **kwargs):
+        return self.__handover(self.qconnector.publish_encoded, **kwargs)
+
+    async def __wait_readable(self, timeout):
+        loop = asyncio.get_running_loop()
+        readable = loop.create_future()
+        fd = self.fileno()
+
+        loop.add_reader(fd, lambda: readable.done() or readable.set_result(None))
+        try:
+            await asyncio.wait_for(readable, timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            loop.remove_reader(fd)
+
+    def start_consuming(self):
+        raise TypeError('AsyncEventProducer consumes on the event loop, await start_consuming_async() instead')
+
+    async def start_consuming_async(self):
+        try:
+            while True:
+                if self.qconnector.connection_lost:
+                    await self.qconnector.reconnect()
+                elif self.qconnector.blocked:
+                    # replication reads pause until the broker unblocks the connection
+                    await asyncio.sleep(BLOCKED_POLL_TIMEOUT)
+                    self.keepalive()
+                elif self.read_stream_once(wait=False):
+                    # let the event loop write published messages and take in confirms
+                    await asyncio.sleep(0)
+                elif self.pipeline_future() is not None:
+                    # pipeline workers are awaited instead of blocking the loop
+                    await asyncio.wait([asyncio.wrap_future(self.pipeline_future())], timeout=self.idle_timeout())
+                else:
+                    await self.__wait_readable(self.idle_timeout())
+        except Exception:
+            if self.shutdown_requested:
+                logger.info('Shutting down gracefully')
+                return
+            raise
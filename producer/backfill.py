@@ -0,0 +1,325 @@
+import io
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+import psycopg2
+from psycopg2 import sql
+
+from common.log import get_logger
+from common.utils import get_utc_now
+from pgoutput_parser.base import BaseMessage
+from pgoutput_parser.plan import COLUMN_KEEP, COLUMN_SKIP, project_value
+from pgoutput_parser.types import INT2, INT4, INT8, TypeRegistry
+from producer.publication import user_tables
+
+
+logger = get_logger(__name__)
+
+DEFAULT_BACKFILL_WORKERS = 4
+
+# Rows handed from a COPY worker to the publishing thread at a time
+COPY_CHUNK_ROWS = 500
+
+# How long a COPY worker waits for room in the queue before checking whether the backfill was stopped
+QUEUE_PUT_TIMEOUT = 1
+
+BACKFILL_ACTIONS = ('S', 'I')
+
+# Primary keys of these types are split into ranges, tables with any other key are copied by a single worker
+RANGE_KEY_TYPES = (INT2, INT4, INT8)
+
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+COPY_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]{1,2}|[0-7]{1,3}|.)')
+
+
+def unescape_copy_value(value: str) -> str:
+    def replace(match):
+        escape = match.group(1)
+        if escape[0] == 'x' and len(escape) > 1:
+            return chr(int(escape[1:], 16))
+        if escape[0] in '01234567':
+            return chr(int(escape, 8))
+        return COPY_ESCAPES.get(escape, escape)
+
+    return COPY_ESCAPE_RE.sub(replace, value) if '\\' in value else value
+
+
+def parse_copy_line(line: str) -> List[Union[str, None]]:
+    """Split a line of COPY text format into its values, None for NULL"""
+    return [None if value == '\\N' else unescape_copy_value(value) for value in line.split('\t')]
+
+
+def create_replication_slot_with_snapshot(cursor, slot_name: str, output_plugin: str) -> Tuple[str, str]:
+    """
+    Create a logical replication slot on a replication connection and export its snapshot.
+    The snapshot can be imported until the next command runs on the replication connection.
+
+    :return: The consistent point of the slot and the name of the exported snapshot.
+    """
+    cursor.execute(sql.SQL('CREATE_REPLICATION_SLOT {} LOGICAL {} EXPORT_SNAPSHOT').format(
+        sql.Identifier(slot_name), sql.Identifier(output_plugin)
+    ))
+    _, consistent_point, snapshot_name, _ = cursor.fetchone()
+
+    return consistent_point, snapshot_name
+
+
+def backfill_tables(connect: Callable[[], 'psycopg2.connection'], table_filter, publication_name: str = None) -> List[str]:
+    """
+    Tables to backfill. Wildcards and patterns of the table filter are resolved against the tables
+    of the publication, or every user table without one.
+    """
+    if table_filter.exact:
+        return sorted(table_filter.names)
+
+    conn = connect()
+    try:
+        with conn.cursor() as cur:
+            if publication_name:
+                cur.execute(
+                    "SELECT schemaname, tablename FROM pg_publication_tables WHERE pubname = ANY(%s);",
+                    (publication_name.split(','),)
+                )
+                tables = [f'{schema}.{table}' for schema, table in cur.fetchall()]
+            else:
+                tables = user_tables(cur)
+    finally:
+        conn.close()
+
+    return [table for table in tables if table_filter.matches(table)]
+
+
+def snapshot_event(table_name: str, row: dict, action: str = 'S', key_columns: Union[List[str], None] = None) -> dict:
+    """Event for a row that existed when the slot was created, shaped like an insert"""
+    return {
+        'table_name': table_name,
+        'new': row,
+        'id': BaseMessage.event_id({'key_columns': key_columns}, row),
+        'old': {},
+        'diff': BaseMessage.calculate_diff({}, row),
+        'action': action,
+        'recorded_at': get_utc_now().isoformat()
+    }
+
+
+class _Stopped(Exception):
+    pass
+
+
+class _CopyRows(io.TextIOBase):
+    """File COPY TO STDOUT writes into, puts chunks of decoded rows on the queue"""
+
+    def __init__(self, backfill: 'SnapshotBackfill', table_name: str, columns: List[str], converters, actions=None):
+        self.__backfill = backfill
+        self.__table_name = table_name
+        self.__columns = columns
+        self.__converters = converters
+        self.__actions = actions
+
+        self.__partial = ''
+        self.__rows = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        lines = (self.__partial + data).split('\n')
+        self.__partial = lines.pop()
+
+        for line in lines:
+            values = parse_copy_line(line)
+            if self.__actions:
+                self.__rows.append(self.__project(values))
+            else:
+                self.__rows.append(dict(zip(self.__columns, self.__convert(values))))
+
+            if len(self.__rows) >= COPY_CHUNK_ROWS:
+                self.flush_rows()
+
+        return len(data)
+
+    def __convert(self, values) -> list:
+        if not self.__converters:
+            return values
+
+        return [
+            converter(value) if converter and value is not None else value
+            for converter, value in zip(self.__converters, values)
+        ]
+
+    def __project(self, values) -> dict:
+        """
+        Redacted and hashed columns are projected from the text COPY sent, like the streaming
+        decoder projects the raw bytes, only the columns that are kept are converted.
+        """
+        converters = self.__converters or [None] * len(self.__columns)
+
+        row = {}
+        for name, action, converter, value in zip(self.__columns, self.__actions, converters, values):
+            if action == COLUMN_SKIP:
+                continue
+            if value is None:
+                row[name] = None
+            elif action == COLUMN_KEEP:
+                row[name] = converter(value) if converter else value
+            else:
+                row[name] = project_value(action, value.encode('utf-8'))
+        return row
+
+    def flush_rows(self):
+        if self.__rows:
+            self.__backfill.put((self.__table_name, self.__rows))
+            self.__rows = []
+
+
+class SnapshotBackfill:
+    """
+    Reads the rows of tables as of an exported snapshot with parallel COPY ... TO STDOUT workers.
+
+    Every worker imports the snapshot on its own connection. A table with a single integer
+    primary key is split into one key range per worker, any other table is copied by a single
+    worker. Rows are handed back in chunks to the thread iterating over chunks(), so publishing
+    stays on that thread.
+    """
+
+    def __init__(self, connect: Callable[[], 'psycopg2.connection'], snapshot_name: str, tables: List[str],
+                 workers: int = DEFAULT_BACKFILL_WORKERS, type_registry: Union[TypeRegistry, None] = None,
+                 column_actions: Union[Callable[[dict], Union[List[int], None]], None] = None):
+        self.connect = connect
+        self.snapshot_name = snapshot_name
+        self.tables = tables
+        self.workers = workers
+        self.type_registry = type_registry or TypeRegistry()
+
+        # projection and redaction of a table, called with its schema
+        self.column_actions = column_actions
+
+        # table name -> primary key columns, known for every table once chunks() yields
+        self.key_columns: Dict[str, List[str]] = {}
+
+        self.__queue = queue.Queue(maxsize=workers * 2)
+        self.__stopped = threading.Event()
+
+    def __connect_snapshot(self):
+        conn = self.connect()
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+
+        with conn.cursor() as cur:
+            cur.execute('SET TRANSACTION SNAPSHOT %s', (self.snapshot_name,))
+
+        return conn
+
+    @staticmethod
+    def __table_identifier(table_name: str):
+        return sql.Identifier(*table_name.split('.', 1))
+
+    def __plan_table(self, cur, table_name: str) -> List[tuple]:
+        """Split a table into the copy tasks of its key ranges"""
+        table = self.__table_identifier(table_name)
+
+        cur.execute(sql.SQL('SELECT * FROM {} LIMIT 0').format(table))
+        schema = {
+            'table_name': table_name,
+            'columns': [{'name': column.name, 'type_id': column.type_code} for column in cur.description]
+        }
+        columns = [column['name'] for column in schema['columns']]
+        converters = self.type_registry.column_converters(schema)
+        actions = self.column_actions(schema) if self.column_actions else None
+
+        cur.execute(
+            """
+            SELECT a.attname, a.atttypid FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey)
+            JOIN pg_class c ON c.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = %s AND c.relname = %s AND i.indisprimary
+            """,
+            tuple(table_name.split('.', 1))
+        )
+        key = cur.fetchall()
+        self.key_columns[table_name] = [name for name, _ in key]
+
+        ranges = [None]
+        if len(key) == 1 and key[0][1] in RANGE_KEY_TYPES and self.workers > 1:
+            key_column = sql.Identifier(key[0][0])
+            cur.execute(sql.SQL('SELECT min({0}), max({0}) FROM {1}').format(key_column, table))
+            low, high = cur.fetchone()
+
+            if low is not None and high > low:
+                step = (high - low) // self.workers + 1
+                ranges = [
+                    sql.SQL('WHERE {0} >= {1} AND {0} < {2}').format(key_column, sql.Literal(start), sql.Literal(start + step))
+                    for start in range(low, high + 1, step)
+                ]
+
+        return [(table_name, columns, converters, actions, where) for where in ranges]
+
+    def __copy(self, table_name, columns, converters, actions, where) -> None:
+        conn = self.__connect_snapshot()
+        try:
+            query = sql.SQL('COPY (SELECT * FROM {} {}) TO STDOUT').format(
+                self.__table_identifier(table_name), where or sql.SQL('')
+            )
+            rows = _CopyRows(self, table_name, columns, converters, actions)
+            with conn.cursor() as cur:
+                cur.copy_expert(query, rows)
+            rows.flush_rows()
+        finally:
+            conn.close()
+
+    def put(self, item) -> None:
+        while True:
+            if self.__stopped.is_set():
+                raise _Stopped()
+            try:
+                self.__queue.put(item, timeout=QUEUE_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                pass
+
+    def __run(self, task) -> None:
+        try:
+            self.__copy(*task)
+            self.put(None)
+        except _Stopped:
+            pass
+        except Exception as e:
+            logger.error('Error copying %s: %s', task[0], e)
+            try:
+                self.put(e)
+            except _Stopped:
+                pass
+
+    def chunks(self) -> Iterator[Tuple[str, List[dict]]]:
+        """
+        :return: Chunks of rows as (table_name, rows), rows are dicts of column name to value.
+        """
+        conn = self.__connect_snapshot()
+        try:
+            with conn.cursor() as cur:
+                tasks = [task for table_name in self.tables for task in self.__plan_table(cur, table_name)]
+        finally:
+            conn.close()
+
+        logger.info('Backfilling %s tables in %s copy tasks from snapshot %s', len(self.tables), len(tasks), self.snapshot_name)
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill')
+        try:
+            for task in tasks:
+                executor.submit(self.__run, task)
+
+            remaining = len(tasks)
+            while remaining:
+                item = self.__queue.get()
+                if item is None:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            self.__stopped.set()
+            executor.shutdown(wait=True)
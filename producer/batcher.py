@@ -0,0 +1,71 @@
+import time
+from typing import List, Tuple, Union
+
+
+class EventBatcher:
+    """
+    Buffers events until max_size of them are pending or the oldest one has been
+    waiting for max_linger_ms. Tracks the highest LSN seen so feedback for a batch
+    is only sent once all of its events are published.
+    """
+
+    def __init__(self, max_size: int, max_linger_ms: int = 0):
+        self.max_size = max_size
+        self.max_linger_ms = max_linger_ms
+
+        self.__events: List[Tuple[str, str]] = []
+        self.__first_event_at: Union[float, None] = None
+        self.__highest_lsn: Union[int, None] = None
+
+    def __len__(self):
+        return len(self.__events)
+
+    def add(self, routing_key: str, payload: str, lsn: int) -> None:
+        if not self.__events:
+            self.__first_event_at = time.monotonic()
+
+        self.__events.append((routing_key, payload))
+        self.mark(lsn)
+
+    def mark(self, lsn: int) -> None:
+        """Record a processed LSN, whether or not it produced an event"""
+        if self.__highest_lsn is None or lsn > self.__highest_lsn:
+            self.__highest_lsn = lsn
+
+    @property
+    def highest_lsn(self) -> Union[int, None]:
+        return self.__highest_lsn
+
+    def is_full(self) -> bool:
+        return len(self.__events) >= self.max_size
+
+    def time_left(self) -> Union[float, None]:
+        """Seconds until the pending batch has lingered long enough, None when nothing is pending"""
+        if not self.__events:
+            return None
+
+        elapsed = time.monotonic() - self.__first_event_at
+        return max(self.max_linger_ms / 1000 - elapsed, 0)
+
+    def should_flush(self, idle: bool = False) -> bool:
+        """
+        A batch is flushed once it is full or has lingered for max_linger_ms. Without a
+        linger time it is flushed as soon as the replication stream has nothing more to read.
+        """
+        if not self.__events:
+            return False
+
+        if self.is_full():
+            return True
+
+        return self.time_left() == 0 and (idle or self.max_linger_ms > 0)
+
+    def drain(self) -> Tuple[List[Tuple[str, str]], Union[int, None]]:
+        """Return the pending events with the highest LSN they cover and reset the batch"""
+        events, highest_lsn = self.__events, self.__highest_lsn
+
+        self.__events = []
+        self.__first_event_at = None
+        self.__highest_lsn = None
+
+        return events, highest_lsn
@@ -0,0 +1,89 @@
+import json
+import os
+import time
+from typing import Union
+
+from common.log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Seconds between two writes of the checkpoint file
+DEFAULT_CHECKPOINT_INTERVAL = 1
+
+
+def format_lsn(lsn: int) -> str:
+    """Format an LSN the way postgres prints it, e.g. 16/B374D848"""
+    return f'{lsn >> 32:X}/{lsn & 0xFFFFFFFF:X}'
+
+
+def parse_lsn(position: str) -> int:
+    """Parse an LSN printed by postgres, e.g. 16/B374D848"""
+    high, low = position.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class LsnCheckpoint:
+    """
+    Keeps the last LSN acknowledged to postgres in a local file.
+
+    Flush feedback is sent asynchronously, the slot's confirmed flush LSN may lag behind what
+    was published when the producer stops. Replication is resumed from the checkpoint so
+    transactions committed before it are not published again. Writes are throttled to one
+    every interval seconds and replace the file atomically.
+    """
+
+    def __init__(self, path: str, slot_name: str, interval: float = DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = path
+        self.slot_name = slot_name
+        self.interval = interval
+
+        self.__lsn: Union[int, None] = None
+        self.__saved_lsn: Union[int, None] = None
+        self.__saved_at: Union[float, None] = None
+
+    def load(self) -> Union[int, None]:
+        """
+        :return: The checkpointed LSN, None if there is no checkpoint for this slot.
+        """
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error('Ignoring unreadable checkpoint %s: %s', self.path, e)
+            return None
+
+        if checkpoint.get('slot') != self.slot_name:
+            logger.warning('Ignoring checkpoint %s of slot %s', self.path, checkpoint.get('slot'))
+            return None
+
+        self.__lsn = self.__saved_lsn = checkpoint['lsn']
+        return self.__lsn
+
+    def update(self, lsn: int) -> None:
+        self.__lsn = lsn
+
+        if self.__saved_at is None or time.monotonic() - self.__saved_at >= self.interval:
+            self.save()
+
+    def save(self) -> None:
+        if self.__lsn is None or self.__lsn == self.__saved_lsn:
+            return
+
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'slot': self.slot_name, 'lsn': self.__lsn, 'position': format_lsn(self.__lsn)}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+        self.__saved_lsn = self.__lsn
+        self.__saved_at = time.monotonic()
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -1,8 +1,7 @@
-import json
-import threading
+import struct
 
 from abc import ABC
-from typing import Type, Union, List
+from typing import Type, Union
 
 import psycopg2
 from psycopg2.extras import LogicalReplicationConnection
@@ -11,23 +10,71 @@ from common.event import BaseEvent
 from common.qconnector import QConnector
 
 from common.log import get_logger
-
-from common.utils import DeserializerUtils as parser_utils
-from pgoutput_parser import (
-    UpdateMessage,
-    InsertMessage,
-    DeleteMessage,
-    RelationMessage
+from common.metrics import SIZE_BUCKETS, create_metrics
+from common.serialization import JSON, Serializer, loads
+
+from common.utils import DeserializerUtils as parser_utils, key_hash_bucket
+from common.wire import COMPACT, ENVELOPE, CompactTemplate, compact_content_type
+from pgoutput_parser import get_decoder
+from pgoutput_parser.base import REPLICA_IDENTITY_FULL
+from pgoutput_parser.plan import SHAPE_FULL, DecodePlan, column_actions, shape_event, validate_shape
+from pgoutput_parser.types import (
+    TypeRegistry, binary_column_converters, binary_to_hex, resolve_binary_types, unknown_binary_types
+)
+from producer.backfill import (
+    DEFAULT_BACKFILL_WORKERS, SnapshotBackfill, backfill_tables, create_replication_slot_with_snapshot, snapshot_event
+)
+from producer.batcher import EventBatcher
+from producer.checkpoint import LsnCheckpoint, format_lsn, parse_lsn
+from producer.lag_controller import DEFAULT_HIGH_LAG, DEFAULT_LOW_LAG, LagController
+from producer.lsn_tracker import LsnTracker
+from producer.pipeline import DEFAULT_EXECUTOR, EncodingPipeline
+from producer.publication import sync_publication
+from producer.replication_loop import (
+    CONFIRM_POLL_TIMEOUT, DEFAULT_STATUS_INTERVAL, IDLE_POLL_TIMEOUT, ReplicationLoop, StatusUpdates
 )
+from producer.table_config import load_table_config
+from producer.table_filter import TableFilter
+from producer.stream_spool import DEFAULT_SPOOL_MEMORY, SpooledMessage, StreamSpool
+from producer.toast_cache import DEFAULT_TOAST_CACHE_MEMORY, ToastCache
+from producer.transaction import DEFAULT_MAX_TRANSACTION_EVENTS, TransactionBuffer
 
 
 logger = get_logger(__name__)
 
+# transaction id of stream start messages and of changes inside a stream
+STREAM_XID = struct.Struct('>I')
+
+# final lsn, commit timestamp, xid of a begin message
+BEGIN = struct.Struct('>QqI')
+
+# flags, commit lsn, end lsn, commit timestamp of a commit message
+COMMIT = struct.Struct('>BQQq')
+
+# xid, subxid of a stream abort message
+STREAM_ABORT = struct.Struct('>II')
+
+# xid, flags, commit lsn, end lsn, commit timestamp of a stream commit message
+STREAM_COMMIT = struct.Struct('>IBQQq')
+
 
 class EventProducer(ABC):
 
+    # every option of the producer is a keyword argument, set up here one after the other
+    # pylint: disable-next=too-many-locals,too-many-statements,too-many-branches
     def __init__(self, *, qconnector_cls, event_cls, pg_host, pg_port, pg_database, pg_user, pg_password,
-                 pg_tables, pg_replication_slot, pg_output_plugin, pg_publication_name=None, **kwargs):
+                 pg_tables, pg_replication_slot, pg_output_plugin, pg_publication_name=None,
+                 pg_output_decoder='bytesio', pg_typed_values=None, pg_proto_version=1, pg_binary=False,
+                 pg_streaming=False, stream_spool_memory=DEFAULT_SPOOL_MEMORY, transaction_mode=None,
+                 transaction_max_events=DEFAULT_MAX_TRANSACTION_EVENTS,
+                 publish_batch_size=1, publish_linger_ms=0, pipeline_workers=0, pipeline_executor=DEFAULT_EXECUTOR,
+                 metrics_port=None, metrics_file=None, pg_persistent_slot=False, lsn_checkpoint_file=None,
+                 pg_backfill=False, backfill_workers=DEFAULT_BACKFILL_WORKERS, backfill_action='S',
+                 pg_manage_publication=False, table_config=None, toast_cache_size=0,
+                 toast_cache_memory=DEFAULT_TOAST_CACHE_MEMORY, routing_key_buckets=0, serializer=JSON,
+                 wire_format=ENVELOPE, event_shape=SHAPE_FULL, adaptive_batching=False,
+                 lag_low_bytes=DEFAULT_LOW_LAG, lag_high_bytes=DEFAULT_HIGH_LAG,
+                 status_interval=DEFAULT_STATUS_INTERVAL, **kwargs):
 
         self.__shutdown = False
         self.event_cls = event_cls
@@ -35,7 +82,10 @@ class EventProducer(ABC):
         self.__db_conn: Union[psycopg2.connection, None] = None
         self.__db_cur: Union[psycopg2.cursor, None] = None
 
-        self.__pg_tables = pg_tables
+        self.__table_filter = TableFilter(pg_tables)
+
+        # wal2json table name -> whether its events are published
+        self.__wal2json_included = {}
         self.__pg_replication_slot = pg_replication_slot
 
         self.__pg_host = pg_host
@@ -48,11 +98,131 @@ class EventProducer(ABC):
 
         self.__pg_publication_name = pg_publication_name
 
+        # the publication is created or altered from pg_tables and the table config on connect
+        self.__pg_manage_publication = pg_manage_publication
+        self.__table_config = load_table_config(table_config)
+
+        # sections of the events that are published, the shape of the table config takes precedence
+        self.__event_shape = validate_shape(event_shape)
+        if pg_manage_publication and (pg_output_plugin == 'wal2json' or not pg_publication_name):
+            raise ValueError('Managing the publication needs the pgoutput plugin and pg_publication_name')
+
+        # a persistent slot survives restarts, replication resumes where the last run stopped
+        self.__pg_persistent_slot = pg_persistent_slot
+        self.__checkpoint: Union[LsnCheckpoint, None] = None
+        if lsn_checkpoint_file:
+            self.__checkpoint = LsnCheckpoint(path=lsn_checkpoint_file, slot_name=pg_replication_slot)
+
+        # existing rows are published from the snapshot exported when the slot is created
+        self.__pg_backfill = pg_backfill
+        self.__backfill_workers = backfill_workers
+        self.__backfill_action = backfill_action
+
+        # binary transfer needs postgres 14, where protocol version 2 is available as well
+        self.__pg_binary = pg_binary
+        self.__pg_proto_version = max(pg_proto_version, 2) if pg_binary else pg_proto_version
+
+        # type OID -> binary reader, for the types of the relations that aren't built in
+        self.__binary_types = {}
+
+        # streaming of in-progress transactions needs protocol version 2
+        self.__stream_spool: Union[StreamSpool, None] = None
+        self.__streaming_xid: Union[int, None] = None
+        if pg_streaming:
+            self.__pg_proto_version = max(self.__pg_proto_version, 2)
+            self.__stream_spool = StreamSpool(max_memory=stream_spool_memory)
+        self.__decoder = get_decoder(pg_output_decoder)
+
+        # events are serialized with the configured serializer, its content type is set on every message
+        self.__serializer = Serializer(serializer)
+        kwargs['content_type'] = self.__serializer.content_type
+
+        # compact events reference the column layout of their relation, published once as a schema message
+        self.__wire_format = wire_format
+        if wire_format == COMPACT:
+            if pg_output_plugin == 'wal2json' or transaction_mode:
+                raise ValueError('The compact wire format needs the pgoutput plugin and can not be combined with transaction mode')
+            kwargs['content_type'] = compact_content_type(self.__serializer)
+
+        # events of a transaction are held back until its commit message arrives
+        self.__transaction: Union[TransactionBuffer, None] = None
+        if transaction_mode:
+            self.__transaction = TransactionBuffer(
+                mode=transaction_mode, serializer=self.__serializer, max_events=transaction_max_events
+            )
+
         self.__table_schemas = {}
 
+        # relation_id -> what its events are serialized with, the serializer or a CompactTemplate
+        self.__envelopes = {}
+        self.__snapshot_envelopes = {}
+
+        # events of a row always get the same routing key suffix, so consumers can partition by row
+        self.__routing_key_buckets = routing_key_buckets
+
+        # relation_id -> DecodePlan, rebuilt whenever a relation message arrives
+        self.__type_registry = TypeRegistry(pg_typed_values)
+        self.__decode_plans = {}
+
+        self.__batcher: Union[EventBatcher, None] = None
+        self.__lsn_tracker: Union[LsnTracker, None] = None
+        if publish_batch_size > 1:
+            self.__batcher = EventBatcher(max_size=publish_batch_size, max_linger_ms=publish_linger_ms)
+        elif kwargs.get('publisher_confirms'):
+            # batches wait for their confirms, single events are confirmed in the background
+            self.__lsn_tracker = LsnTracker()
+
+        # decoding, serialization and compression on a pool of workers, published in LSN order
+        self.__pipeline: Union[EncodingPipeline, None] = None
+        if pipeline_workers > 0:
+            if self.__batcher is not None or self.__transaction is not None:
+                raise ValueError('The encoding pipeline can not be combined with batching or transaction mode')
+            self.__pipeline = EncodingPipeline(workers=pipeline_workers, executor=pipeline_executor)
+        if toast_cache_size > 0 and self.__pipeline is not None:
+            raise ValueError('The TOAST cache can not be combined with the encoding pipeline')
+
+        # publish_batch_size, publish_linger_ms and the pending pipeline work are maximums reached when far behind
+        self.__lag_controller: Union[LagController, None] = None
+        if adaptive_batching:
+            if self.__batcher is None and self.__pipeline is None:
+                raise ValueError('Adaptive batching needs publish_batch_size > 1 or pipeline workers')
+            self.__lag_controller = LagController(
+                max_batch_size=publish_batch_size,
+                max_linger_ms=publish_linger_ms,
+                max_pending=self.__pipeline.max_pending if self.__pipeline is not None else None,
+                min_pending=pipeline_workers,
+                low_lag=lag_low_bytes,
+                high_lag=lag_high_bytes
+            )
+
         self.qconnector_cls: Type[QConnector] = qconnector_cls
         self.qconnector: QConnector = qconnector_cls(**kwargs)
 
+        self.__init_metrics(metrics_port, metrics_file)
+
+        # LSNs received, processed and safely published, reported at least every status_interval seconds
+        self.__status = StatusUpdates(interval=status_interval)
+        self.__loop = ReplicationLoop(self)
+
+        # fills in unchanged TOASTed columns of updates with the value seen last for the row
+        self.__toast_cache: Union[ToastCache, None] = None
+        if toast_cache_size > 0:
+            self.__toast_cache = ToastCache(max_entries=toast_cache_size, max_memory=toast_cache_memory, metrics=self.metrics)
+
+    def __init_metrics(self, metrics_port, metrics_file):
+        # metrics are only collected when they are exported, otherwise every update is a no-op
+        self.metrics, self.__metrics_exporters = create_metrics(port=metrics_port, path=metrics_file)
+        self.qconnector.use_metrics(self.metrics)
+
+        self.__events_total = self.metrics.counter('pgevents_events_total', 'Events published', ['table', 'action'])
+        self.__decode_seconds = self.metrics.histogram('pgevents_decode_seconds', 'Time spent decoding change messages', ['action'])
+        self.__serialize_seconds = self.metrics.histogram('pgevents_serialize_seconds', 'Time spent serializing events')
+        self.__batch_size = self.metrics.histogram('pgevents_batch_size', 'Events published per batch', buckets=SIZE_BUCKETS)
+        self.__wal_end_lsn = self.metrics.gauge('pgevents_wal_end_lsn', 'Server WAL end as of the last message')
+        self.__flushed_lsn = self.metrics.gauge('pgevents_flushed_lsn', 'Last LSN acknowledged as flushed')
+        self.__replication_lag = self.metrics.gauge('pgevents_replication_lag_bytes', 'Server WAL end minus the flushed LSN')
+        self.__adaptive_batch_size = self.metrics.gauge('pgevents_adaptive_batch_size', 'Batch size chosen for the current replication lag')
+
     def __connect_db(self):
         self.__db_conn = psycopg2.connect(
             host=self.__pg_host,
@@ -72,35 +242,89 @@ class EventProducer(ABC):
                 'include-types': True,
                 'include-lsn': True
             }
-            if self.__pg_tables and len(self.__pg_tables) > 0:
-                options['add-tables'] = self.__pg_tables
+            add_tables = self.__table_filter.wal2json_add_tables()
+            if add_tables:
+                options['add-tables'] = add_tables
         else:
             options = {
-                'proto_version': 1,
+                'proto_version': self.__pg_proto_version,
                 'publication_names': self.__pg_publication_name
             }
+            if self.__pg_binary:
+                options['binary'] = 'true'
+            if self.__stream_spool is not None:
+                options['streaming'] = 'on'
 
             decode = False
 
-        logger.info('Creating Replication Slot if not exists...')
-        self.__create_replication_slot()
+        consistent_lsn = 0
+        if self.__pg_backfill:
+            consistent_lsn = self.__create_replication_slot_and_backfill()
+        else:
+            logger.info('Creating Replication Slot if not exists...')
+            self.__create_replication_slot()
 
-        logger.info('Creating Replication Slot if not exists...')
-        self.__create_replication_slot()
+            logger.info('Creating Replication Slot if not exists...')
+            self.__create_replication_slot()
+
+        start_lsn = max(self.__resume_lsn(), consistent_lsn)
 
         logger.debug('options for slot %s', options)
         self.__db_cur.start_replication(
             slot_name=self.__pg_replication_slot,
             options=options,
-            decode=decode
+            decode=decode,
+            start_lsn=start_lsn,
+            status_interval=self.__status.interval
         )
+        self.__status.start(self.__db_cur)
+
+        # while publish waits for the broker the replication connection still gets its status updates
+        self.qconnector.use_wait_callback(self.keepalive)
+
+    def __resume_lsn(self) -> int:
+        """
+        LSN to start replication from. Postgres resumes from the slot's confirmed flush LSN or
+        the given LSN, whichever is later, and skips transactions committed before it.
+        """
+        if self.__pg_persistent_slot:
+            self.__db_cur.execute(
+                "SELECT confirmed_flush_lsn FROM pg_replication_slots WHERE slot_name = %s;",
+                (self.__pg_replication_slot,)
+            )
+            row = self.__db_cur.fetchone()
+            logger.info('Resuming replication slot %s from %s', self.__pg_replication_slot, row[0] if row else None)
+
+        checkpoint_lsn = self.__checkpoint.load() if self.__checkpoint is not None else None
+        if checkpoint_lsn is None:
+            return 0
+
+        logger.info('Skipping transactions committed before checkpoint %s', format_lsn(checkpoint_lsn))
+        return checkpoint_lsn
 
     def connect(self):
         self.qconnector.connect()
+        self.connect_db()
+
+    def connect_db(self):
+        if self.__pg_manage_publication:
+            self.__sync_publication()
 
         logger.info('Connecting to postgres...')
         self.__connect_db()
 
+    def __sync_publication(self):
+        conn = self.__connect_sql_db()
+        try:
+            for publication_name in self.__pg_publication_name.split(','):
+                sync_publication(conn, publication_name, self.__table_filter, self.__table_config)
+        finally:
+            conn.close()
+
+    def fileno(self):
+        """File descriptor of the replication connection, readable when messages arrive"""
+        return self.__db_conn.fileno()
+
     def __create_replication_slot(self) -> None:
         """
         Create a new logical replication slot.
@@ -122,6 +346,93 @@ class EventProducer(ABC):
             raise psycopg2.errors.OperationalError("Operational error during initialization.")
 
 
+    def __create_replication_slot_and_backfill(self) -> int:
+        """
+        Create the replication slot with an exported snapshot and publish the rows of the tables
+        as of that snapshot. Changes committed after it are streamed from the slot, so every row
+        is published exactly once. An existing slot is resumed without a backfill.
+
+        :return: The consistent point of the new slot, 0 if the slot already existed.
+        """
+        try:
+            consistent_point, snapshot_name = create_replication_slot_with_snapshot(
+                self.__db_cur, self.__pg_replication_slot, self.__pg_output_plugin
+            )
+        except psycopg2.errors.DuplicateObject:
+            logger.info('Replication slot %s already exists, skipping backfill', self.__pg_replication_slot)
+            return 0
+
+        logger.info('Replication slot created at %s with snapshot %s', consistent_point, snapshot_name)
+
+        backfill = SnapshotBackfill(
+            connect=self.__connect_sql_db,
+            snapshot_name=snapshot_name,
+            tables=backfill_tables(self.__connect_sql_db, self.__table_filter, self.__pg_publication_name),
+            workers=self.__backfill_workers,
+            type_registry=self.__type_registry,
+            column_actions=self.__column_actions
+        )
+
+        published = 0
+        for table_name, rows in backfill.chunks():
+            key_columns = backfill.key_columns.get(table_name)
+            messages = [self.__snapshot_message(table_name, row, key_columns) for row in rows]
+            messages = [message for message in messages if message is not None]
+            if messages:
+                self.publish_batch(messages=messages)
+                published += len(messages)
+            self.check_shutdown()
+
+        logger.info('Backfill published %s events', published)
+        return parse_lsn(consistent_point)
+
+    def __connect_sql_db(self):
+        return psycopg2.connect(
+            host=self.__pg_host,
+            port=self.__pg_port,
+            dbname=self.__pg_database,
+            user=self.__pg_user,
+            password=self.__pg_password
+        )
+
+    def __binary_converters(self, schema: dict):
+        """Binary readers of a relation, types that aren't built in are looked up in pg_type once"""
+        unknown = unknown_binary_types(schema, self.__binary_types)
+
+        if unknown:
+            # types that can't be resolved are sent as hex and not looked up again
+            self.__binary_types.update({type_id: binary_to_hex for type_id in unknown})
+            try:
+                conn = self.__connect_sql_db()
+                try:
+                    with conn.cursor() as cur:
+                        self.__binary_types.update(resolve_binary_types(cur, unknown))
+                finally:
+                    conn.close()
+            except psycopg2.Error as e:
+                logger.error('Error looking up the types of %s: %s', schema['table_name'], e)
+
+        return binary_column_converters(schema, self.__binary_types)
+
+    def __snapshot_message(self, table_name, row, key_columns=None):
+        """Routing key and payload of a backfilled row, None if it is not to be published"""
+        event = snapshot_event(table_name, row, self.__backfill_action, key_columns)
+        self.__events_total.labels(table_name, self.__backfill_action).inc()
+
+        if self.__pg_output_plugin != 'wal2json':
+            envelope = self.__snapshot_envelopes.get(table_name)
+            if envelope is None:
+                envelope = self.__snapshot_envelopes[table_name] = self.__envelope(table_name, list(row))
+            return self.__routing_key(table_name, event), envelope.dumps(shape_event(event, self.__shape_of(table_name)))
+
+        base_event: BaseEvent = self.event_cls()
+        base_event.from_dict(event)
+        routing_key, modified_event = self.get_event_routing_key_and_event(table_name, base_event)
+        if routing_key is None:
+            return None
+
+        return routing_key, self.__serializer.dumps(shape_event(modified_event.to_dict(), self.__shape_of(table_name)))
+
     def __drop_replication_slot(self):
         conn = psycopg2.connect(
             host=self.__pg_host,
@@ -142,102 +453,459 @@ class EventProducer(ABC):
 
 
     def wal2json_msg_processor(self, msg):
-        pl = json.loads(msg.payload)
+        pl = loads(msg.payload)
 
-        if pl['action'] in ['I', 'U', 'D']:
+        if pl['action'] in ['I', 'U', 'D'] and self.__wal2json_table_included(pl):
             table_name = f"{pl['schema']}.{pl['table']}"
 
+            # the event is loaded from the parsed payload, it is only parsed once
             event: BaseEvent = self.event_cls()
-            event.load_wal2json_payload(msg.payload)
+            event.load_wal2json_payload(pl)
 
             modified_event: BaseEvent
             event_routing_key, modified_event = self.get_event_routing_key_and_event(table_name, event)
 
             # If no routing key is provided, then the event will not be queued
             if event_routing_key is not None:
-                payload = modified_event.to_dict()
-                json_payload = json.dumps(payload)
-                self.publish(
+                payload = shape_event(modified_event.to_dict(), self.__shape_of(table_name))
+                with self.__serialize_seconds.time():
+                    body = self.__serializer.dumps(payload)
+                self.__events_total.labels(table_name, pl['action']).inc()
+                self.__dispatch(
                     routing_key=event_routing_key,
-                    payload=json_payload
+                    payload=body,
+                    msg=msg
                 )
 
-        msg.cursor.send_feedback(flush_lsn=msg.data_start)
+        self.__acknowledge(msg)
         self.check_shutdown()
 
+    def __wal2json_table_included(self, pl) -> bool:
+        table_name = f"{pl['schema']}.{pl['table']}"
+
+        included = self.__wal2json_included.get(table_name)
+        if included is None:
+            included = self.__wal2json_included[table_name] = self.__table_filter.matches(table_name)
+
+        return included
+
     def pgoutput_msg_processor(self, msg):
         message_type = msg.payload[:1].decode('utf-8')
 
-        if message_type == 'R':
-            logger.debug(f'Received R message with lsn: {msg.data_start}')
+        if self.__stream_spool is not None and self.__stream_msg_processor(message_type, msg):
+            self.check_shutdown()
+            return
+
+        if self.__transaction is not None and message_type in ['B', 'C']:
+            self.__transaction_msg_processor(message_type, msg)
+            self.check_shutdown()
+            return
 
-            parser = RelationMessage(table_name=None, message=msg.payload, schema=None)
-            parsed_message = parser.decode_relation_message()
-            self.__table_schemas[parsed_message['relation_id']] = parsed_message
+        if message_type == 'R':
+            self.__relation_msg_processor(msg)
 
         if message_type in ['I', 'U', 'D']:
             relation_id = parser_utils.convert_bytes_to_int(msg.payload[1:5])
 
-            schema = self.__table_schemas[relation_id]
-            table_name = self.__table_schemas[relation_id]['table_name']
-
-            if table_name in self.__pg_tables or '.*' in self.__pg_tables:
-                logger.debug(f'Received {message_type} message with lsn: {msg.data_start} for table: {table_name}')
-                
-                parsed_message = None
-
-                #commenting this part as a temporary fix, will make this more configurable in the future.
-
-                # if message_type == 'I':
-                #     logger.debug(f'INSERT Message, Message Type: {message_type} - {table_name}')
-                #     parser = InsertMessage(table_name=table_name, message=msg.payload, schema=schema)
-                #     parsed_message = parser.decode_insert_message()
-
-                if message_type == 'U':
-                    logger.debug(f'UPDATE Message, Message Type: {message_type} - {table_name}')
-                    parser = UpdateMessage(table_name=table_name, message=msg.payload, schema=schema)
-                    parsed_message = parser.decode_update_message()
-
-                elif message_type == 'D':
-                    logger.debug(f'DELETE Message, Message Type: {message_type} - {table_name}')
-                    parser = DeleteMessage(table_name=table_name, message=msg.payload, schema=schema)
-                    parsed_message = parser.decode_delete_message()
-
-                if parsed_message:
-                    routing_key = f"{self.__pg_database}.{table_name}"
-                    self.publish(
-                        routing_key=routing_key,
-                        payload=json.dumps(parsed_message)
-                    )
-                    logger.debug(f'Published message to queue: {parsed_message}')
-                    logger.debug(f'Ack: Message {message_type} with lsn: {msg.data_start} for table: {table_name}')
-                else:
-                    logger.warning(f'Skipping dummy updates on table: {table_name}')
+            plan = self.__decode_plans[relation_id]
 
-        msg.cursor.send_feedback(flush_lsn=msg.data_start)
-        self.check_shutdown()
+            # changes of filtered out relations are dropped before anything is decoded
+            if plan.included:
+                logger.debug('Received %s message with lsn: %s for table: %s', message_type, msg.data_start,
+                             self.__table_schemas[relation_id]['table_name'])
 
-    def start_consuming(self):
-        def stream_consumer(msg):
-            try:
-                if self.__shutdown:
-                    logger.info('Shutdown requested, stopping consumer')
+                if self.__pipeline is not None and message_type in ['U', 'D']:
+                    self.__pipeline.submit_change(msg, relation_id, message_type, bytes(msg.payload))
+                    self.__acknowledge(msg)
+                    self.check_shutdown()
                     return
 
-                if self.__pg_output_plugin == 'wal2json':
-                    self.wal2json_msg_processor(msg=msg)
+                self.__change_msg_processor(message_type, msg, relation_id, plan)
+
+        # inside a transaction the flush LSN only moves at its commit
+        if not self.__in_transaction():
+            self.__acknowledge(msg)
+        self.check_shutdown()
+
+    def __relation_msg_processor(self, msg):
+        logger.debug('Received R message with lsn: %s', msg.data_start)
+
+        parsed_message = self.__decoder.decode_relation_message(msg.payload)
+        relation_id, table_name = parsed_message['relation_id'], parsed_message['table_name']
+
+        self.__table_schemas[relation_id] = parsed_message
+        self.__decode_plans[relation_id] = DecodePlan(
+            converters=self.__type_registry.column_converters(parsed_message),
+            binary_converters=self.__binary_converters(parsed_message) if self.__pg_binary else None,
+            included=self.__table_filter.matches(table_name),
+            actions=self.__column_actions(parsed_message),
+            shape=self.__shape_of(table_name)
+        )
+        self.__envelopes[relation_id] = self.__envelope(table_name, [column['name'] for column in parsed_message['columns']])
+
+        if self.__pipeline is not None:
+            self.__pipeline.relation(
+                relation_id, self.__decoder, table_name, parsed_message, self.__decode_plans[relation_id],
+                f"{self.__pg_database}.{table_name}", self.qconnector.encoder, self.__routing_key_buckets,
+                self.__envelopes[relation_id]
+            )
+
+    def __change_msg_processor(self, message_type, msg, relation_id, plan):
+        schema = self.__table_schemas[relation_id]
+        table_name = schema['table_name']
+        parsed_message = None
+
+        #commenting this part as a temporary fix, will make this more configurable in the future.
+
+        # if message_type == 'I':
+        #     logger.debug(f'INSERT Message, Message Type: {message_type} - {table_name}')
+        #     parsed_message = self.__decoder.decode_insert_message(table_name, msg.payload, schema, plan)
+
+        if message_type == 'U':
+            logger.debug('UPDATE Message, Message Type: %s - %s', message_type, table_name)
+            with self.__decode_seconds.labels(message_type).time():
+                parsed_message = self.__decoder.decode_update_message(table_name, msg.payload, schema, plan)
+
+        elif message_type == 'D':
+            logger.debug('DELETE Message, Message Type: %s - %s', message_type, table_name)
+            with self.__decode_seconds.labels(message_type).time():
+                parsed_message = self.__decoder.decode_delete_message(table_name, msg.payload, schema, plan)
+
+        if not parsed_message:
+            logger.warning('Skipping dummy updates on table: %s', table_name)
+            return
+
+        if self.__toast_cache is not None:
+            self.__toast_cache.apply(relation_id, parsed_message, [column['name'] for column in schema['columns']])
+
+        shape_event(parsed_message, plan.shape)
+        routing_key = self.__routing_key(table_name, parsed_message)
+        self.__events_total.labels(table_name, message_type).inc()
+        if self.__in_transaction():
+            self.__publish_transaction_part(self.__transaction.add(routing_key, parsed_message))
+        else:
+            with self.__serialize_seconds.time():
+                payload = self.__envelopes[relation_id].dumps(parsed_message)
+            self.__dispatch(
+                routing_key=routing_key,
+                payload=payload,
+                msg=msg
+            )
+        logger.debug('Published message to queue: %s', parsed_message)
+        logger.debug('Ack: Message %s with lsn: %s for table: %s', message_type, msg.data_start, table_name)
+
+    def __envelope(self, table_name, columns):
+        """Serializer of the events of a table, in compact format its schema is published first"""
+        if self.__wire_format != COMPACT:
+            return self.__serializer
+
+        template = CompactTemplate(self.__serializer, table_name, columns)
+
+        # consumers bound to a single bucket need the schema as well
+        routing_key = f"{self.__pg_database}.{table_name}"
+        routing_keys = [f"{routing_key}.{bucket}" for bucket in range(self.__routing_key_buckets)] or [routing_key]
+        for routing_key in routing_keys:
+            self.publish(routing_key=routing_key, payload=template.schema_message())
+
+        return template
+
+    def __routing_key(self, table_name, event):
+        routing_key = f"{self.__pg_database}.{table_name}"
+        if self.__routing_key_buckets:
+            routing_key = f"{routing_key}.{key_hash_bucket(event['id'], self.__routing_key_buckets)}"
+
+        return routing_key
+
+    def __shape_of(self, table_name):
+        config = self.__table_config.get(table_name)
+        if config is None or config.shape is None:
+            return self.__event_shape
+
+        return config.shape
+
+    def __column_actions(self, schema):
+        """Projection and redaction of the table config, compiled for the columns of a relation"""
+        config = self.__table_config.get(schema['table_name'])
+        if config is None:
+            return None
+
+        # with replica identity full every column is flagged as a key, only the id column is kept then
+        key_columns = None
+        if schema.get('replica_identity') != REPLICA_IDENTITY_FULL:
+            key_columns = schema.get('key_columns')
+
+        return column_actions(
+            [column['name'] for column in schema['columns']],
+            include=config.include, exclude=config.exclude, redact=config.redact, hash=config.hash,
+            key_columns=key_columns
+        )
+
+    def __in_transaction(self) -> bool:
+        return self.__transaction is not None and self.__transaction.in_progress
+
+    def __transaction_msg_processor(self, message_type, msg):
+        if message_type == 'B':
+            final_lsn, commit_ts, xid = BEGIN.unpack_from(msg.payload, 1)
+            self.__transaction.begin(xid, commit_ts, final_lsn)
+            return
+
+        _, commit_lsn, end_lsn, commit_ts = COMMIT.unpack_from(msg.payload, 1)
+        self.__publish_transaction(msg, commit_lsn, end_lsn, commit_ts)
+
+    def __publish_transaction(self, msg, commit_lsn, end_lsn, commit_ts):
+        """Publish the events of a committed transaction together and acknowledge its end LSN"""
+        messages = self.__transaction.commit(commit_lsn, commit_ts)
+
+        if messages:
+            if self.__batcher is not None:
+                for routing_key, payload in messages:
+                    self.__batcher.add(routing_key, payload, msg.data_start)
+            else:
+                self.publish_batch(messages=messages)
+            self.__batch_size.observe(len(messages))
+            logger.debug('Published %s messages for transaction with lsn: %s', len(messages), commit_lsn)
+
+        self.__acknowledge(msg, lsn=end_lsn)
+
+    def __publish_transaction_part(self, messages):
+        """
+        Publish a part of a transaction too large to hold in memory. The flush LSN stays before
+        the transaction until its commit, after a restart it is published again from its start.
+        """
+        if not messages:
+            return
+
+        # batched events of earlier transactions go first, they are acknowledged with them
+        if self.__batcher is not None:
+            self.flush_batch()
+
+        self.publish_batch(messages=messages)
+        self.__batch_size.observe(len(messages))
+        logger.info('Published a part of %s messages of a large transaction', len(messages))
+
+    def __stream_msg_processor(self, message_type, msg) -> bool:
+        """
+        Handle the messages of streamed in-progress transactions. Changes sent between stream
+        start and stop are spooled until their transaction commits and are then processed like
+        any other change.
+
+        :return: False when the message is not part of a stream and has to be processed as usual.
+        """
+        if message_type == 'S':
+            self.__streaming_xid = STREAM_XID.unpack_from(msg.payload, 1)[0]
+            return True
+
+        if message_type == 'E':
+            self.__streaming_xid = None
+            return True
+
+        if message_type == 'A':
+            xid, subxid = STREAM_ABORT.unpack_from(msg.payload, 1)
+            self.__stream_spool.abort(xid, subxid)
+            self.__acknowledge(msg)
+            return True
+
+        if message_type == 'c':
+            xid, _, commit_lsn, end_lsn, commit_ts = STREAM_COMMIT.unpack_from(msg.payload, 1)
+            logger.debug('Received stream commit for transaction %s with lsn: %s', xid, commit_lsn)
+
+            if self.__transaction is not None:
+                self.__transaction.begin(xid, commit_ts, commit_lsn)
+
+            for lsn, payload in self.__stream_spool.commit(xid):
+                self.pgoutput_msg_processor(SpooledMessage(payload=payload, data_start=lsn, cursor=msg.cursor))
+
+            if self.__transaction is not None:
+                self.__publish_transaction(msg, commit_lsn, end_lsn, commit_ts)
+            else:
+                self.__acknowledge(msg, lsn=end_lsn)
+            return True
+
+        if self.__streaming_xid is not None:
+            # changes inside a stream carry the id of their (sub)transaction after the message type
+            subxid = STREAM_XID.unpack_from(msg.payload, 1)[0]
+            payload = bytes(msg.payload[:1]) + bytes(msg.payload[5:])
+            self.__stream_spool.append(self.__streaming_xid, subxid, msg.data_start, payload)
+            return True
+
+        return False
+
+    def __dispatch(self, routing_key, payload, msg):
+        """Publish an event right away, or buffer it when batching is enabled"""
+        if self.__batcher is not None:
+            self.__batcher.add(routing_key, payload, msg.data_start)
+            return
+
+        sequence = self.publish(routing_key=routing_key, payload=payload)
+        if self.__lsn_tracker is not None:
+            self.__lsn_tracker.published(sequence, msg.data_start)
+
+    def __acknowledge(self, msg, lsn=None):
+        """
+        Move the flush LSN forward, unless it has to wait for a pending batch or publisher confirms.
+
+        :param lsn: LSN to acknowledge instead of the start of the message.
+        """
+        lsn = msg.data_start if lsn is None else lsn
+        self.__status.apply_lsn = lsn
+
+        if self.__pipeline is not None:
+            # acknowledged in order once every event queued before it is published
+            self.__pipeline.mark(msg, lsn)
+        elif self.__batcher is not None and len(self.__batcher):
+            self.__batcher.mark(lsn)
+        elif self.__lsn_tracker is not None:
+            self.__lsn_tracker.processed(lsn)
+            self.flush_confirmed()
+        else:
+            self.__send_feedback(msg.cursor, lsn)
+
+    def __send_feedback(self, cursor, lsn):
+        cursor.send_feedback(flush_lsn=lsn)
+        self.__status.flush_lsn = lsn
+        self.__flushed_lsn.set(lsn)
+
+        if self.__checkpoint is not None:
+            self.__checkpoint.update(lsn)
+
+    def __drain_pipeline(self, wait=False):
+        """Publish finished pipeline events and acknowledge LSNs, strictly in the order they were queued"""
+        for msg, lsn, future in self.__pipeline.completed(wait=wait):
+            if future is None:
+                if self.__lsn_tracker is not None:
+                    self.__lsn_tracker.processed(lsn)
+                    self.flush_confirmed()
                 else:
-                    self.pgoutput_msg_processor(msg=msg)
-            
+                    self.__send_feedback(msg.cursor, lsn)
+                continue
+
+            # a failed change is logged and skipped, exactly like one handled inline by __handle_message
+            try:
+                encoded = future.result()
+                if encoded is not None:
+                    routing_key, body, content_encoding = encoded
+                    sequence = self.publish_encoded(routing_key=routing_key, body=body, content_encoding=content_encoding)
+                    if self.__lsn_tracker is not None:
+                        self.__lsn_tracker.published(sequence, msg.data_start)
             except Exception as e:
-                logger.error(f'Error processing message: {e}', exc_info=True)
+                logger.error('Error processing message: %s', e, exc_info=True)
                 if self.__shutdown:
                     raise
-            finally:
-                self.check_shutdown()
 
+    @property
+    def confirms_pending(self) -> bool:
+        """Published events are waiting for publisher confirms before their LSNs can be acknowledged"""
+        return self.__lsn_tracker is not None and len(self.__lsn_tracker) > 0
+
+    def flush_confirmed(self):
+        """Acknowledge the LSNs whose events the broker confirmed"""
+        flush_lsn = self.__lsn_tracker.flushable(self.qconnector.confirmed_sequence)
+        if flush_lsn is not None:
+            self.__send_feedback(self.__db_cur, flush_lsn)
+
+    def flush_batch(self):
+        """Publish all buffered events and only then acknowledge the highest LSN they cover"""
+        events, highest_lsn = self.__batcher.drain()
+
+        if events:
+            self.publish_batch(messages=events)
+            self.__batch_size.observe(len(events))
+            logger.debug('Published batch of %s events up to lsn: %s', len(events), highest_lsn)
+
+        if highest_lsn is not None:
+            self.__send_feedback(self.__db_cur, highest_lsn)
+
+    def __handle_message(self, msg):
         try:
-            self.__db_cur.consume_stream(consume=stream_consumer)
+            if self.__shutdown:
+                logger.info('Shutdown requested, stopping consumer')
+                return
+
+            if self.metrics.enabled:
+                self.__record_lag(msg)
+
+            if self.__lag_controller is not None:
+                self.__lag_controller.observe(msg.wal_end, msg.data_start)
+                self.__adapt()
+
+            if self.__pg_output_plugin == 'wal2json':
+                self.wal2json_msg_processor(msg=msg)
+            else:
+                self.pgoutput_msg_processor(msg=msg)
+
+        except Exception as e:
+            logger.error(f'Error processing message: {e}', exc_info=True)
+            if self.__shutdown:
+                raise
+        finally:
+            self.check_shutdown()
+
+    def __record_lag(self, msg):
+        self.__wal_end_lsn.set(msg.wal_end)
+        if self.__status.flush_lsn is not None:
+            self.__replication_lag.set(max(msg.wal_end - self.__status.flush_lsn, 0))
+
+    def __adapt(self):
+        """Apply the batching the lag controller chose for the current replication lag"""
+        controller = self.__lag_controller
+
+        if self.__batcher is not None:
+            self.__batcher.max_size = controller.batch_size
+            self.__batcher.max_linger_ms = controller.linger_ms
+            self.__adaptive_batch_size.set(controller.batch_size)
+
+        if self.__pipeline is not None:
+            self.__pipeline.max_pending = controller.pending
+
+    def keepalive(self):
+        """Send a standby status update once status_interval passed since the last one"""
+        self.__status.keepalive()
+
+    def read_stream_once(self, wait: bool = True) -> bool:
+        """
+        Read and process the next replication message if one is available, then flush what is due.
+
+        :param wait: Wait for the pipeline workers once the stream is idle, callers that can't block
+            wait for pipeline_future() themselves.
+        :return: False when no message was available and the stream is idle.
+        """
+        msg = self.__db_cur.read_message()
+
+        if msg:
+            self.__status.write_lsn = msg.data_start
+            self.__handle_message(msg)
+        elif self.__lag_controller is not None:
+            self.__lag_controller.caught_up()
+            self.__adapt()
+
+        if self.__pipeline is not None:
+            self.__drain_pipeline(wait=wait and msg is None)
+
+        if self.__batcher is not None and self.__batcher.should_flush(idle=msg is None):
+            self.flush_batch()
+            self.check_shutdown()
+
+        if msg is None and self.confirms_pending:
+            self.flush_confirmed()
+
+        self.keepalive()
+        return msg is not None
+
+    def pipeline_future(self):
+        """Future of the oldest event the pipeline is still encoding, None when none holds the stream back"""
+        return self.__pipeline.running() if self.__pipeline is not None else None
+
+    def idle_timeout(self) -> float:
+        """Seconds an idle replication loop may wait for the next message"""
+        if self.confirms_pending:
+            return CONFIRM_POLL_TIMEOUT
+
+        timeout = self.__batcher.time_left() if self.__batcher is not None else None
+        return IDLE_POLL_TIMEOUT if timeout is None else timeout
+
+    def start_consuming(self):
+        try:
+            self.__loop.run()
         except Exception as e:
             if self.__shutdown:
                 logger.info('Shutting down gracefully')
@@ -248,7 +916,13 @@ class EventProducer(ABC):
         return table_name, event
 
     def publish(self, **kwargs):
-        self.qconnector.publish(**kwargs)
+        return self.qconnector.publish(**kwargs)
+
+    def publish_batch(self, messages):
+        self.qconnector.publish_batch(messages)
+
+    def publish_encoded(self, **kwargs):
+        return self.qconnector.publish_encoded(**kwargs)
 
     def shutdown(self):
         """Gracefully shutdown the producer"""
@@ -263,16 +937,38 @@ class EventProducer(ABC):
             except Exception as e:
                 logger.error(f'Error closing database connection: {e}')
 
-        try:
-            self.__drop_replication_slot()
-        except Exception as e:
-            logger.error(f'Error dropping replication slot: {e}')
+        if self.__pipeline is not None:
+            self.__pipeline.shutdown()
+
+        for exporter in self.__metrics_exporters:
+            try:
+                exporter.stop()
+            except Exception as e:
+                logger.error(f'Error stopping metrics exporter: {e}')
+
+        if self.__checkpoint is not None:
+            try:
+                self.__checkpoint.save()
+            except Exception as e:
+                logger.error(f'Error saving LSN checkpoint: {e}')
+
+        if self.__pg_persistent_slot:
+            logger.info('Keeping replication slot %s', self.__pg_replication_slot)
+        else:
+            try:
+                self.__drop_replication_slot()
+            except Exception as e:
+                logger.error(f'Error dropping replication slot: {e}')
 
         try:
             self.qconnector.shutdown()
         except Exception as e:
             logger.error(f'Error shutting down queue connection: {e}')
 
+    @property
+    def shutdown_requested(self) -> bool:
+        return self.__shutdown
+
     def check_shutdown(self):
         """Check if shutdown was requested and raise SystemExit if true"""
         self.qconnector.check_shutdown()
@@ -0,0 +1,66 @@
+import math
+from typing import Union
+
+
+# Below this many bytes behind the server's WAL end events are published one at a time
+DEFAULT_LOW_LAG = 1024 * 1024
+
+# From this many bytes behind on batches, linger time and pending work are at their maximum
+DEFAULT_HIGH_LAG = 1024 * 1024 * 1024
+
+
+class LagController:
+    """
+    Adapts batching to how far the producer is behind the server's WAL end.
+
+    Caught up, events are published one at a time without lingering for the lowest latency.
+    The further behind, the larger the batches, the longer they may linger and the more work
+    may be pending on the encoding pipeline, up to the configured maximums. The lag is scaled
+    logarithmically between low_lag and high_lag, it spans several orders of magnitude.
+    """
+
+    def __init__(self, max_batch_size: int = 1, max_linger_ms: int = 0, max_pending: Union[int, None] = None,
+                 min_pending: int = 1, low_lag: int = DEFAULT_LOW_LAG, high_lag: int = DEFAULT_HIGH_LAG):
+        if not 0 < low_lag < high_lag:
+            raise ValueError('The low lag has to be positive and below the high lag')
+
+        self.max_batch_size = max_batch_size
+        self.max_linger_ms = max_linger_ms
+        self.max_pending = max_pending
+        self.min_pending = min_pending
+        self.low_lag = low_lag
+        self.high_lag = high_lag
+
+        self.lag = 0
+        self.level = 0.0
+
+    def observe(self, wal_end: int, lsn: int) -> None:
+        """Record the server's WAL end as of a message and the LSN of that message"""
+        self.lag = max(wal_end - lsn, 0) if wal_end else 0
+
+        if self.lag <= self.low_lag:
+            self.level = 0.0
+        elif self.lag >= self.high_lag:
+            self.level = 1.0
+        else:
+            self.level = math.log(self.lag / self.low_lag) / math.log(self.high_lag / self.low_lag)
+
+    def caught_up(self) -> None:
+        """The replication stream has nothing more to read"""
+        self.lag = 0
+        self.level = 0.0
+
+    @property
+    def batch_size(self) -> int:
+        return 1 + round((self.max_batch_size - 1) * self.level)
+
+    @property
+    def linger_ms(self) -> int:
+        return round(self.max_linger_ms * self.level)
+
+    @property
+    def pending(self) -> Union[int, None]:
+        if self.max_pending is None:
+            return None
+
+        return self.min_pending + round((self.max_pending - self.min_pending) * self.level)
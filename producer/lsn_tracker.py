@@ -0,0 +1,42 @@
+from collections import deque
+from typing import Union
+
+
+class LsnTracker:
+    """
+    Maps publisher confirm sequence numbers back to replication LSNs.
+
+    LSNs are recorded in the order they were received, either with the sequence number of the
+    event published for them or without one when nothing was published. The flush LSN may only
+    move up to the last LSN whose events, and those of every earlier LSN, are confirmed.
+    """
+
+    def __init__(self):
+        self.__pending = deque()
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def published(self, sequence: Union[int, None], lsn: int) -> None:
+        self.__pending.append((sequence, lsn))
+
+    def processed(self, lsn: int) -> None:
+        self.__pending.append((None, lsn))
+
+    def flushable(self, confirmed_sequence: Union[int, None]) -> Union[int, None]:
+        """
+        Forget every LSN that is fully confirmed and return the highest one, None if the
+        flush LSN can't move forward.
+        """
+        flush_lsn = None
+
+        while self.__pending:
+            sequence, lsn = self.__pending[0]
+
+            if sequence is not None and (confirmed_sequence is None or sequence > confirmed_sequence):
+                break
+
+            self.__pending.popleft()
+            flush_lsn = lsn
+
+        return flush_lsn
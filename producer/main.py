@@ -19,11 +19,52 @@ logger = log.get_logger(__name__)
 @click.option('--pg_password', default=lambda: os.environ.get('PGPASSWORD', None), required=True, help='Postgresql Password ($PGPASSWORD)')
 @click.option('--pg_replication_slot', default=lambda: os.environ.get('PGREPLICATIONSLOT', None), required=True, help='Postgresql Replication Slot Name ($PGREPLICATIONSLOT)')
 @click.option('--pg_output_plugin', default=lambda: os.environ.get('PGOUTPUTPLUGIN', 'wal2json'), required=True, help='Postgresql Output Plugin ($PGOUTPUTPLUGIN)')
-@click.option('--pg_tables', default=lambda: os.environ.get('PGTABLES', None), required=False, help='Restrict to specific tables e.g. public.transactions,public.reports')
+@click.option('--pg_tables', default=lambda: os.environ.get('PGTABLES', None), required=False, help='Restrict to specific tables e.g. public.transactions,public.reports, schema wildcards like public.*, globs like public.user_* or regular expressions like re:public\\.orders_\\d+ ($PGTABLES)')
 @click.option('--pg_publication_name', default=lambda: os.environ.get('PGPUBLICATION', None), required=False, help='Restrict to specific publications e.g. events')
+@click.option('--pg_output_decoder', default=lambda: os.environ.get('PGOUTPUTDECODER', 'bytesio'), required=False, type=click.Choice(['bytesio', 'memoryview']), help='Decoder engine for pgoutput messages ($PGOUTPUTDECODER)')
+@click.option('--pg_typed_values', default=lambda: os.environ.get('PGTYPEDVALUES', None), required=False, help='Convert values of these types to native values e.g. int4,int8,bool,jsonb or all ($PGTYPEDVALUES)')
+@click.option('--pg_proto_version', default=lambda: os.environ.get('PGPROTOVERSION', 1), required=False, type=int, help='pgoutput protocol version ($PGPROTOVERSION)')
+@click.option('--pg_binary', default=lambda: os.environ.get('PGBINARY', 'false').lower() == 'true', required=False, type=bool, help='Receive pgoutput values in binary format, needs postgres >= 14 ($PGBINARY)')
+@click.option('--pg_streaming', default=lambda: os.environ.get('PGSTREAMING', 'false').lower() == 'true', required=False, type=bool, help='Stream large in-progress transactions, needs postgres >= 14 ($PGSTREAMING)')
+@click.option('--stream_spool_memory', default=lambda: os.environ.get('STREAMSPOOLMEMORY', 8 * 1024 * 1024), required=False, type=int, help='Bytes of a streamed transaction kept in memory before spooling to disk ($STREAMSPOOLMEMORY)')
+@click.option('--transaction_mode', default=lambda: os.environ.get('TRANSACTIONMODE', None), required=False, type=click.Choice(['envelope', 'batch']), help='Publish the events of a transaction together, one envelope per table or one batch ($TRANSACTIONMODE)')
+@click.option('--transaction_max_events', default=lambda: os.environ.get('TRANSACTIONMAXEVENTS', 10000), required=False, type=int, help='Events of a transaction held in memory in transaction mode, larger transactions are published in parts ($TRANSACTIONMAXEVENTS)')
+@click.option('--publish_batch_size', default=lambda: os.environ.get('PUBLISHBATCHSIZE', 1), required=False, type=int, help='Publish events in batches of up to this size, 1 disables batching ($PUBLISHBATCHSIZE)')
+@click.option('--publish_linger_ms', default=lambda: os.environ.get('PUBLISHLINGERMS', 0), required=False, type=int, help='Max time an event waits for its batch to fill up, 0 flushes when the stream is idle ($PUBLISHLINGERMS)')
+@click.option('--pipeline_workers', default=lambda: os.environ.get('PIPELINEWORKERS', 0), required=False, type=int, help='Decode, serialize and compress events on this many workers, 0 does it inline ($PIPELINEWORKERS)')
+@click.option('--pipeline_executor', default=lambda: os.environ.get('PIPELINEEXECUTOR', 'process'), required=False, type=click.Choice(['thread', 'process']), help='Run pipeline workers as threads or processes ($PIPELINEEXECUTOR)')
+@click.option('--publisher_confirms', default=lambda: os.environ.get('PUBLISHERCONFIRMS', 'false').lower() == 'true', required=False, type=bool, help='Only acknowledge LSNs once RabbitMQ confirmed their events ($PUBLISHERCONFIRMS)')
+@click.option('--max_inflight', default=lambda: os.environ.get('MAXINFLIGHT', 1000), required=False, type=int, help='Max number of unconfirmed messages with publisher confirms ($MAXINFLIGHT)')
+@click.option('--compression_codec', default=lambda: os.environ.get('COMPRESSIONCODEC', 'br'), required=False, type=click.Choice(['identity', 'br', 'deflate', 'zstd']), help='Codec used to compress events ($COMPRESSIONCODEC)')
+@click.option('--compression_level', default=lambda: os.environ.get('COMPRESSIONLEVEL', None), required=False, type=int, help='Compression level, defaults depend on the codec ($COMPRESSIONLEVEL)')
+@click.option('--compression_min_size', default=lambda: os.environ.get('COMPRESSIONMINSIZE', 0), required=False, type=int, help='Events smaller than this many bytes are sent uncompressed ($COMPRESSIONMINSIZE)')
+@click.option('--pg_persistent_slot', default=lambda: os.environ.get('PGPERSISTENTSLOT', 'false').lower() == 'true', required=False, type=bool, help='Keep the replication slot on shutdown and resume from it, drop it with drop_slot ($PGPERSISTENTSLOT)')
+@click.option('--lsn_checkpoint_file', default=lambda: os.environ.get('LSNCHECKPOINTFILE', None), required=False, help='Checkpoint the last acknowledged LSN to this file and resume from it ($LSNCHECKPOINTFILE)')
+@click.option('--pg_backfill', default=lambda: os.environ.get('PGBACKFILL', 'false').lower() == 'true', required=False, type=bool, help='Publish the existing rows of the tables when the replication slot is created ($PGBACKFILL)')
+@click.option('--backfill_workers', default=lambda: os.environ.get('BACKFILLWORKERS', 4), required=False, type=int, help='Number of parallel COPY workers of the backfill ($BACKFILLWORKERS)')
+@click.option('--backfill_action', default=lambda: os.environ.get('BACKFILLACTION', 'S'), required=False, type=click.Choice(['S', 'I']), help='Action of backfilled events, S for snapshot or I for insert ($BACKFILLACTION)')
+@click.option('--pg_manage_publication', default=lambda: os.environ.get('PGMANAGEPUBLICATION', 'false').lower() == 'true', required=False, type=bool, help='Create or alter the publication to publish pg_tables, with the filters of the table config ($PGMANAGEPUBLICATION)')
+@click.option('--table_config', default=lambda: os.environ.get('PGTABLECONFIG', None), required=False, help='JSON file, or JSON, with per table row filters, column lists, projection and redaction e.g. {"public.users": {"where": "org_id = 42", "exclude": ["avatar"], "hash": ["email"]}} ($PGTABLECONFIG)')
+@click.option('--toast_cache_size', default=lambda: os.environ.get('TOASTCACHESIZE', 0), required=False, type=int, help='Fill unchanged TOASTed columns of updates in from a cache of up to this many values, 0 disables it ($TOASTCACHESIZE)')
+@click.option('--toast_cache_memory', default=lambda: os.environ.get('TOASTCACHEMEMORY', 64 * 1024 * 1024), required=False, type=int, help='Approximate bytes of values the TOAST cache may hold ($TOASTCACHEMEMORY)')
+@click.option('--routing_key_buckets', default=lambda: os.environ.get('ROUTINGKEYBUCKETS', 0), required=False, type=int, help='Append a hash bucket of the event id to routing keys, e.g. db.public.users.3, 0 disables it ($ROUTINGKEYBUCKETS)')
+@click.option('--serializer', default=lambda: os.environ.get('SERIALIZER', 'json'), required=False, type=click.Choice(['json', 'orjson', 'msgpack']), help='Serializer of events, consumers pick it up from the content type ($SERIALIZER)')
+@click.option('--wire_format', default=lambda: os.environ.get('WIREFORMAT', 'envelope'), required=False, type=click.Choice(['envelope', 'compact']), help='compact sends column values by position, referencing a schema message of the table ($WIREFORMAT)')
+@click.option('--event_shape', default=lambda: os.environ.get('EVENTSHAPE', 'full'), required=False, type=click.Choice(['full', 'new+diff', 'diff-only', 'key-only']), help='Sections of events that are published, the shape of the table config takes precedence ($EVENTSHAPE)')
+@click.option('--adaptive_batching', default=lambda: os.environ.get('ADAPTIVEBATCHING', 'false').lower() == 'true', required=False, type=bool, help='Grow batches, linger time and pending pipeline work with the replication lag up to the configured values, publish single events when caught up ($ADAPTIVEBATCHING)')
+@click.option('--lag_low_bytes', default=lambda: os.environ.get('LAGLOWBYTES', 1024 * 1024), required=False, type=int, help='Replication lag below which events are published one at a time ($LAGLOWBYTES)')
+@click.option('--lag_high_bytes', default=lambda: os.environ.get('LAGHIGHBYTES', 1024 * 1024 * 1024), required=False, type=int, help='Replication lag from which batching is at its maximum ($LAGHIGHBYTES)')
+@click.option('--status_interval', default=lambda: os.environ.get('STATUSINTERVAL', 10), required=False, type=int, help='Seconds between standby status updates sent to postgres, keep it below wal_sender_timeout ($STATUSINTERVAL)')
+@click.option('--metrics_port', default=lambda: os.environ.get('METRICSPORT', None), required=False, type=int, help='Serve Prometheus metrics on this port at /metrics ($METRICSPORT)')
+@click.option('--metrics_file', default=lambda: os.environ.get('METRICSFILE', None), required=False, help='Write Prometheus metrics to this file periodically ($METRICSFILE)')
 @click.option('--rabbitmq_url', default=lambda: os.environ.get('RABBITMQ_URL', None), required=True, help='RabbitMQ url ($RABBITMQ_URL)')
 @click.option('--rabbitmq_exchange', default=lambda: os.environ.get('RABBITMQ_EXCHANGE', None), required=True, help='RabbitMQ exchange ($RABBITMQ_EXCHANGE)')
-def produce(pg_host, pg_port, pg_database, pg_user, pg_password, pg_replication_slot, pg_output_plugin, pg_tables, pg_publication_name, rabbitmq_url, rabbitmq_exchange):
+def produce(pg_host, pg_port, pg_database, pg_user, pg_password, pg_replication_slot, pg_output_plugin, pg_tables, pg_publication_name, pg_output_decoder, pg_typed_values,
+            pg_proto_version, pg_binary, pg_streaming, stream_spool_memory, transaction_mode, transaction_max_events, publish_batch_size, publish_linger_ms, pipeline_workers, pipeline_executor,
+            publisher_confirms, max_inflight,
+            compression_codec, compression_level, compression_min_size, pg_persistent_slot, lsn_checkpoint_file,
+            pg_backfill, backfill_workers, backfill_action, pg_manage_publication, table_config,
+            toast_cache_size, toast_cache_memory, routing_key_buckets, serializer, wire_format, event_shape, adaptive_batching, lag_low_bytes, lag_high_bytes, status_interval, metrics_port, metrics_file, rabbitmq_url, rabbitmq_exchange):
     p = EventProducer(
         qconnector_cls=RabbitMQConnector,
         event_cls=BaseEvent,
@@ -36,8 +77,44 @@ def produce(pg_host, pg_port, pg_database, pg_user, pg_password, pg_replication_
         pg_output_plugin=pg_output_plugin,
         pg_tables=pg_tables,
         pg_publication_name=pg_publication_name,
+        pg_output_decoder=pg_output_decoder,
+        pg_typed_values=pg_typed_values,
+        pg_proto_version=pg_proto_version,
+        pg_binary=pg_binary,
+        pg_streaming=pg_streaming,
+        stream_spool_memory=stream_spool_memory,
+        transaction_mode=transaction_mode,
+        transaction_max_events=transaction_max_events,
+        publish_batch_size=publish_batch_size,
+        publish_linger_ms=publish_linger_ms,
+        pipeline_workers=pipeline_workers,
+        pipeline_executor=pipeline_executor,
+        pg_persistent_slot=pg_persistent_slot,
+        lsn_checkpoint_file=lsn_checkpoint_file,
+        pg_backfill=pg_backfill,
+        backfill_workers=backfill_workers,
+        backfill_action=backfill_action,
+        pg_manage_publication=pg_manage_publication,
+        table_config=table_config,
+        toast_cache_size=toast_cache_size,
+        toast_cache_memory=toast_cache_memory,
+        routing_key_buckets=routing_key_buckets,
+        serializer=serializer,
+        wire_format=wire_format,
+        event_shape=event_shape,
+        adaptive_batching=adaptive_batching,
+        lag_low_bytes=lag_low_bytes,
+        lag_high_bytes=lag_high_bytes,
+        status_interval=status_interval,
+        metrics_port=metrics_port,
+        metrics_file=metrics_file,
         rabbitmq_url=rabbitmq_url,
-        rabbitmq_exchange=rabbitmq_exchange
+        rabbitmq_exchange=rabbitmq_exchange,
+        publisher_confirms=publisher_confirms,
+        max_inflight=max_inflight,
+        compression_codec=compression_codec,
+        compression_level=compression_level,
+        compression_min_size=compression_min_size
     )
 
     def signal_handler(signum, frame):
@@ -0,0 +1,171 @@
+import itertools
+import json
+import pickle
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait as wait_futures
+from typing import Any, Callable, Dict, Iterator, Tuple, Union
+
+from common.log import get_logger
+from common.utils import key_hash_bucket
+from pgoutput_parser.plan import shape_event
+
+
+logger = get_logger(__name__)
+
+THREAD = 'thread'
+PROCESS = 'process'
+
+EXECUTORS = {
+    THREAD: ThreadPoolExecutor,
+    PROCESS: ProcessPoolExecutor
+}
+
+# Decoding is pure python, threads would share the GIL with the replication loop
+DEFAULT_EXECUTOR = PROCESS
+
+# Results a worker may be ahead of the oldest unpublished one, per worker
+PENDING_PER_WORKER = 64
+
+# relation id -> (token, context) of the relations a worker has seen, per worker process
+_relation_contexts: Dict[int, Tuple[int, tuple]] = {}
+
+# tokens of relation contexts, unique within the process so pipelines never share one
+_tokens = itertools.count(1)
+
+# result of a change whose worker doesn't hold the context of its relation yet
+MISSING_CONTEXT = 'missing-context'
+
+
+def encode_change(decoder, message_type, table_name, payload, schema, plan, routing_key, encoder, buckets=0,
+                  envelope=None):
+    """
+    Decode a change message, serialize and compress the event. Runs on a pipeline worker, so
+    everything it gets has to be picklable for process workers.
+
+    :param buckets: Append the hash bucket of the event id to the routing key when > 0.
+    :param envelope: Serializer or CompactTemplate of the relation, events are serialized with json.dumps without one.
+
+    :return: (routing_key, body, content_encoding), None when there is nothing to publish.
+    """
+    if message_type == 'U':
+        parsed_message = decoder.decode_update_message(table_name, payload, schema, plan)
+    elif message_type == 'D':
+        parsed_message = decoder.decode_delete_message(table_name, payload, schema, plan)
+    else:
+        parsed_message = decoder.decode_insert_message(table_name, payload, schema, plan)
+
+    if not parsed_message:
+        logger.debug('Skipping dummy updates on table: %s', table_name)
+        return None
+
+    if plan is not None:
+        shape_event(parsed_message, plan.shape)
+
+    if buckets:
+        routing_key = f"{routing_key}.{key_hash_bucket(parsed_message['id'], buckets)}"
+
+    body, content_encoding = encoder(envelope.dumps(parsed_message) if envelope is not None else json.dumps(parsed_message))
+    return routing_key, body, content_encoding
+
+
+def encode_relation_change(relation_id: int, token: int, message_type: str, payload: bytes, context: bytes = None):
+    """
+    encode_change with the decoding context a worker holds for the relation. Changes are sent
+    without it, a worker that doesn't hold the context of the token yet returns MISSING_CONTEXT
+    and gets the change again together with the pickled context, which it keeps from then on.
+    """
+    cached = _relation_contexts.get(relation_id)
+    if cached is None or cached[0] != token:
+        if context is None:
+            return MISSING_CONTEXT
+        cached = _relation_contexts[relation_id] = (token, pickle.loads(context))
+
+    decoder, table_name, schema, plan, routing_key, encoder, buckets, envelope = cached[1]
+    return encode_change(decoder, message_type, table_name, payload, schema, plan, routing_key, encoder, buckets, envelope)
+
+
+class EncodingPipeline:
+    """
+    Runs the expensive part of turning replication messages into events on a pool of workers
+    while the replication stream is read on the calling thread.
+
+    Work is queued in LSN order together with markers for LSNs that only have to be acknowledged.
+    Results are handed back strictly in that order, so events keep their order and an LSN is only
+    acknowledged once everything before it is published.
+    """
+
+    def __init__(self, workers: int, executor: str = DEFAULT_EXECUTOR, max_pending: int = None):
+        if executor not in EXECUTORS:
+            raise ValueError(f'Unknown pipeline executor: {executor}, expected one of {", ".join(EXECUTORS)}')
+
+        self.workers = workers
+        self.max_pending = max_pending or workers * PENDING_PER_WORKER
+
+        self.__executor = EXECUTORS[executor](max_workers=workers)
+        self.__pending = deque()
+
+        # relation id -> (token, pickled context), the token changes with every relation message
+        self.__relations: Dict[int, Tuple[int, bytes]] = {}
+
+    def __len__(self):
+        return len(self.__pending)
+
+    def submit(self, msg: Any, fn: Callable, *args) -> None:
+        """Queue work for a message, its result is returned by completed() in order"""
+        self.__pending.append((msg, None, self.__executor.submit(fn, *args), None))
+
+    def relation(self, relation_id: int, decoder, table_name: str, schema: dict, plan, routing_key: str,
+                 encoder: Callable, buckets: int = 0, envelope=None) -> None:
+        """Set the context the changes of a relation are encoded with, see encode_change"""
+        context = (decoder, table_name, schema, plan, routing_key, encoder, buckets, envelope)
+        self.__relations[relation_id] = (next(_tokens), pickle.dumps(context))
+
+    def submit_change(self, msg: Any, relation_id: int, message_type: str, payload: bytes) -> None:
+        """Queue the encoding of a change of a relation set with relation(), only its payload goes to the worker"""
+        token, context = self.__relations[relation_id]
+        change = (relation_id, token, message_type, payload)
+        self.__pending.append((msg, None, self.__executor.submit(encode_relation_change, *change), (change, context)))
+
+    def mark(self, msg: Any, lsn: int) -> None:
+        """Queue an LSN to acknowledge once everything queued before it is done"""
+        self.__pending.append((msg, lsn, None, None))
+
+    def completed(self, wait: bool = False) -> Iterator[Tuple[Any, Union[int, None], Union[Future, None]]]:
+        """
+        Yield the queued entries from the oldest one on for as long as they are done.
+
+        :param wait: Wait for every queued entry instead of stopping at the first one still running.
+            The oldest entry is waited for anyway while more than max_pending entries are queued.
+        :return: An iterator of (msg, lsn, future) entries, lsn is set for markers and future for work.
+        """
+        while self.__pending:
+            msg, lsn, future, change = self.__pending[0]
+
+            if future is not None and not future.done() and not wait and len(self.__pending) <= self.max_pending:
+                return
+
+            if change is not None and self.__missed_context(future):
+                # the worker gets the change again with the context, a worker only misses it once per relation
+                (relation_id, token, message_type, payload), context = change
+                future = self.__executor.submit(encode_relation_change, relation_id, token, message_type, payload, context)
+                self.__pending[0] = (msg, lsn, future, None)
+                continue
+
+            self.__pending.popleft()
+            yield msg, lsn, future
+
+    @staticmethod
+    def __missed_context(future: Future) -> bool:
+        wait_futures([future])
+        return future.exception() is None and future.result() == MISSING_CONTEXT
+
+    def running(self) -> Union[Future, None]:
+        """Future of the oldest queued work if it is still running, completed() stops at it"""
+        if self.__pending and self.__pending[0][2] is not None and not self.__pending[0][2].done():
+            return self.__pending[0][2]
+
+        return None
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown(wait=False)
+        self.__pending.clear()
@@ -0,0 +1,103 @@
+from typing import Dict, List
+
+from psycopg2 import sql
+
+from common.log import get_logger
+from producer.table_config import TableConfig
+from producer.table_filter import TableFilter
+
+
+logger = get_logger(__name__)
+
+# Row filters, column lists and TABLES IN SCHEMA need postgres 15
+PUBLICATION_FILTERS_VERSION = 150000
+
+
+def user_tables(cur) -> List[str]:
+    cur.execute(
+        "SELECT schemaname, tablename FROM pg_tables "
+        "WHERE schemaname NOT IN ('pg_catalog', 'information_schema');"
+    )
+    return [f'{schema}.{table}' for schema, table in cur.fetchall()]
+
+
+def table_identifier(table_name: str) -> sql.Identifier:
+    return sql.Identifier(*table_name.split('.', 1))
+
+
+def publication_target(cur, table_filter: TableFilter, table_config: Dict[str, TableConfig],
+                       server_version: int) -> sql.Composable:
+    """
+    The objects of a publication for the tables of the filter, with the row filters and column
+    lists of the table config, e.g. TABLE public.users (id, email) WHERE (org_id = 42).
+    """
+    filtered = any(config.filtered for config in table_config.values())
+    if filtered and server_version < PUBLICATION_FILTERS_VERSION:
+        raise ValueError('Row filters and column lists of publications need postgres >= 15')
+
+    if table_filter.match_all:
+        if filtered:
+            raise ValueError('Row filters and column lists need pg_tables to list the tables of the publication')
+        return sql.SQL('ALL TABLES')
+
+    names = set(table_filter.names)
+    schemas = set()
+
+    if table_filter.schemas and server_version >= PUBLICATION_FILTERS_VERSION:
+        # tables created in these schemas later on are published as well
+        schemas = table_filter.schemas
+    if table_filter.patterns or (table_filter.schemas and not schemas):
+        names.update(table for table in user_tables(cur) if table_filter.matches(table))
+
+    # tables of a published schema are only listed when they need a filter
+    names = {table for table in names if table.split('.', 1)[0] not in schemas or table in table_config}
+
+    objects = []
+    for table_name in sorted(names):
+        config = table_config.get(table_name, TableConfig())
+
+        table = sql.SQL('TABLE {}').format(table_identifier(table_name))
+        if config.columns:
+            table = sql.SQL('{} ({})').format(table, sql.SQL(', ').join(map(sql.Identifier, config.columns)))
+        if config.where:
+            table = sql.SQL('{} WHERE ({})').format(table, sql.SQL(config.where))
+        objects.append(table)
+
+    objects.extend(sql.SQL('TABLES IN SCHEMA {}').format(sql.Identifier(schema)) for schema in sorted(schemas))
+
+    if not objects:
+        raise ValueError('pg_tables does not match any table to publish')
+
+    return sql.SQL(', ').join(objects)
+
+
+def sync_publication(conn, publication_name: str, table_filter: TableFilter,
+                     table_config: Dict[str, TableConfig]) -> None:
+    """
+    Create the publication, or change the tables of an existing one, so postgres only sends
+    changes of the tables of the filter, with the rows and columns of the table config.
+    Row filters of tables published for updates and deletes may only use replica identity columns.
+    """
+    with conn.cursor() as cur:
+        target = publication_target(cur, table_filter, table_config, conn.server_version)
+
+        cur.execute("SELECT puballtables FROM pg_publication WHERE pubname = %s;", (publication_name,))
+        row = cur.fetchone()
+
+        if row is None:
+            statement = sql.SQL('CREATE PUBLICATION {} FOR {}').format(sql.Identifier(publication_name), target)
+        elif row[0] and table_filter.match_all:
+            logger.info('Publication %s already publishes all tables', publication_name)
+            return
+        elif row[0] or table_filter.match_all:
+            # FOR ALL TABLES can't be altered, the publication has to be created again
+            statement = sql.SQL('DROP PUBLICATION {0}; CREATE PUBLICATION {0} FOR {1}').format(
+                sql.Identifier(publication_name), target
+            )
+        else:
+            statement = sql.SQL('ALTER PUBLICATION {} SET {}').format(sql.Identifier(publication_name), target)
+
+        logger.info('Updating publication %s: %s', publication_name, statement.as_string(conn))
+        cur.execute(statement)
+
+    conn.commit()
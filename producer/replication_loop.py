@@ -0,0 +1,127 @@
+import select
+import time
+
+from common.log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Upper bound for a select() on an idle replication stream
+IDLE_POLL_TIMEOUT = 1
+
+# How long an idle replication loop waits for publisher confirms at a time
+CONFIRM_POLL_TIMEOUT = 0.1
+
+# How long to wait for the broker to unblock the connection at a time, the replication connection is kept alive in between
+BLOCKED_POLL_TIMEOUT = 1
+
+# Seconds between standby status updates, well below the server's wal_sender_timeout
+DEFAULT_STATUS_INTERVAL = 10
+
+
+class StatusUpdates:
+    """
+    Standby status updates of a replication connection. The LSNs received, processed and safely
+    published are reported at least every interval seconds, only the flush LSN moves the slot.
+
+    Status updates are only valid in COPY mode. Before start_replication the connection may hold
+    an exported snapshot that any other command would drop, so nothing is sent until start().
+    """
+
+    def __init__(self, interval: float = DEFAULT_STATUS_INTERVAL):
+        self.interval = interval
+
+        self.write_lsn = 0
+        self.apply_lsn = 0
+        self.flush_lsn = None
+
+        self.__cursor = None
+        self.__sent_at = time.monotonic()
+
+    @property
+    def started(self) -> bool:
+        return self.__cursor is not None
+
+    def start(self, cursor) -> None:
+        """Send status updates on a cursor replication was just started on"""
+        self.__cursor = cursor
+        self.__sent_at = time.monotonic()
+
+    def keepalive(self) -> None:
+        """Send a status update once the interval passed since the last one"""
+        if self.__cursor is None:
+            return
+
+        now = time.monotonic()
+        if now - self.__sent_at < self.interval:
+            return
+
+        # zero leaves a position where it was, the server only uses the flush LSN for the slot
+        self.__cursor.send_feedback(
+            write_lsn=self.write_lsn,
+            flush_lsn=self.flush_lsn or 0,
+            apply_lsn=self.apply_lsn,
+            force=True
+        )
+        self.__sent_at = now
+
+
+class ReplicationLoop:
+    """
+    Replication loop of a producer. Unlike consume_stream it wakes up when the stream is idle, so
+    a pending batch is flushed once it lingered long enough, confirms that arrive later still move
+    the flush LSN forward and status updates keep going out while the broker stalls.
+    """
+
+    def __init__(self, producer):
+        self.__producer = producer
+        self.__broker_blocked = producer.metrics.gauge('pgevents_broker_blocked', '1 while the broker blocks the connection')
+
+    def run(self) -> None:
+        producer = self.__producer
+
+        while True:
+            if producer.qconnector.blocked:
+                self.__wait_while_blocked()
+            elif not producer.read_stream_once():
+                self.__wait_for_stream()
+
+    def __wait_while_blocked(self):
+        """
+        Stop reading replication messages while the broker blocks the connection, e.g. on a memory
+        or disk alarm. Events would only pile up in memory, postgres keeps the WAL meanwhile.
+        """
+        producer = self.__producer
+
+        logger.warning('Broker blocked the connection, pausing replication reads')
+        self.__broker_blocked.set(1)
+
+        while producer.qconnector.blocked and not producer.shutdown_requested:
+            producer.qconnector.process_events(time_limit=BLOCKED_POLL_TIMEOUT)
+            producer.keepalive()
+
+        self.__broker_blocked.set(0)
+        logger.info('Broker unblocked the connection, resuming replication reads')
+
+    def __wait_for_stream(self):
+        """
+        Wait until the replication connection or the broker connection has something to read, so
+        confirms, heartbeats and blocked notifications are taken in while the stream is idle.
+        """
+        producer = self.__producer
+        confirms_pending = producer.confirms_pending
+        broker_fd = producer.qconnector.fileno()
+
+        if broker_fd is None:
+            if confirms_pending:
+                producer.qconnector.process_events(time_limit=CONFIRM_POLL_TIMEOUT)
+                producer.flush_confirmed()
+            else:
+                select.select([producer.fileno()], [], [], producer.idle_timeout())
+            return
+
+        readable, _, _ = select.select([producer.fileno(), broker_fd], [], [], producer.idle_timeout())
+        if broker_fd in readable or confirms_pending:
+            producer.qconnector.process_events()
+        if confirms_pending:
+            producer.flush_confirmed()
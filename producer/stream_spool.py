@@ -0,0 +1,107 @@
+import struct
+from collections import namedtuple
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterator, Set, Tuple
+
+from common.log import get_logger
+
+
+logger = get_logger(__name__)
+
+# Changes of a streamed transaction are kept in memory up to this size, the rest goes to disk
+DEFAULT_SPOOL_MEMORY = 8 * 1024 * 1024
+
+# subxid, lsn, payload length
+RECORD_HEADER = struct.Struct('>IQI')
+
+# Stands in for a replication message when a spooled change is replayed
+SpooledMessage = namedtuple('SpooledMessage', ['payload', 'data_start', 'cursor'])
+
+
+class StreamSpool:
+    """
+    Buffers the changes of in-progress transactions that postgres streams before they commit.
+
+    Each transaction gets its own spool file that stays in memory up to max_memory bytes and
+    rolls over to a temporary file after that, so a transaction of millions of rows does not
+    have to fit in memory. Changes of aborted subtransactions are skipped on replay and an
+    aborted transaction is thrown away as a whole.
+    """
+
+    def __init__(self, max_memory: int = DEFAULT_SPOOL_MEMORY):
+        self.max_memory = max_memory
+
+        self.__files: Dict[int, SpooledTemporaryFile] = {}
+        self.__aborted_subxids: Dict[int, Set[int]] = {}
+
+    def __len__(self):
+        return len(self.__files)
+
+    def __contains__(self, xid: int):
+        return xid in self.__files
+
+    def append(self, xid: int, subxid: int, lsn: int, payload: bytes) -> None:
+        """
+        Spool a change of a streamed transaction.
+
+        :param xid: Top level transaction the stream belongs to.
+        :param subxid: Transaction id the change was sent with, a subtransaction or xid itself.
+        :param payload: The change message without its transaction id.
+        """
+        spool = self.__files.get(xid)
+        if spool is None:
+            # kept open across calls until the transaction ends, __discard closes it
+            spool = SpooledTemporaryFile(max_size=self.max_memory)  # pylint: disable=consider-using-with
+            self.__files[xid] = spool
+
+        spool.write(RECORD_HEADER.pack(subxid, lsn, len(payload)))
+        spool.write(payload)
+
+    def abort(self, xid: int, subxid: int) -> None:
+        if subxid != xid:
+            logger.debug('Subtransaction %s of streamed transaction %s aborted', subxid, xid)
+            self.__aborted_subxids.setdefault(xid, set()).add(subxid)
+            return
+
+        logger.debug('Streamed transaction %s aborted', xid)
+        self.__discard(xid)
+
+    def commit(self, xid: int) -> Iterator[Tuple[int, bytes]]:
+        """
+        Replay the spooled changes of a committed transaction in the order they were streamed
+        and forget the transaction afterwards.
+
+        :return: An iterator of (lsn, payload) pairs.
+        """
+        spool = self.__files.get(xid)
+        if spool is None:
+            return
+
+        aborted = self.__aborted_subxids.get(xid, set())
+
+        try:
+            spool.seek(0)
+            while True:
+                header = spool.read(RECORD_HEADER.size)
+                if not header:
+                    break
+
+                subxid, lsn, length = RECORD_HEADER.unpack(header)
+                payload = spool.read(length)
+
+                # relation messages are kept, later changes of the transaction may rely on them
+                if subxid not in aborted or payload[:1] == b'R':
+                    yield lsn, payload
+        finally:
+            self.__discard(xid)
+
+    def __discard(self, xid: int) -> None:
+        spool = self.__files.pop(xid, None)
+        if spool is not None:
+            spool.close()
+
+        self.__aborted_subxids.pop(xid, None)
+
+    def close(self) -> None:
+        for xid in list(self.__files):
+            self.__discard(xid)
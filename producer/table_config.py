@@ -0,0 +1,55 @@
+import json
+from typing import Dict, List, Union
+
+from pgoutput_parser.plan import validate_shape
+
+
+class TableConfig:
+    """
+    Settings of a single table from the table config.
+
+    :param where: Row filter of the publication, a SQL expression over the table's columns.
+    :param columns: Column list of the publication, only these columns are replicated.
+    :param include: Only these columns are decoded and published.
+    :param exclude: These columns are stepped over while decoding.
+    :param redact: The values of these columns are published as [redacted].
+    :param hash: The values of these columns are published as the sha256 of their raw bytes.
+    :param shape: Sections of the events that are published, full, new+diff, diff-only or key-only.
+    """
+
+    def __init__(self, where: Union[str, None] = None, columns: Union[List[str], None] = None,
+                 include: Union[List[str], None] = None, exclude: Union[List[str], None] = None,
+                 redact: Union[List[str], None] = None, hash: Union[List[str], None] = None,  # pylint: disable=redefined-builtin
+                 shape: Union[str, None] = None):
+        self.where = where
+        self.columns = columns
+
+        self.include = include
+        self.exclude = exclude
+        self.redact = redact
+        self.hash = hash
+
+        self.shape = validate_shape(shape) if shape is not None else None
+
+    @property
+    def filtered(self) -> bool:
+        """True when the publication has to filter rows or columns of the table"""
+        return bool(self.where or self.columns)
+
+
+def load_table_config(source: Union[str, None]) -> Dict[str, TableConfig]:
+    """
+    Load the table config, a JSON object keyed by table name, from a file or from the JSON itself.
+
+    e.g. {"public.users": {"where": "org_id = 42", "exclude": ["avatar"], "hash": ["email"], "shape": "diff-only"}}
+    """
+    if not source:
+        return {}
+
+    if source.lstrip().startswith('{'):
+        config = json.loads(source)
+    else:
+        with open(source, encoding='utf-8') as f:
+            config = json.load(f)
+
+    return {table_name: TableConfig(**settings) for table_name, settings in config.items()}
@@ -0,0 +1,68 @@
+import fnmatch
+import re
+from typing import Iterable, List, Pattern, Set, Union
+
+
+REGEX_PREFIX = 're:'
+GLOB_CHARS = '*?['
+
+# entries that select every table
+MATCH_ALL = ('*', '.*', '*.*')
+
+
+class TableFilter:
+    """
+    Tables to publish events for, parsed once from a comma separated list.
+
+    An entry is an exact name like public.users, a schema wildcard like public.*, a glob
+    like public.user_* or a regular expression prefixed with re:, matched against the full
+    schema qualified name. An empty filter selects every table.
+    """
+
+    def __init__(self, tables: Union[str, Iterable[str], None] = None):
+        if isinstance(tables, str):
+            tables = tables.split(',')
+
+        self.entries: List[str] = [table.strip() for table in tables or [] if table.strip()]
+
+        self.match_all = not self.entries or any(entry in MATCH_ALL for entry in self.entries)
+        self.names: Set[str] = set()
+        self.schemas: Set[str] = set()
+        self.patterns: List[Pattern] = []
+
+        for entry in self.entries:
+            if entry in MATCH_ALL:
+                continue
+
+            if entry.startswith(REGEX_PREFIX):
+                self.patterns.append(re.compile(entry[len(REGEX_PREFIX):]))
+            elif entry.endswith('.*') and not any(char in entry[:-2] for char in GLOB_CHARS):
+                self.schemas.add(entry[:-2])
+            elif any(char in entry for char in GLOB_CHARS):
+                self.patterns.append(re.compile(fnmatch.translate(entry)))
+            else:
+                self.names.add(entry)
+
+    @property
+    def exact(self) -> bool:
+        """True when the filter is a plain list of table names"""
+        return not self.match_all and not self.schemas and not self.patterns
+
+    def matches(self, table_name: str) -> bool:
+        if self.match_all or table_name in self.names:
+            return True
+
+        if self.schemas and table_name.split('.', 1)[0] in self.schemas:
+            return True
+
+        return any(pattern.fullmatch(table_name) for pattern in self.patterns)
+
+    def wal2json_add_tables(self) -> Union[str, None]:
+        """
+        The filter as wal2json's add-tables option, None when wal2json can't express it and
+        every table has to be sent.
+        """
+        if self.match_all or self.patterns:
+            return None
+
+        return ','.join(sorted(self.names) + [f'{schema}.*' for schema in sorted(self.schemas)])
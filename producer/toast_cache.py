@@ -0,0 +1,131 @@
+import json
+import sys
+from collections import OrderedDict
+from typing import Hashable, List, Union
+
+from common.metrics import NOOP_METRICS
+
+
+DEFAULT_TOAST_CACHE_MEMORY = 64 * 1024 * 1024
+
+# Smaller values are stored inline by postgres and are never sent as unchanged
+DEFAULT_MIN_VALUE_SIZE = 256
+
+
+def value_size(value) -> int:
+    """
+    Approximate size of the text postgres sent for a value. Converted json values are measured
+    by their serialized length, the size of the python object says nothing about their content.
+    """
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (dict, list)):
+        return len(json.dumps(value, default=str))
+
+    return sys.getsizeof(value)
+
+
+class ToastCache:
+    """
+    LRU cache of the last known value of large columns, keyed by relation, row key and column.
+
+    Updates that don't touch a TOASTed column send it as unchanged, the cache fills those
+    columns in with the value seen last for the same row. Bounded by the number of values
+    and by the approximate size of the values it holds.
+    """
+
+    def __init__(self, max_entries: int, max_memory: int = DEFAULT_TOAST_CACHE_MEMORY,
+                 min_value_size: int = DEFAULT_MIN_VALUE_SIZE, metrics=NOOP_METRICS):
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.min_value_size = min_value_size
+
+        self.__values = OrderedDict()
+        self.__memory = 0
+
+        self.__hits = metrics.counter('pgevents_toast_cache_hits_total', 'Unchanged columns filled in from the TOAST cache')
+        self.__misses = metrics.counter('pgevents_toast_cache_misses_total', 'Unchanged columns missing from the TOAST cache')
+        self.__entries = metrics.gauge('pgevents_toast_cache_entries', 'Values held by the TOAST cache')
+        self.__bytes = metrics.gauge('pgevents_toast_cache_bytes', 'Approximate size of the values held by the TOAST cache')
+
+    def __len__(self):
+        return len(self.__values)
+
+    @property
+    def memory(self) -> int:
+        return self.__memory
+
+    def remember(self, relation_id: int, key: Hashable, row: dict) -> None:
+        """Keep the large values of a row"""
+        for column, value in row.items():
+            size = value_size(value) if value is not None else 0
+            if size >= self.min_value_size:
+                self.__put((relation_id, key, column), value, size)
+
+        self.__entries.set(len(self.__values))
+        self.__bytes.set(self.__memory)
+
+    def __put(self, cache_key, value, size):
+        previous = self.__values.pop(cache_key, None)
+        if previous is not None:
+            self.__memory -= previous[1]
+
+        self.__values[cache_key] = (value, size)
+        self.__memory += size
+
+        while self.__values and (len(self.__values) > self.max_entries or self.__memory > self.max_memory):
+            _, (_, evicted_size) = self.__values.popitem(last=False)
+            self.__memory -= evicted_size
+
+    def fill(self, relation_id: int, key: Hashable, row: dict, columns: List[str]) -> List[str]:
+        """
+        Fill the unchanged columns of a row in from the cache.
+
+        :return: The columns that were not in the cache.
+        """
+        missing = []
+
+        for column in columns:
+            cached = self.__values.get((relation_id, key, column))
+            if cached is None:
+                missing.append(column)
+                continue
+
+            self.__values.move_to_end((relation_id, key, column))
+            row[column] = cached[0]
+
+        self.__hits.inc(len(columns) - len(missing))
+        self.__misses.inc(len(missing))
+        return missing
+
+    def forget(self, relation_id: int, key: Hashable, columns: Union[List[str], None] = None) -> None:
+        """Drop the values of a deleted row"""
+        for column in columns or []:
+            cached = self.__values.pop((relation_id, key, column), None)
+            if cached is not None:
+                self.__memory -= cached[1]
+
+    def apply(self, relation_id: int, event: dict, columns: List[str]) -> None:
+        """
+        Fill the unchanged columns of an update event in and remember its new values, a delete
+        forgets the row. Columns the cache can't fill in are still reported as unchanged.
+
+        :param columns: The columns of the relation, the ones forgotten on a delete.
+        """
+        key = event['id']
+        if key is None:
+            return
+        if isinstance(key, list):
+            key = tuple(key)
+
+        if event['action'] == 'D':
+            self.forget(relation_id, key, columns)
+            return
+
+        if event.get('unchanged'):
+            missing = self.fill(relation_id, key, event['new'], event['unchanged'])
+            if missing:
+                event['unchanged'] = missing
+            else:
+                del event['unchanged']
+        self.remember(relation_id, key, event['new'])
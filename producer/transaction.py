@@ -0,0 +1,124 @@
+from datetime import timedelta
+from typing import Dict, List, Tuple, Union
+
+from common.serialization import Serializer
+from pgoutput_parser.types import POSTGRES_EPOCH_TZ
+
+
+ENVELOPE = 'envelope'
+BATCH = 'batch'
+
+TRANSACTION_MODES = (ENVELOPE, BATCH)
+
+# Events of a transaction held in memory, larger transactions are published in parts
+DEFAULT_MAX_TRANSACTION_EVENTS = 10000
+
+
+def commit_timestamp(microseconds: int) -> str:
+    """Commit timestamps are sent as microseconds since 2000-01-01 UTC"""
+    return (POSTGRES_EPOCH_TZ + timedelta(microseconds=microseconds)).isoformat()
+
+
+class TransactionBuffer:
+    """
+    Collects the events of the transaction in progress, from its begin message up to its commit.
+
+    In envelope mode all events of a table are published as one message holding the events and
+    the transaction they belong to. In batch mode every event is published on its own, with the
+    transaction added to it, and the events of a transaction go out as one batch.
+
+    At most max_events are held. A larger transaction is published in parts of max_events as it
+    arrives, the transaction of each part carries its number and the part of the commit is marked
+    as the last one.
+    """
+
+    def __init__(self, mode: str = ENVELOPE, serializer: Union[Serializer, None] = None,
+                 max_events: int = DEFAULT_MAX_TRANSACTION_EVENTS):
+        if mode not in TRANSACTION_MODES:
+            raise ValueError(f'Unknown transaction mode: {mode}, expected one of {", ".join(TRANSACTION_MODES)}')
+        if max_events < 1:
+            raise ValueError('A transaction has to hold at least one event')
+
+        self.mode = mode
+        self.serializer = serializer or Serializer()
+        self.max_events = max_events
+
+        self.__xid: Union[int, None] = None
+        self.__commit_ts: Union[int, None] = None
+        self.__commit_lsn: Union[int, None] = None
+        self.__events: List[Tuple[str, dict]] = []
+        self.__parts = 0
+
+    def __len__(self):
+        return len(self.__events)
+
+    @property
+    def in_progress(self) -> bool:
+        return self.__xid is not None
+
+    def begin(self, xid: int, commit_ts: Union[int, None] = None, commit_lsn: Union[int, None] = None) -> None:
+        self.__xid = xid
+        self.__commit_ts = commit_ts
+        self.__commit_lsn = commit_lsn
+        self.__events = []
+        self.__parts = 0
+
+    def add(self, routing_key: str, event: dict) -> List[Tuple[str, bytes]]:
+        """
+        Hold an event until the commit.
+
+        :return: The (routing_key, payload) pairs of a part to publish right away, when max_events
+            were held already.
+        """
+        messages = []
+        if len(self.__events) >= self.max_events:
+            self.__parts += 1
+            messages = self.__messages(self.__transaction(self.__commit_lsn, self.__commit_ts), self.__events)
+            self.__events = []
+
+        self.__events.append((routing_key, event))
+        return messages
+
+    def __transaction(self, commit_lsn, commit_ts, last=False) -> dict:
+        transaction = {
+            'xid': self.__xid,
+            'commit_lsn': commit_lsn,
+            'commit_ts': commit_timestamp(commit_ts) if commit_ts is not None else None
+        }
+        if self.__parts:
+            transaction['part'] = self.__parts
+            if last:
+                transaction['last_part'] = True
+
+        return transaction
+
+    def commit(self, commit_lsn: int, commit_ts: Union[int, None] = None) -> List[Tuple[str, bytes]]:
+        """
+        End the transaction.
+
+        :return: The (routing_key, payload) pairs to publish for it.
+        """
+        if self.__parts:
+            self.__parts += 1
+
+        transaction = self.__transaction(commit_lsn, commit_ts if commit_ts is not None else self.__commit_ts, last=True)
+        events, self.__events = self.__events, []
+        self.__xid = None
+        self.__commit_ts = None
+        self.__commit_lsn = None
+        self.__parts = 0
+
+        return self.__messages(transaction, events)
+
+    def __messages(self, transaction: dict, events: List[Tuple[str, dict]]) -> List[Tuple[str, bytes]]:
+        if self.mode == BATCH:
+            return [(routing_key, self.serializer.dumps({**event, 'transaction': transaction})) for routing_key, event in events]
+
+        tables: Dict[str, List[dict]] = {}
+        for routing_key, event in events:
+            tables.setdefault(routing_key, []).append(event)
+
+        return [
+            (routing_key, self.serializer.dumps({**transaction, 'table_name': table_events[0]['table_name'], 'events': table_events}))
+            for routing_key, table_events in tables.items()
+        ]
@@ -12,9 +12,15 @@ setup(
         'Click==8.1.8',
         'pika==1.3.2',
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'orjson': ['orjson'],
+        'msgpack': ['msgpack'],
+    },
     entry_points='''
         [console_scripts]
         producer=producer.main:produce
         event_logger=consumer.main:consume
+        drop_slot=producer.admin:drop_slot
     '''
 )
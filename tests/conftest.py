@@ -53,12 +53,14 @@ def mock_schema():
         'relation_id': 16385,
         'table_name': 'public.users',
         'columns': [
-            {'name': 'id'},
-            {'name': 'full_name'},
-            {'name': 'company'},
-            {'name': 'created_at'},
-            {'name': 'updated_at'}
-        ]
+            {'name': 'id', 'type_id': 23},
+            {'name': 'full_name', 'type_id': 25},
+            {'name': 'company', 'type_id': 3802},
+            {'name': 'created_at', 'type_id': 1184},
+            {'name': 'updated_at', 'type_id': 1184}
+        ],
+        'replica_identity': 'f',
+        'key_columns': ['id', 'full_name', 'company', 'created_at', 'updated_at']
     }
 
 @pytest.fixture
@@ -86,12 +88,14 @@ def relation_response():
         'relation_id': 16385,
         'table_name': 'public.users',
         'columns': [
-            {'name': 'id'},
-            {'name': 'full_name'},
-            {'name': 'company'},
-            {'name': 'created_at'},
-            {'name': 'updated_at'}
-        ]
+            {'name': 'id', 'type_id': 23},
+            {'name': 'full_name', 'type_id': 25},
+            {'name': 'company', 'type_id': 3802},
+            {'name': 'created_at', 'type_id': 1184},
+            {'name': 'updated_at', 'type_id': 1184}
+        ],
+        'replica_identity': 'f',
+        'key_columns': ['id', 'full_name', 'company', 'created_at', 'updated_at']
     }
 
 
@@ -0,0 +1,122 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+
+from common.qconnector import AsyncRabbitMQConnector
+from producer.async_event_producer import AsyncEventProducer
+
+
+@pytest.fixture
+def async_producer_init_params(producer_init_params):
+    return {**producer_init_params, 'qconnector_cls': AsyncRabbitMQConnector}
+
+
+def test_confirms_with_batching(async_producer_init_params):
+    with pytest.raises(ValueError):
+        AsyncEventProducer(**async_producer_init_params, publisher_confirms=True, publish_batch_size=10)
+
+
+def test_connect(async_producer_init_params):
+    p = AsyncEventProducer(**async_producer_init_params)
+    p.qconnector.connect = mock.AsyncMock()
+    p.connect_db = mock.Mock()
+
+    with pytest.raises(TypeError):
+        p.connect()
+
+    asyncio.run(p.connect_async())
+
+    p.qconnector.connect.assert_awaited_once()
+    p.connect_db.assert_called_once()
+
+
+def test_start_consuming_waits_for_replication_socket(async_producer_init_params):
+    p = AsyncEventProducer(**async_producer_init_params)
+    read_fd, write_fd = os.pipe()
+
+    reads = iter([True, False, Exception('Connection closed')])
+
+    def read_stream_once(wait=True):
+        assert wait is False
+        result = next(reads)
+        if isinstance(result, Exception):
+            raise result
+        if result is False:
+            # the replication connection becomes readable while the loop waits
+            asyncio.get_running_loop().call_soon(os.write, write_fd, b'x')
+        return result
+
+    p.read_stream_once = mock.Mock(side_effect=read_stream_once)
+    p.fileno = mock.Mock(return_value=read_fd)
+
+    try:
+        with pytest.raises(Exception, match='Connection closed'):
+            asyncio.run(asyncio.wait_for(p.start_consuming_async(), 5))
+    finally:
+        os.close(read_fd)
+        os.close(write_fd)
+
+    assert p.read_stream_once.call_count == 3
+
+
+def test_publish_from_executor_thread_is_handed_to_loop(async_producer_init_params):
+    p = AsyncEventProducer(**async_producer_init_params, publisher_confirms=True)
+    loops = []
+    p.qconnector.connect = mock.AsyncMock()
+    p.qconnector.publish_batch = mock.Mock(side_effect=lambda messages: loops.append(asyncio.get_running_loop()))
+    p.qconnector.wait_for_confirms = mock.AsyncMock()
+
+    # the backfill publishes from connect_db, which runs in an executor thread
+    p.connect_db = lambda: p.publish_batch(messages=[('test.public.users', '{}')])
+
+    async def connect():
+        await p.connect_async()
+        return asyncio.get_running_loop()
+
+    loop = asyncio.run(connect())
+
+    assert loops == [loop]
+    p.qconnector.wait_for_confirms.assert_awaited_once()
+
+
+def test_start_consuming_awaits_pipeline(async_producer_init_params):
+    p = AsyncEventProducer(**async_producer_init_params)
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(time.sleep, 0.05)
+    waits = []
+
+    def read_stream_once(wait=True):
+        waits.append(wait)
+        if len(waits) == 2:
+            raise Exception('Connection closed')
+        return False
+
+    p.read_stream_once = mock.Mock(side_effect=read_stream_once)
+    p.pipeline_future = mock.Mock(side_effect=lambda: None if future.done() else future)
+
+    with pytest.raises(Exception, match='Connection closed'):
+        asyncio.run(asyncio.wait_for(p.start_consuming_async(), 5))
+    executor.shutdown()
+
+    # the loop stayed free while the worker ran, the stream was read again once it finished
+    assert waits == [False, False]
+    assert future.done()
+
+
+def test_start_consuming_reconnects(async_producer_init_params):
+    p = AsyncEventProducer(**async_producer_init_params)
+    lost = [True]
+
+    with mock.patch.object(type(p.qconnector), 'connection_lost', new_callable=mock.PropertyMock,
+                           side_effect=lambda: lost.pop() if lost else False):
+        p.qconnector.reconnect = mock.AsyncMock()
+        p.read_stream_once = mock.Mock(side_effect=Exception('Connection closed'))
+
+        with pytest.raises(Exception, match='Connection closed'):
+            asyncio.run(p.start_consuming_async())
+
+    p.qconnector.reconnect.assert_awaited_once()
@@ -0,0 +1,140 @@
+import hashlib
+from collections import namedtuple
+from unittest import mock
+
+import pytest
+
+from pgoutput_parser.plan import COLUMN_HASH, COLUMN_KEEP
+from pgoutput_parser.types import TypeRegistry
+from producer.backfill import (
+    SnapshotBackfill, backfill_tables, create_replication_slot_with_snapshot, parse_copy_line, snapshot_event
+)
+from producer.table_filter import TableFilter
+
+
+Column = namedtuple('Column', ['name', 'type_code'])
+
+
+def fake_connect(key_range=(1, 10), copy_rows=None):
+    """Connections of a users(id int4 primary key, full_name text) table"""
+    copy_rows = copy_rows or []
+
+    def copy_expert(query, file):
+        for line in copy_rows:
+            file.write(line)
+
+    def connect():
+        cursor = mock.MagicMock()
+        cursor.description = [Column('id', 23), Column('full_name', 25)]
+        cursor.fetchall.return_value = [('id', 23)]
+        cursor.fetchone.return_value = key_range
+        cursor.copy_expert.side_effect = copy_expert
+
+        conn = mock.Mock()
+        conn.cursor.return_value.__enter__ = mock.Mock(return_value=cursor)
+        conn.cursor.return_value.__exit__ = mock.Mock(return_value=None)
+        return conn
+
+    return mock.Mock(side_effect=connect)
+
+
+def test_parse_copy_line():
+    assert parse_copy_line('1\tJohn\\tDoe\t\\N\ta\\\\b\\nc') == ['1', 'John\tDoe', None, 'a\\b\nc']
+    assert parse_copy_line('\\101\\x42') == ['AB']
+
+
+def test_snapshot_event():
+    event = snapshot_event('public.users', {'id': 1, 'full_name': None})
+
+    assert event['action'] == 'S'
+    assert event['id'] == 1
+    assert event['old'] == {}
+    assert event['diff'] == {'id': 1}
+    assert event['new'] == {'id': 1, 'full_name': None}
+
+
+def test_create_replication_slot_with_snapshot():
+    cursor = mock.Mock()
+    cursor.fetchone.return_value = ('events', '0/16B3748', '00000003-00000002-1', 'pgoutput')
+
+    assert create_replication_slot_with_snapshot(cursor, 'events', 'pgoutput') == ('0/16B3748', '00000003-00000002-1')
+
+
+def test_backfill_tables():
+    connect = mock.MagicMock()
+    cur = connect.return_value.cursor.return_value.__enter__.return_value
+    cur.fetchall.return_value = [('public', 'users'), ('public', 'orgs'), ('audit', 'users')]
+
+    # exact table names need no lookup
+    assert backfill_tables(connect, TableFilter('public.users,public.orgs')) == ['public.orgs', 'public.users']
+    connect.assert_not_called()
+
+    assert backfill_tables(connect, TableFilter('public.*'), 'events') == ['public.users', 'public.orgs']
+    assert cur.execute.call_args[0][1] == (['events'],)
+    connect.return_value.close.assert_called_once()
+
+
+def test_plan_splits_integer_keys():
+    connect = fake_connect(key_range=(1, 10))
+    backfill = SnapshotBackfill(connect=connect, snapshot_name='snap', tables=['public.users'], workers=3)
+
+    tasks = backfill._SnapshotBackfill__plan_table(connect().cursor().__enter__(), 'public.users')
+
+    assert len(tasks) == 3
+    assert all(task[1] == ['id', 'full_name'] for task in tasks)
+
+
+def test_plan_single_worker_for_empty_table():
+    connect = fake_connect(key_range=(None, None))
+    backfill = SnapshotBackfill(connect=connect, snapshot_name='snap', tables=['public.users'], workers=3)
+
+    tasks = backfill._SnapshotBackfill__plan_table(connect().cursor().__enter__(), 'public.users')
+
+    assert [task[4] for task in tasks] == [None]
+
+
+def test_chunks():
+    connect = fake_connect(copy_rows=['1\tJohn\n2\t\\N\n', '3\tJa', 'ne\n'])
+    backfill = SnapshotBackfill(
+        connect=connect, snapshot_name='snap', tables=['public.users'], workers=1, type_registry=TypeRegistry('int4')
+    )
+
+    rows = [row for table_name, chunk in backfill.chunks() for row in chunk]
+
+    assert rows == [{'id': 1, 'full_name': 'John'}, {'id': 2, 'full_name': None}, {'id': 3, 'full_name': 'Jane'}]
+    # one connection to plan the copy, one for the single copy worker
+    assert connect.call_count == 2
+
+
+def test_chunks_copy_error():
+    with mock.patch('producer.backfill._CopyRows.write', side_effect=ValueError('broken row')):
+        connect = fake_connect(copy_rows=['1\tJohn\n'])
+        backfill = SnapshotBackfill(connect=connect, snapshot_name='snap', tables=['public.users'], workers=1)
+
+        with pytest.raises(ValueError, match='broken row'):
+            list(backfill.chunks())
+
+
+def test_chunks_projection():
+    connect = fake_connect(copy_rows=['1\tJohn\n2\t\\N\n'])
+    backfill = SnapshotBackfill(
+        connect=connect, snapshot_name='snap', tables=['public.users'], workers=1,
+        column_actions=lambda schema: [COLUMN_KEEP, COLUMN_HASH]
+    )
+
+    rows = [row for table_name, chunk in backfill.chunks() for row in chunk]
+
+    assert rows == [{'id': '1', 'full_name': hashlib.sha256(b'John').hexdigest()}, {'id': '2', 'full_name': None}]
+
+
+def test_chunks_projection_of_typed_columns():
+    connect = fake_connect(copy_rows=['1\tJohn\n'])
+    backfill = SnapshotBackfill(
+        connect=connect, snapshot_name='snap', tables=['public.users'], workers=1, type_registry=TypeRegistry('int4'),
+        column_actions=lambda schema: [COLUMN_HASH, COLUMN_KEEP]
+    )
+
+    rows = [row for table_name, chunk in backfill.chunks() for row in chunk]
+
+    # the typed id is hashed from its text like the streaming decoder hashes the raw bytes
+    assert rows == [{'id': hashlib.sha256(b'1').hexdigest(), 'full_name': 'John'}]
@@ -0,0 +1,48 @@
+from unittest import mock
+
+from producer.batcher import EventBatcher
+
+
+def test_add_and_drain():
+    batcher = EventBatcher(max_size=2)
+
+    batcher.add('test.public.users', '{}', 10)
+    batcher.mark(12)
+
+    assert len(batcher) == 1
+    assert not batcher.is_full()
+    assert batcher.highest_lsn == 12
+
+    batcher.add('test.public.users', '{}', 11)
+    assert batcher.is_full()
+
+    events, highest_lsn = batcher.drain()
+    assert events == [('test.public.users', '{}'), ('test.public.users', '{}')]
+    assert highest_lsn == 12
+
+    assert len(batcher) == 0
+    assert batcher.highest_lsn is None
+    assert batcher.time_left() is None
+
+
+def test_should_flush_without_linger():
+    batcher = EventBatcher(max_size=10)
+    assert not batcher.should_flush(idle=True)
+
+    batcher.add('test.public.users', '{}', 10)
+
+    assert not batcher.should_flush()
+    assert batcher.should_flush(idle=True)
+
+
+def test_should_flush_with_linger():
+    batcher = EventBatcher(max_size=10, max_linger_ms=100)
+
+    with mock.patch('producer.batcher.time.monotonic', return_value=1.0):
+        batcher.add('test.public.users', '{}', 10)
+        assert batcher.time_left() == 0.1
+        assert not batcher.should_flush(idle=True)
+
+    with mock.patch('producer.batcher.time.monotonic', return_value=1.2):
+        assert batcher.time_left() == 0
+        assert batcher.should_flush()
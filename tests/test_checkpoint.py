@@ -0,0 +1,65 @@
+import json
+from unittest import mock
+
+from click.testing import CliRunner
+
+from producer.admin import drop_slot
+from producer.checkpoint import LsnCheckpoint, format_lsn
+
+
+def test_format_lsn():
+    assert format_lsn(0x16B374D848) == '16/B374D848'
+    assert format_lsn(0) == '0/0'
+
+
+def test_checkpoint_save_and_load(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = LsnCheckpoint(path=path, slot_name='events', interval=0)
+
+    assert checkpoint.load() is None
+
+    checkpoint.update(1000)
+    checkpoint.update(2000)
+
+    with open(path) as f:
+        assert json.load(f) == {'slot': 'events', 'lsn': 2000, 'position': '0/7D0'}
+
+    assert LsnCheckpoint(path=path, slot_name='events').load() == 2000
+    assert LsnCheckpoint(path=path, slot_name='other').load() is None
+
+
+def test_checkpoint_throttled(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = LsnCheckpoint(path=path, slot_name='events', interval=3600)
+
+    checkpoint.update(1000)
+    checkpoint.update(2000)
+    assert LsnCheckpoint(path=path, slot_name='events').load() == 1000
+
+    checkpoint.save()
+    assert LsnCheckpoint(path=path, slot_name='events').load() == 2000
+
+
+def test_checkpoint_unreadable(tmp_path):
+    path = tmp_path / 'checkpoint.json'
+    path.write_text('{not json')
+
+    assert LsnCheckpoint(path=str(path), slot_name='events').load() is None
+
+
+def test_drop_slot(tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    checkpoint = LsnCheckpoint(path=path, slot_name='events', interval=0)
+    checkpoint.update(1000)
+
+    with mock.patch('psycopg2.connect') as mock_connect:
+        mock_cursor = mock_connect.return_value.cursor.return_value.__enter__.return_value
+
+        result = CliRunner().invoke(drop_slot, [
+            '--pg_host', 'localhost', '--pg_database', 'test', '--pg_user', 'test', '--pg_password', 'test',
+            '--pg_replication_slot', 'events', '--lsn_checkpoint_file', path
+        ])
+
+    assert result.exit_code == 0
+    mock_cursor.execute.assert_called_once_with("SELECT pg_drop_replication_slot(%s);", ('events',))
+    assert checkpoint.load() is None
@@ -0,0 +1,35 @@
+import pytest
+
+from common.compression import Compressor, compress, decompress
+
+
+@pytest.mark.parametrize('codec', ['identity', 'br', 'deflate'])
+def test_compressor_round_trip(codec):
+    payload = '{"table_name": "public.users", "id": "1"}' * 10
+
+    body, content_encoding = Compressor(codec=codec).compress(payload)
+
+    assert content_encoding == codec
+    assert decompress(body, content_encoding) == payload
+
+
+def test_compressor_min_size():
+    compressor = Compressor(codec='br', min_size=100)
+
+    assert compressor.compress('{"id": "1"}') == (b'{"id": "1"}', 'identity')
+    assert compressor.compress('x' * 100)[1] == 'br'
+
+
+def test_compressor_unknown_codec():
+    with pytest.raises(ValueError):
+        Compressor(codec='lz4')
+
+
+def test_decompress_without_content_encoding():
+    # messages published before content_encoding was set are brotli compressed
+    assert decompress(compress('{"id": "1"}')) == '{"id": "1"}'
+
+
+def test_decompress_unknown_content_encoding():
+    with pytest.raises(ValueError):
+        decompress(b'test', 'lz4')
@@ -0,0 +1,96 @@
+from common.qconnector.confirm_tracker import ConfirmTracker
+
+
+def test_ack_out_of_order():
+    tracker = ConfirmTracker()
+
+    for i in range(3):
+        assert tracker.add(('test.key', b'body')) == i + 1
+
+    assert tracker.inflight == 3
+    assert tracker.confirmed_sequence == 0
+
+    tracker.ack(2)
+    assert tracker.confirmed_sequence == 0
+
+    tracker.ack(1)
+    assert tracker.confirmed_sequence == 2
+    assert tracker.inflight == 1
+
+    tracker.ack(3)
+    assert tracker.confirmed_sequence == 3
+    assert tracker.inflight == 0
+
+
+def test_ack_multiple():
+    tracker = ConfirmTracker()
+
+    for _ in range(4):
+        tracker.add(('test.key', b'body'))
+
+    tracker.ack(3, multiple=True)
+
+    assert tracker.confirmed_sequence == 3
+    assert tracker.inflight == 1
+
+
+def test_single_acks_release_delivery_tags():
+    tracker = ConfirmTracker()
+
+    for _ in range(1000):
+        tracker.add(('test.key', b'body'))
+        tracker.ack(tracker.published_sequence)
+
+    assert len(tracker._ConfirmTracker__delivery_tag_order) == 0
+
+    # an open tag holds back the ones acked after it until it is acked itself
+    for _ in range(3):
+        tracker.add(('test.key', b'body'))
+    tracker.ack(1002)
+    tracker.ack(1003)
+    assert len(tracker._ConfirmTracker__delivery_tag_order) == 3
+
+    tracker.ack(1001)
+    assert len(tracker._ConfirmTracker__delivery_tag_order) == 0
+    assert tracker.confirmed_sequence == 1003
+
+
+def test_nack_and_publish_again():
+    tracker = ConfirmTracker()
+
+    for i in range(3):
+        tracker.add(('test.key', i))
+
+    tracker.nack(2, multiple=True)
+    tracker.ack(3)
+
+    assert tracker.confirmed_sequence == 0
+
+    nacked = tracker.take_nacked()
+    assert nacked == [(1, ('test.key', 0)), (2, ('test.key', 1))]
+    assert tracker.take_nacked() == []
+
+    # published again with delivery tags 4 and 5
+    for sequence, message in nacked:
+        tracker.add(message, sequence=sequence)
+
+    tracker.ack(5, multiple=True)
+    assert tracker.confirmed_sequence == 3
+    assert tracker.published_sequence == 3
+
+
+def test_reset():
+    tracker = ConfirmTracker()
+
+    for i in range(3):
+        tracker.add(('test.key', i))
+
+    tracker.ack(1)
+
+    assert tracker.reset() == [(2, ('test.key', 1)), (3, ('test.key', 2))]
+
+    # delivery tags restart on the new channel
+    tracker.add(('test.key', 1), sequence=2)
+    tracker.ack(1)
+
+    assert tracker.confirmed_sequence == 2
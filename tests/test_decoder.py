@@ -0,0 +1,140 @@
+import hashlib
+
+import pytest
+
+from pgoutput_parser import BytesIODecoder, MemoryViewDecoder, get_decoder
+from pgoutput_parser.base import UNCHANGED
+from pgoutput_parser.plan import COLUMN_HASH, COLUMN_KEEP, COLUMN_SKIP, REDACTED, DecodePlan, column_actions, shape_event
+
+
+def without_recorded_at(message):
+    return {k: v for k, v in message.items() if k != 'recorded_at'}
+
+
+def test_get_decoder():
+    assert get_decoder('bytesio') is BytesIODecoder
+    assert get_decoder('memoryview') is MemoryViewDecoder
+
+    with pytest.raises(ValueError):
+        get_decoder('unknown')
+
+
+def test_relation(relation_payload, relation_response):
+    assert MemoryViewDecoder.decode_relation_message(relation_payload.payload) == relation_response
+
+
+def test_insert(insert_payload, insert_response, mock_schema):
+    parsed_message = MemoryViewDecoder.decode_insert_message(mock_schema['table_name'], insert_payload.payload, mock_schema)
+    expected = BytesIODecoder.decode_insert_message(mock_schema['table_name'], insert_payload.payload, mock_schema)
+
+    assert without_recorded_at(parsed_message) == without_recorded_at(expected)
+    assert set(parsed_message.keys()) == set(insert_response.keys())
+
+
+def test_update(update_payload, update_response, mock_schema):
+    parsed_message = MemoryViewDecoder.decode_update_message(mock_schema['table_name'], update_payload.payload, mock_schema)
+
+    assert without_recorded_at(parsed_message) == without_recorded_at(update_response)
+
+
+def test_update_without_old_tuple(mock_schema):
+    payload = b'U\x00\x00@\x01N\x00\x01t\x00\x00\x00\x011'
+
+    assert MemoryViewDecoder.decode_update_message(mock_schema['table_name'], payload, mock_schema) is None
+
+
+def test_update_without_diff(mock_schema):
+    tuple_data = b'\x00\x02t\x00\x00\x00\x011n'
+    payload = b'U\x00\x00@\x01O' + tuple_data + b'N' + tuple_data
+
+    assert MemoryViewDecoder.decode_update_message(mock_schema['table_name'], payload, mock_schema) is None
+
+
+def test_delete(delete_payload, delete_response, mock_schema):
+    parsed_message = MemoryViewDecoder.decode_delete_message(mock_schema['table_name'], delete_payload.payload, mock_schema)
+
+    assert without_recorded_at(parsed_message) == without_recorded_at(delete_response)
+
+
+def test_message_type_mismatch(insert_payload, mock_schema):
+    assert MemoryViewDecoder.decode_relation_message(insert_payload.payload) is None
+    assert MemoryViewDecoder.decode_update_message(mock_schema['table_name'], insert_payload.payload, mock_schema) is None
+    assert MemoryViewDecoder.decode_delete_message(mock_schema['table_name'], insert_payload.payload, mock_schema) is None
+
+
+def test_decode_tuple_null_and_unchanged():
+    view = memoryview(b'\x00\x02nu')
+    data, offset = MemoryViewDecoder.decode_tuple(view, 0, {'columns': [{'name': 'col1'}, {'name': 'col2'}]})
+
+    assert data == {'col1': None, 'col2': UNCHANGED}
+    assert offset == 4
+
+
+@pytest.mark.parametrize('decoder', [BytesIODecoder, MemoryViewDecoder])
+def test_insert_projection(decoder, insert_payload, mock_schema):
+    actions = column_actions(
+        [column['name'] for column in mock_schema['columns']],
+        exclude=['company', 'id'], redact=['full_name'], hash=['created_at']
+    )
+    plan = DecodePlan(actions=actions)
+
+    parsed_message = decoder.decode_insert_message(mock_schema['table_name'], insert_payload.payload, mock_schema, plan)
+
+    # the id column is never skipped
+    assert parsed_message['new'] == {
+        'id': '1',
+        'full_name': REDACTED,
+        'created_at': hashlib.sha256(b'2023-11-17 13:44:14.700844+00').hexdigest(),
+        'updated_at': '2023-11-17 13:44:14.700844+00'
+    }
+
+
+def test_column_actions():
+    assert column_actions(['id', 'name']) is None
+    assert column_actions(['id', 'name', 'bio'], include=['name']) == [COLUMN_KEEP, COLUMN_KEEP, COLUMN_SKIP]
+    assert column_actions(['id', 'name'], redact=['name'], hash=['name']) == [COLUMN_KEEP, COLUMN_HASH]
+
+
+@pytest.mark.parametrize('decoder', [BytesIODecoder, MemoryViewDecoder])
+def test_update_unchanged_toast(decoder, mock_schema):
+    old = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x04Mikeu'
+    new = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x03Jimu'
+    payload = b'U\x00\x00@\x01O' + old + b'N' + new
+
+    parsed_message = decoder.decode_update_message(mock_schema['table_name'], payload, mock_schema)
+
+    assert parsed_message['new'] == {'id': '1', 'full_name': 'Jim'}
+    assert parsed_message['diff'] == {'full_name': 'Jim'}
+    assert parsed_message['unchanged'] == ['company']
+
+
+@pytest.mark.parametrize('decoder', [BytesIODecoder, MemoryViewDecoder])
+def test_composite_key_event_id(decoder):
+    columns = [(b'\x01', b'org_id', 23), (b'\x01', b'user_id', 23), (b'\x00', b'name', 25)]
+    payload = b'R\x00\x00@\x02public\x00members\x00d\x00\x03' + b''.join(
+        flags + name + b'\x00' + type_id.to_bytes(4, 'big') + b'\xff\xff\xff\xff' for flags, name, type_id in columns
+    )
+    schema = decoder.decode_relation_message(payload)
+
+    assert schema['replica_identity'] == 'd'
+    assert schema['key_columns'] == ['org_id', 'user_id']
+
+    # deletes only send the key columns, the table has no id column
+    payload = b'D\x00\x00@\x02K\x00\x03t\x00\x00\x00\x0242t\x00\x00\x00\x017n'
+    parsed_message = decoder.decode_delete_message(schema['table_name'], payload, schema)
+
+    assert parsed_message['id'] == ['42', '7']
+    assert parsed_message['old'] == {'org_id': '42', 'user_id': '7', 'name': None}
+
+
+@pytest.mark.parametrize('shape,sections', [
+    ('full', {'old', 'new', 'diff'}),
+    ('new+diff', {'new', 'diff'}),
+    ('diff-only', {'diff'}),
+    ('key-only', set())
+])
+def test_shape_event(update_response, shape, sections):
+    event = shape_event(dict(update_response), shape)
+
+    assert event['id'] == update_response['id']
+    assert {'old', 'new', 'diff'} & set(event) == sections
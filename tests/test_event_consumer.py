@@ -1,6 +1,12 @@
+import asyncio
+import json
+import pytest
 from unittest import mock
 from common.event import base_event
 from common.qconnector.rabbitmq_connector import RabbitMQConnector
+from common.serialization import Serializer
+from common.wire import CompactTemplate
+from consumer.async_event_consumer import AsyncEventConsumer
 from consumer.event_consumer import EventConsumer
 
 
@@ -56,3 +62,137 @@ def test_check_shutdown(mock_consumer):
     mock_consumer.qconnector.check_shutdown = mock.Mock()
     mock_consumer.check_shutdown()
     mock_consumer.qconnector.check_shutdown.assert_called_once()
+
+
+# Test transaction envelopes
+def test_start_consuming_transaction_envelope(mock_consumer):
+    mock_consumer.qconnector.consume_stream = mock.Mock()
+    mock_consumer.start_consuming()
+
+    mock_consumer.process_message = mock.Mock()
+    envelope = {
+        'xid': 700,
+        'commit_lsn': 100,
+        'commit_ts': '2000-01-01T00:00:00+00:00',
+        'table_name': 'public.users',
+        'events': [{'table_name': 'public.users', 'id': 1}, {'table_name': 'public.users', 'id': 2}]
+    }
+    mock_consumer.qconnector.consume_stream.call_args[1]['callback_fn']('test', json.dumps(envelope), delivery_tag=1)
+
+    assert mock_consumer.process_message.call_count == 2
+    assert mock_consumer.process_message.call_args[0][1].id == 2
+
+
+# Test concurrent consumer
+def test_start_consuming_concurrently(event_consumer_init_params):
+    c = EventConsumer(**event_consumer_init_params, workers=4, ordering_key='id')
+    assert c.qconnector._RabbitMQConnector__prefetch_count == 4
+
+    c.qconnector.consume_stream = mock.Mock()
+    c.qconnector.reject_message = mock.Mock()
+    c.process_message = mock.Mock(side_effect=[None, Exception('failed')])
+    c.start_consuming()
+
+    callback_fn = c.qconnector.consume_stream.call_args[1]['callback_fn']
+    callback_fn('public.users', '{"id": 1}', delivery_tag=1)
+    callback_fn('public.users', '{"id": 1}', delivery_tag=2)
+
+    c._EventConsumer__pool.shutdown()
+
+    assert c.process_message.call_count == 2
+    c.qconnector.reject_message.assert_called_once_with(2, requeue=False)
+
+
+# Test batch consumer
+def test_start_consuming_batches(event_consumer_init_params):
+    c = EventConsumer(**event_consumer_init_params, batch_size=3)
+    assert c.qconnector._RabbitMQConnector__prefetch_count == 3
+
+    c.qconnector.consume_batches = mock.Mock()
+    c.qconnector.acknowledge_message = mock.Mock()
+    c.qconnector.reject_message = mock.Mock()
+    c.process_batch = mock.Mock(side_effect=lambda events: [events[1]])
+    c.start_consuming()
+
+    kwargs = c.qconnector.consume_batches.call_args[1]
+    assert kwargs['batch_size'] == 3
+
+    kwargs['callback_fn']([
+        ('public.users', '{"id": 1}', 1),
+        ('public.users', '{"id": 2}', 2),
+        ('public.users', '{"id": 3}', 3)
+    ])
+
+    assert [event.id for event in c.process_batch.call_args[0][0]] == [1, 2, 3]
+    c.qconnector.reject_message.assert_called_once_with(2, requeue=False)
+    c.qconnector.acknowledge_message.assert_called_once_with(3, multiple=True)
+
+
+def test_start_consuming_batches_failure(event_consumer_init_params):
+    c = EventConsumer(**event_consumer_init_params, batch_size=2)
+    c.qconnector.consume_batches = mock.Mock()
+    c.qconnector.acknowledge_message = mock.Mock()
+    c.qconnector.reject_message = mock.Mock()
+    c.process_batch = mock.Mock(side_effect=[Exception('Test exception'), None])
+    c.start_consuming()
+
+    callback_fn = c.qconnector.consume_batches.call_args[1]['callback_fn']
+
+    # a raising batch is rejected, the next one is still processed
+    callback_fn([('public.users', '{"id": 1}', 1), ('public.users', '{"id": 2}', 2)])
+    callback_fn([('public.users', '{"id": 3}', 3)])
+
+    assert c.qconnector.reject_message.call_args_list == [mock.call(1, requeue=False), mock.call(2, requeue=False)]
+    c.qconnector.acknowledge_message.assert_called_once_with(3, multiple=True)
+
+
+# Test async consumer
+def test_async_start_consuming(event_consumer_init_params):
+    c = AsyncEventConsumer(**event_consumer_init_params)
+    c.qconnector.consume_stream = mock.AsyncMock()
+    c.process_message_async = mock.AsyncMock()
+    c.process_transaction_async = mock.AsyncMock()
+
+    # the blocking entry point would leave the consume_stream coroutine unawaited
+    with pytest.raises(TypeError):
+        c.start_consuming()
+
+    asyncio.run(c.start_consuming_async())
+    callback_fn = c.qconnector.consume_stream.call_args[1]['callback_fn']
+
+    asyncio.run(callback_fn('public.users', '{"id": 1}', delivery_tag=1))
+    asyncio.run(callback_fn('public.users', '{"xid": 700, "events": [{"id": 1}]}', delivery_tag=2))
+
+    c.process_message_async.assert_awaited_once()
+    assert c.process_transaction_async.call_args[0][1] == {'xid': 700}
+
+
+def test_start_consuming_compact(mock_consumer):
+    mock_consumer.qconnector.consume_stream = mock.Mock()
+    mock_consumer.qconnector.acknowledge_message = mock.Mock()
+    mock_consumer.start_consuming()
+
+    mock_consumer.process_message = mock.Mock()
+    callback_fn = mock_consumer.qconnector.consume_stream.call_args[1]['callback_fn']
+
+    template = CompactTemplate(Serializer(), 'public.users', ['id', 'full_name'])
+    callback_fn('test', json.loads(template.schema_message()), delivery_tag=1)
+    callback_fn('test', json.loads(template.dumps({
+        'table_name': 'public.users', 'new': {'id': 1, 'full_name': 'Ozzy'}, 'id': 1, 'old': {},
+        'diff': {'id': 1, 'full_name': 'Ozzy'}, 'action': 'I', 'recorded_at': None
+    })), delivery_tag=2)
+
+    # the schema message is only registered and acknowledged
+    mock_consumer.qconnector.acknowledge_message.assert_called_once_with(1)
+    event = mock_consumer.process_message.call_args[0][1]
+    assert event.table_name == 'public.users'
+    assert event.new == {'id': 1, 'full_name': 'Ozzy'}
+    assert event.diff == {'id': 1, 'full_name': 'Ozzy'}
+
+
+def test_load_payload_missing_sections(mock_consumer):
+    _, events = mock_consumer.load_payload('{"table_name": "public.users", "id": 1, "diff": {"full_name": "Ozzy"}, "action": "U"}')
+
+    assert events[0].old == {}
+    assert events[0].new == {}
+    assert events[0].diff == {'full_name': 'Ozzy'}
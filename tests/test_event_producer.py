@@ -1,4 +1,5 @@
 import json
+import struct
 from unittest import mock
 
 import psycopg2
@@ -6,7 +7,10 @@ import pytest
 
 from common.event import base_event
 from common.qconnector.rabbitmq_connector import RabbitMQConnector
+from common.utils import key_hash_bucket
+from common.wire import SchemaRegistry
 from pgoutput_parser.update import UpdateMessage
+from pgoutput_parser.plan import COLUMN_KEEP, COLUMN_REDACT, COLUMN_SKIP
 from producer.event_producer import EventProducer
 
 
@@ -111,23 +115,25 @@ def test_publish(mock_producer):
 
 # Test start_consuming
 def test_start_consuming(mock_producer):
-    # mock consume_stream pyscopg2
     mock_producer._EventProducer__db_cur = mock.Mock()
-    mock_producer._EventProducer__db_cur.consume_stream = mock.Mock()
+    mock_producer._EventProducer__db_cur.read_message.side_effect = [mock.Mock(), Exception('Connection closed')]
 
-    mock_producer.start_consuming()
-
-    mock_producer._EventProducer__db_cur.consume_stream.assert_called_once()
-
-    # Test stream_consumer function
     mock_producer.wal2json_msg_processor = mock.Mock()
     mock_producer.pgoutput_msg_processor = mock.Mock()
     mock_producer.check_shutdown = mock.Mock()
 
-    mock_producer._EventProducer__db_cur.consume_stream.call_args[1]['consume']('test')
+    with pytest.raises(Exception):
+        mock_producer.start_consuming()
+
+    mock_producer._EventProducer__db_cur.consume_stream.assert_not_called()
+    mock_producer.pgoutput_msg_processor.assert_called_once()
 
     mock_producer._EventProducer__pg_output_plugin = 'wal2json'
-    mock_producer._EventProducer__db_cur.consume_stream.call_args[1]['consume']('test')
+    mock_producer._EventProducer__db_cur.read_message.side_effect = [mock.Mock(), Exception('Connection closed')]
+
+    with pytest.raises(Exception):
+        mock_producer.start_consuming()
+
     mock_producer.wal2json_msg_processor.assert_called_once()
 
 @mock.patch('psycopg2.connect')
@@ -181,18 +187,14 @@ def test_shutdown_cleanup(mock_producer):
 
 def test_start_consuming_with_shutdown(mock_producer):
     mock_producer._EventProducer__db_cur = mock.Mock()
-    mock_producer._EventProducer__db_cur.consume_stream = mock.Mock()
     mock_producer._EventProducer__shutdown = True
 
-    mock_producer.start_consuming()
-
-    callback = mock_producer._EventProducer__db_cur.consume_stream.call_args[1]['consume']
-    
     test_msg = mock.Mock()
     test_msg.payload = b'I\x00\x00@\x01'
-    
+    mock_producer._EventProducer__db_cur.read_message.return_value = test_msg
+
     with pytest.raises(SystemExit):
-        callback(test_msg)
+        mock_producer.start_consuming()
 
 def test_shutdown_with_no_db_conn(mock_producer):
     mock_producer._EventProducer__db_conn = None
@@ -246,7 +248,7 @@ def test_create_replication_slot_operational_error(mock_producer):
 def test_start_consuming_exception_handling(mock_producer):
     """Test exception handling in start_consuming"""
     mock_producer._EventProducer__db_cur = mock.Mock()
-    mock_producer._EventProducer__db_cur.consume_stream.side_effect = Exception("Test error")
+    mock_producer._EventProducer__db_cur.read_message.side_effect = Exception("Test error")
     mock_producer._EventProducer__shutdown = False
     
     with pytest.raises(Exception):
@@ -273,7 +275,7 @@ def test_drop_replication_slot_exception(mock_producer):
 def test_start_consuming_shutdown_exception(mock_producer):
     """Test shutdown exception handling in start_consuming"""
     mock_producer._EventProducer__db_cur = mock.Mock()
-    mock_producer._EventProducer__db_cur.consume_stream.side_effect = Exception("Test error")
+    mock_producer._EventProducer__db_cur.read_message.side_effect = Exception("Test error")
     mock_producer._EventProducer__shutdown = True
 
 def test_shutdown_with_connection_error(mock_producer):
@@ -292,3 +294,611 @@ def test_shutdown_with_connection_error(mock_producer):
     mock_producer._EventProducer__db_cur.close.assert_called_once()
     mock_producer._EventProducer__drop_replication_slot.assert_called_once()
     mock_producer.qconnector.shutdown.assert_called_once()
+
+
+def test_pgoutput_msg_processor_memoryview_decoder(producer_init_params, relation_payload, update_payload, delete_payload, mock_schema):
+    p = EventProducer(**producer_init_params, pg_output_decoder='memoryview')
+    p.publish = mock.Mock()
+
+    mock_msg = mock.Mock()
+    for payload in [relation_payload, update_payload, delete_payload]:
+        mock_msg.payload = payload.payload
+        p.pgoutput_msg_processor(mock_msg)
+
+    assert p._EventProducer__table_schemas[16385] == mock_schema
+    assert p.publish.call_count == 2
+    assert mock_msg.cursor.send_feedback.call_count == 3
+
+
+def test_pgoutput_msg_processor_batching(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, publish_batch_size=2)
+    p.publish = mock.Mock()
+    p.publish_batch = mock.Mock()
+    p._EventProducer__db_cur = mock.Mock()
+
+    for lsn, payload in enumerate([relation_payload, update_payload, delete_payload]):
+        mock_msg = mock.Mock()
+        mock_msg.payload = payload.payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    # the delete arrived while the update was buffered, so its feedback waits for the batch
+    assert mock_msg.cursor.send_feedback.call_count == 0
+    p.publish.assert_not_called()
+
+    p.flush_batch()
+
+    assert len(p.publish_batch.call_args[1]['messages']) == 2
+    p._EventProducer__db_cur.send_feedback.assert_called_once_with(flush_lsn=2)
+
+
+def test_start_consuming_batching(producer_init_params, update_payload):
+    p = EventProducer(**producer_init_params, publish_batch_size=10)
+    p.pgoutput_msg_processor = mock.Mock(side_effect=lambda msg: p._EventProducer__batcher.add('test', '{}', msg.data_start))
+    p.publish_batch = mock.Mock()
+
+    mock_msg = mock.Mock()
+    mock_msg.data_start = 5
+
+    p._EventProducer__db_cur = mock.Mock()
+    p._EventProducer__db_cur.read_message.side_effect = [mock_msg, None, Exception('Connection closed')]
+    p.fileno = mock.Mock(return_value=3)
+
+    with mock.patch('select.select') as mock_select, pytest.raises(Exception):
+        p.start_consuming()
+
+    p._EventProducer__db_cur.consume_stream.assert_not_called()
+    p.publish_batch.assert_called_once_with(messages=[('test', '{}')])
+    p._EventProducer__db_cur.send_feedback.assert_called_once_with(flush_lsn=5)
+    mock_select.assert_called_once()
+
+
+def test_pgoutput_msg_processor_publisher_confirms(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, publisher_confirms=True)
+    p.publish = mock.Mock(side_effect=[1, 2])
+    p._EventProducer__db_cur = mock.Mock()
+
+    with mock.patch.object(RabbitMQConnector, 'confirmed_sequence', new_callable=mock.PropertyMock) as confirmed:
+        confirmed.return_value = 0
+        for lsn, payload in enumerate([relation_payload, update_payload, delete_payload]):
+            mock_msg = mock.Mock()
+            mock_msg.payload = payload.payload
+            mock_msg.data_start = lsn
+            p.pgoutput_msg_processor(mock_msg)
+
+        # only the relation message is acknowledged until the events are confirmed
+        p._EventProducer__db_cur.send_feedback.assert_called_once_with(flush_lsn=0)
+
+        confirmed.return_value = 2
+        p.flush_confirmed()
+
+    p._EventProducer__db_cur.send_feedback.assert_called_with(flush_lsn=2)
+
+
+def test_connect_binary(producer_init_params, mock_pika_connect, mock_pg_conn):
+    p = EventProducer(**producer_init_params, pg_binary=True)
+    p.connect()
+
+    options = mock_pg_conn.return_value.cursor.return_value.start_replication.call_args[1]['options']
+
+    assert options['binary'] == 'true'
+    assert options['proto_version'] == 2
+
+
+def test_pgoutput_msg_processor_binary(producer_init_params, relation_payload):
+    p = EventProducer(**producer_init_params, pg_binary=True)
+
+    mock_msg = mock.Mock()
+    mock_msg.payload = relation_payload.payload
+    p.pgoutput_msg_processor(mock_msg)
+
+    assert len(p._EventProducer__decode_plans[16385].binary_converters) == 5
+
+
+def test_binary_converters_resolve_types(producer_init_params, mock_pg_conn):
+    p = EventProducer(**producer_init_params, pg_binary=True)
+    cursor = mock_pg_conn.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchall.return_value = [(16500, 'e', 0, 0, 'E')]
+
+    schema = {'table_name': 'public.users', 'columns': [{'name': 'id', 'type_id': 23}, {'name': 'mood', 'type_id': 16500}]}
+    converters = p._EventProducer__binary_converters(schema)
+
+    assert converters[1](b'happy') == 'happy'
+
+    # resolved types are not looked up again
+    p._EventProducer__binary_converters(schema)
+    cursor.execute.assert_called_once()
+
+
+def test_pgoutput_msg_processor_streaming(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, pg_streaming=True)
+    p.publish = mock.Mock()
+
+    def streamed(payload):
+        return payload[:1] + struct.pack('>I', 700) + payload[1:]
+
+    payloads = [
+        b'S' + struct.pack('>IB', 700, 1),
+        streamed(relation_payload.payload),
+        streamed(update_payload.payload),
+        b'E',
+        b'S' + struct.pack('>IB', 700, 0),
+        streamed(delete_payload.payload),
+        b'E'
+    ]
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate(payloads):
+        mock_msg.payload = payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    # nothing is published before the transaction commits
+    p.publish.assert_not_called()
+    mock_msg.cursor.send_feedback.assert_not_called()
+
+    mock_msg.payload = b'c' + struct.pack('>IBQQq', 700, 0, 90, 100, 0)
+    mock_msg.data_start = 90
+    p.pgoutput_msg_processor(mock_msg)
+
+    assert p.publish.call_count == 2
+    mock_msg.cursor.send_feedback.assert_called_with(flush_lsn=100)
+
+
+def test_pgoutput_msg_processor_stream_abort(producer_init_params, update_payload):
+    p = EventProducer(**producer_init_params, pg_streaming=True)
+    p.publish = mock.Mock()
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate([b'S' + struct.pack('>IB', 700, 1), b'U' + struct.pack('>I', 700) + update_payload.payload[1:], b'E']):
+        mock_msg.payload = payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    mock_msg.payload = b'A' + struct.pack('>II', 700, 700)
+    p.pgoutput_msg_processor(mock_msg)
+
+    assert len(p._EventProducer__stream_spool) == 0
+    p.publish.assert_not_called()
+
+
+def test_connect_streaming(producer_init_params, mock_pika_connect, mock_pg_conn):
+    p = EventProducer(**producer_init_params, pg_streaming=True)
+    p.connect()
+
+    options = mock_pg_conn.return_value.cursor.return_value.start_replication.call_args[1]['options']
+
+    assert options['streaming'] == 'on'
+    assert options['proto_version'] == 2
+
+
+def test_pgoutput_msg_processor_transaction(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, transaction_mode='envelope')
+    p.publish_batch = mock.Mock()
+
+    payloads = [
+        b'B' + struct.pack('>QqI', 90, 0, 700),
+        relation_payload.payload,
+        update_payload.payload,
+        delete_payload.payload
+    ]
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate(payloads):
+        mock_msg.payload = payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    p.publish_batch.assert_not_called()
+    mock_msg.cursor.send_feedback.assert_not_called()
+
+    mock_msg.payload = b'C' + struct.pack('>BQQq', 0, 90, 100, 0)
+    p.pgoutput_msg_processor(mock_msg)
+
+    messages = p.publish_batch.call_args[1]['messages']
+    assert len(messages) == 1
+    assert len(json.loads(messages[0][1])['events']) == 2
+    mock_msg.cursor.send_feedback.assert_called_once_with(flush_lsn=100)
+
+
+def test_pgoutput_msg_processor_large_transaction(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, transaction_mode='batch', transaction_max_events=1)
+    p.publish_batch = mock.Mock()
+
+    payloads = [
+        b'B' + struct.pack('>QqI', 90, 0, 700),
+        relation_payload.payload,
+        update_payload.payload,
+        delete_payload.payload
+    ]
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate(payloads):
+        mock_msg.payload = payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    # the first event went out as soon as the second one didn't fit, the slot stays before the transaction
+    messages = p.publish_batch.call_args[1]['messages']
+    assert json.loads(messages[0][1])['transaction'] == {
+        'xid': 700, 'commit_lsn': 90, 'commit_ts': '2000-01-01T00:00:00+00:00', 'part': 1
+    }
+    mock_msg.cursor.send_feedback.assert_not_called()
+
+    mock_msg.payload = b'C' + struct.pack('>BQQq', 0, 90, 100, 0)
+    p.pgoutput_msg_processor(mock_msg)
+
+    messages = p.publish_batch.call_args[1]['messages']
+    assert json.loads(messages[0][1])['transaction']['last_part'] is True
+    mock_msg.cursor.send_feedback.assert_called_once_with(flush_lsn=100)
+
+
+def test_pgoutput_msg_processor_pipeline(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, pipeline_workers=2)
+    p.publish_encoded = mock.Mock()
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate([relation_payload, update_payload, delete_payload]):
+        mock_msg.payload = payload.payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    p._EventProducer__drain_pipeline(wait=True)
+
+    routing_keys = [call[1]['routing_key'] for call in p.publish_encoded.call_args_list]
+    assert routing_keys == ['test.public.users', 'test.public.users']
+    assert [call[1]['flush_lsn'] for call in mock_msg.cursor.send_feedback.call_args_list] == [0, 1, 2]
+
+
+def test_pipeline_failed_change_is_skipped(producer_init_params, relation_payload, update_payload, delete_payload):
+    p = EventProducer(**producer_init_params, pipeline_workers=1)
+    p.publish_encoded = mock.Mock(side_effect=[Exception('publish failed'), None])
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate([relation_payload, update_payload, delete_payload]):
+        mock_msg.payload = payload.payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    # the failure is logged like one handled inline, the following change is still published
+    p._EventProducer__drain_pipeline(wait=True)
+
+    assert p.publish_encoded.call_count == 2
+    assert [call[1]['flush_lsn'] for call in mock_msg.cursor.send_feedback.call_args_list] == [0, 1, 2]
+
+
+def test_pipeline_with_batching(producer_init_params):
+    with pytest.raises(ValueError):
+        EventProducer(**producer_init_params, pipeline_workers=2, publish_batch_size=10)
+
+
+def test_pgoutput_msg_processor_metrics(producer_init_params, relation_payload, update_payload, tmp_path):
+    p = EventProducer(**producer_init_params, metrics_file=str(tmp_path / 'pgevents.prom'))
+    p.publish = mock.Mock()
+
+    mock_msg = mock.Mock()
+    for lsn, payload in enumerate([relation_payload, update_payload]):
+        mock_msg.payload = payload.payload
+        mock_msg.data_start = lsn
+        p.pgoutput_msg_processor(mock_msg)
+
+    text = p.metrics.render()
+    assert 'pgevents_events_total{table="public.users",action="U"} 1' in text
+    assert 'pgevents_decode_seconds_count{action="U"} 1' in text
+    assert 'pgevents_flushed_lsn 1' in text
+
+    p.shutdown()
+    assert (tmp_path / 'pgevents.prom').exists()
+
+
+def test_shutdown_persistent_slot(producer_init_params):
+    p = EventProducer(**producer_init_params, pg_persistent_slot=True)
+    p.qconnector = mock.Mock()
+    p._EventProducer__drop_replication_slot = mock.Mock()
+
+    p.shutdown()
+
+    p._EventProducer__drop_replication_slot.assert_not_called()
+    p.qconnector.shutdown.assert_called_once()
+
+
+@mock.patch('psycopg2.connect')
+def test_connect_resumes_from_checkpoint(mock_pg_conn, producer_init_params, tmp_path):
+    path = str(tmp_path / 'checkpoint.json')
+    p = EventProducer(**producer_init_params, pg_persistent_slot=True, lsn_checkpoint_file=path)
+    p.qconnector = mock.Mock()
+
+    p.connect()
+    cursor = mock_pg_conn.return_value.cursor.return_value
+    assert cursor.start_replication.call_args[1]['start_lsn'] == 0
+
+    # feedback is checkpointed and saved on shutdown
+    p._EventProducer__send_feedback(cursor, 12345)
+    p.shutdown()
+
+    p = EventProducer(**producer_init_params, pg_persistent_slot=True, lsn_checkpoint_file=path)
+    p.qconnector = mock.Mock()
+    p.connect()
+    assert cursor.start_replication.call_args[1]['start_lsn'] == 12345
+
+
+@mock.patch('psycopg2.connect')
+def test_connect_with_backfill(mock_pg_conn, producer_init_params):
+    p = EventProducer(**producer_init_params, pg_backfill=True)
+    p.qconnector = mock.Mock()
+    p.publish_batch = mock.Mock()
+
+    cursor = mock_pg_conn.return_value.cursor.return_value
+    cursor.fetchone.return_value = ('test', '0/16B3748', '00000003-00000002-1', 'pgoutput')
+
+    chunks = [('public.users', [{'id': 1, 'full_name': 'John'}, {'id': 2, 'full_name': 'Jane'}])]
+    with mock.patch('producer.event_producer.SnapshotBackfill') as mock_backfill:
+        mock_backfill.return_value.chunks.return_value = iter(chunks)
+        p.connect()
+
+    assert mock_backfill.call_args[1]['snapshot_name'] == '00000003-00000002-1'
+    assert mock_backfill.call_args[1]['tables'] == ['public.users']
+
+    messages = p.publish_batch.call_args[1]['messages']
+    assert [routing_key for routing_key, _ in messages] == ['test.public.users', 'test.public.users']
+    assert json.loads(messages[0][1])['action'] == 'S'
+
+    # streaming starts at the consistent point of the slot
+    assert cursor.start_replication.call_args[1]['start_lsn'] == 0x16B3748
+
+
+@mock.patch('psycopg2.connect')
+def test_connect_with_backfill_existing_slot(mock_pg_conn, producer_init_params):
+    p = EventProducer(**producer_init_params, pg_backfill=True)
+    p.qconnector = mock.Mock()
+
+    cursor = mock_pg_conn.return_value.cursor.return_value
+    cursor.execute.side_effect = psycopg2.errors.DuplicateObject()
+
+    with mock.patch('producer.event_producer.SnapshotBackfill') as mock_backfill:
+        p.connect()
+
+    mock_backfill.assert_not_called()
+    assert cursor.start_replication.call_args[1]['start_lsn'] == 0
+
+
+def test_pgoutput_msg_processor_filtered_relation(producer_init_params, relation_payload, update_payload):
+    p = EventProducer(**{**producer_init_params, 'pg_tables': 'public.user'})
+    p.publish = mock.Mock()
+    p._EventProducer__decoder = mock.Mock(wraps=p._EventProducer__decoder)
+
+    relation_payload.cursor = mock.Mock()
+    update_payload.cursor = mock.Mock()
+    update_payload.data_start = 2
+
+    p.pgoutput_msg_processor(relation_payload)
+    p.pgoutput_msg_processor(update_payload)
+
+    p._EventProducer__decoder.decode_update_message.assert_not_called()
+    p.publish.assert_not_called()
+    update_payload.cursor.send_feedback.assert_called_once_with(flush_lsn=2)
+
+
+@mock.patch('producer.event_producer.sync_publication')
+@mock.patch('psycopg2.connect')
+def test_connect_manages_publication(mock_pg_conn, mock_sync_publication, producer_init_params):
+    table_config = '{"public.users": {"columns": ["id", "full_name"]}}'
+    p = EventProducer(**producer_init_params, pg_manage_publication=True, table_config=table_config)
+    p.qconnector = mock.Mock()
+
+    p.connect()
+
+    _, publication_name, table_filter, config = mock_sync_publication.call_args[0]
+    assert publication_name == 'test'
+    assert table_filter.names == {'public.users'}
+    assert config['public.users'].columns == ['id', 'full_name']
+
+
+def test_manage_publication_needs_pgoutput(producer_init_params):
+    with pytest.raises(ValueError):
+        EventProducer(**{**producer_init_params, 'pg_output_plugin': 'wal2json'}, pg_manage_publication=True)
+
+
+def test_pgoutput_msg_processor_projection(producer_init_params, relation_payload):
+    table_config = '{"public.users": {"exclude": ["company"], "redact": ["full_name"]}}'
+    p = EventProducer(**producer_init_params, table_config=table_config)
+
+    relation_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(relation_payload)
+
+    plan = p._EventProducer__decode_plans[16385]
+    assert plan.actions == [COLUMN_KEEP, COLUMN_REDACT, COLUMN_SKIP, COLUMN_KEEP, COLUMN_KEEP]
+
+
+def test_pgoutput_msg_processor_toast_cache(producer_init_params, relation_payload):
+    p = EventProducer(**producer_init_params, toast_cache_size=100)
+    p.publish = mock.Mock()
+
+    relation_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(relation_payload)
+
+    company = '{"name": "' + 'F' * 300 + '"}'
+    first = struct.pack('>i', len(company))
+    old = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x04Miket' + first + company.encode()
+    new = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x03Jimt' + first + company.encode()
+    p.pgoutput_msg_processor(mock.Mock(payload=b'U\x00\x00@\x01O' + old + b'N' + new, data_start=2))
+
+    old = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x03Jimu'
+    new = b'\x00\x03t\x00\x00\x00\x011t\x00\x00\x00\x03Bobu'
+    p.pgoutput_msg_processor(mock.Mock(payload=b'U\x00\x00@\x01O' + old + b'N' + new, data_start=3))
+
+    event = json.loads(p.publish.call_args[1]['payload'])
+    assert event['new'] == {'id': '1', 'full_name': 'Bob', 'company': company}
+    assert event['diff'] == {'full_name': 'Bob'}
+    assert 'unchanged' not in event
+
+    # a row the cache has never seen keeps its columns marked as unchanged
+    old = b'\x00\x03t\x00\x00\x00\x012t\x00\x00\x00\x03Jimu'
+    new = b'\x00\x03t\x00\x00\x00\x012t\x00\x00\x00\x03Bobu'
+    p.pgoutput_msg_processor(mock.Mock(payload=b'U\x00\x00@\x01O' + old + b'N' + new, data_start=4))
+
+    event = json.loads(p.publish.call_args[1]['payload'])
+    assert 'company' not in event['new']
+    assert event['unchanged'] == ['company']
+
+
+def test_pgoutput_msg_processor_routing_key_buckets(producer_init_params, relation_payload, update_payload):
+    p = EventProducer(**producer_init_params, routing_key_buckets=4)
+    p.publish = mock.Mock()
+
+    relation_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(relation_payload)
+    update_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(update_payload)
+
+    routing_key = p.publish.call_args[1]['routing_key']
+    assert routing_key == f"{producer_init_params['pg_database']}.public.users.{key_hash_bucket('1', 4)}"
+
+
+def test_wal2json_msg_processor_parses_once(mock_producer, wal2json_payload):
+    mock_producer.publish = mock.Mock()
+    mock_msg = mock.Mock(payload=json.dumps(wal2json_payload))
+
+    with mock.patch('producer.event_producer.loads', wraps=json.loads) as mock_loads:
+        mock_producer.wal2json_msg_processor(mock_msg)
+
+    mock_loads.assert_called_once_with(mock_msg.payload)
+    assert json.loads(mock_producer.publish.call_args[1]['payload'])['action'] == 'D'
+
+
+def test_serializer_content_type(producer_init_params):
+    p = EventProducer(**producer_init_params, serializer='orjson')
+
+    assert p.qconnector._RabbitMQConnector__content_type == 'application/json'
+
+    with pytest.raises(ValueError):
+        EventProducer(**producer_init_params, serializer='xml')
+
+
+def test_pgoutput_msg_processor_compact(producer_init_params, relation_payload, update_payload):
+    p = EventProducer(**producer_init_params, wire_format='compact')
+    p.publish = mock.Mock()
+
+    relation_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(relation_payload)
+    update_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(update_payload)
+
+    registry = SchemaRegistry()
+    schema, update = [call[1]['payload'] for call in p.publish.call_args_list]
+    assert registry.decode(json.loads(schema)) is None
+    assert registry.decode(json.loads(update))['diff'] == {'full_name': 'Myles'}
+    assert p.qconnector._RabbitMQConnector__content_type == 'application/vnd.pgevents.compact+json'
+
+    with pytest.raises(ValueError):
+        EventProducer(**producer_init_params, wire_format='compact', transaction_mode='envelope')
+
+
+def test_pgoutput_msg_processor_event_shape(producer_init_params, relation_payload, update_payload):
+    p = EventProducer(**producer_init_params, table_config='{"public.users": {"shape": "diff-only"}}')
+    p.publish = mock.Mock()
+
+    relation_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(relation_payload)
+    update_payload.cursor = mock.Mock()
+    p.pgoutput_msg_processor(update_payload)
+
+    event = json.loads(p.publish.call_args[1]['payload'])
+    assert 'old' not in event and 'new' not in event
+    assert event['diff'] == {'full_name': 'Myles'}
+
+    with pytest.raises(ValueError):
+        EventProducer(**producer_init_params, event_shape='everything')
+
+
+def test_adaptive_batching(producer_init_params):
+    p = EventProducer(**producer_init_params, publish_batch_size=100, publish_linger_ms=50, adaptive_batching=True)
+    p.pgoutput_msg_processor = mock.Mock()
+    batcher = p._EventProducer__batcher
+
+    db_cur = p._EventProducer__db_cur = mock.Mock()
+    db_cur.read_message.return_value = mock.Mock(wal_end=20 * 1024 ** 3, data_start=0)
+    p.read_stream_once()
+    assert (batcher.max_size, batcher.max_linger_ms) == (100, 50)
+
+    # caught up, events are published one at a time
+    db_cur.read_message.return_value = None
+    p.read_stream_once()
+    assert (batcher.max_size, batcher.max_linger_ms) == (1, 0)
+
+    with pytest.raises(ValueError):
+        EventProducer(**producer_init_params, adaptive_batching=True)
+
+
+def test_consume_paused_while_broker_blocked(mock_producer):
+    db_cur = mock_producer._EventProducer__db_cur = mock.Mock()
+    db_cur.read_message.side_effect = [mock.Mock(data_start=7), Exception('Connection closed')]
+    mock_producer._EventProducer__status.start(db_cur)
+    mock_producer._EventProducer__status.interval = 0
+
+    mock_producer.pgoutput_msg_processor = mock.Mock()
+    mock_producer.qconnector.process_events = mock.Mock()
+    with mock.patch.object(type(mock_producer.qconnector), 'blocked', new_callable=mock.PropertyMock) as blocked, \
+            pytest.raises(Exception):
+        blocked.side_effect = [True, True, False, False]
+        mock_producer.start_consuming()
+
+    # the replication connection is kept alive until the broker unblocks the connection
+    mock_producer.qconnector.process_events.assert_called_once()
+    assert db_cur.send_feedback.call_args_list[0] == mock.call(write_lsn=0, flush_lsn=0, apply_lsn=0, force=True)
+    mock_producer.pgoutput_msg_processor.assert_called_once()
+
+
+def test_status_updates(mock_producer):
+    db_cur = mock_producer._EventProducer__db_cur = mock.Mock()
+    db_cur.read_message.return_value = mock.Mock(data_start=42)
+    mock_producer._EventProducer__status.start(db_cur)
+    mock_producer.pgoutput_msg_processor = mock.Mock()
+
+    # nothing is sent before the status interval passed
+    mock_producer.read_stream_once()
+    db_cur.send_feedback.assert_not_called()
+
+    mock_producer._EventProducer__status.interval = 0
+    mock_producer.read_stream_once()
+    db_cur.send_feedback.assert_called_once_with(write_lsn=42, flush_lsn=0, apply_lsn=0, force=True)
+
+
+@mock.patch('psycopg2.connect')
+def test_connect_with_backfill_and_confirms(mock_pg_conn, producer_init_params):
+    p = EventProducer(**producer_init_params, pg_backfill=True, publisher_confirms=True, status_interval=0)
+
+    # waiting for confirms calls the wait callback, as RabbitMQConnector does
+    p.qconnector.publish_batch = mock.Mock(side_effect=lambda messages: p.qconnector.wait_callback and p.qconnector.wait_callback())
+
+    cursor = mock_pg_conn.return_value.cursor.return_value
+    cursor.fetchone.return_value = ('test', '0/16B3748', '00000003-00000002-1', 'pgoutput')
+
+    chunks = [('public.users', [{'id': 1, 'full_name': 'John'}])]
+    with mock.patch('producer.event_producer.SnapshotBackfill') as mock_backfill:
+        mock_backfill.return_value.chunks.return_value = iter(chunks)
+        p.connect_db()
+
+    # no status update may touch the connection holding the exported snapshot
+    p.qconnector.publish_batch.assert_called_once()
+    cursor.send_feedback.assert_not_called()
+
+    # the wait for confirms keeps the replication connection alive once it streams
+    assert p.qconnector.wait_callback == p.keepalive
+    p.keepalive()
+    cursor.send_feedback.assert_called_once_with(write_lsn=0, flush_lsn=0, apply_lsn=0, force=True)
+
+
+def test_wait_for_stream_selects_broker_connection(producer_init_params):
+    p = EventProducer(**producer_init_params, publisher_confirms=True)
+    p._EventProducer__db_cur = mock.Mock()
+    p.qconnector.fileno = mock.Mock(return_value=9)
+    p.qconnector.process_events = mock.Mock()
+    p._EventProducer__db_cur.read_message.side_effect = [None, Exception('Connection closed')]
+    p.fileno = mock.Mock(return_value=3)
+
+    with mock.patch('select.select', return_value=([9], [], [])) as mock_select, pytest.raises(Exception):
+        p.start_consuming()
+
+    assert mock_select.call_args[0][0] == [3, 9]
+    p.qconnector.process_events.assert_called_once_with()
@@ -0,0 +1,40 @@
+import pytest
+
+from producer.lag_controller import LagController
+
+
+MB = 1024 * 1024
+
+
+def test_caught_up_publishes_single_events():
+    controller = LagController(max_batch_size=500, max_linger_ms=200, low_lag=MB, high_lag=1024 * MB)
+
+    controller.observe(wal_end=100 * MB, lsn=100 * MB - 1000)
+
+    assert controller.batch_size == 1
+    assert controller.linger_ms == 0
+
+
+def test_batching_grows_with_lag():
+    controller = LagController(max_batch_size=500, max_linger_ms=200, max_pending=64, min_pending=4,
+                               low_lag=MB, high_lag=1024 * MB)
+
+    controller.observe(wal_end=32 * MB, lsn=0)
+    assert 1 < controller.batch_size < 500
+    assert 0 < controller.linger_ms < 200
+    assert 4 < controller.pending < 64
+
+    controller.observe(wal_end=10 * 1024 * MB, lsn=0)
+    assert (controller.batch_size, controller.linger_ms, controller.pending) == (500, 200, 64)
+
+    controller.caught_up()
+    assert (controller.batch_size, controller.linger_ms, controller.pending) == (1, 0, 4)
+
+
+def test_without_pipeline():
+    assert LagController(max_batch_size=10).pending is None
+
+
+def test_invalid_lag_thresholds():
+    with pytest.raises(ValueError):
+        LagController(low_lag=MB, high_lag=MB)
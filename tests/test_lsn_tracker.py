@@ -0,0 +1,30 @@
+from producer.lsn_tracker import LsnTracker
+
+
+def test_flushable():
+    tracker = LsnTracker()
+
+    tracker.processed(10)
+    assert tracker.flushable(None) == 10
+    assert len(tracker) == 0
+
+    tracker.published(1, 20)
+    tracker.processed(20)
+    tracker.processed(30)
+    tracker.published(2, 40)
+
+    assert tracker.flushable(None) is None
+    assert tracker.flushable(0) is None
+    assert tracker.flushable(1) == 30
+    assert tracker.flushable(1) is None
+    assert tracker.flushable(2) == 40
+    assert len(tracker) == 0
+
+
+def test_flushable_without_sequence():
+    tracker = LsnTracker()
+
+    # publish() overridden without returning a sequence number
+    tracker.published(None, 10)
+
+    assert tracker.flushable(None) == 10
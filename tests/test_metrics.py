@@ -0,0 +1,74 @@
+import urllib.request
+
+from common.metrics import NOOP_METRICS, Metrics, MetricsFileWriter, MetricsServer, create_metrics
+
+
+def test_counter_and_gauge():
+    metrics = Metrics()
+
+    events = metrics.counter('events_total', 'Events', ['table'])
+    events.labels('public.users').inc()
+    events.labels('public.users').inc(2)
+    metrics.gauge('lag_bytes', 'Lag').set(42)
+
+    assert metrics.counter('events_total', 'Events', ['table']) is events
+
+    text = metrics.render()
+    assert '# TYPE events_total counter' in text
+    assert 'events_total{table="public.users"} 3' in text
+    assert 'lag_bytes 42' in text
+
+
+def test_histogram():
+    metrics = Metrics()
+
+    histogram = metrics.histogram('decode_seconds', 'Decode time', buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    with histogram.time():
+        pass
+
+    text = metrics.render()
+    assert 'decode_seconds_bucket{le="0.1"} 2' in text
+    assert 'decode_seconds_bucket{le="1"} 3' in text
+    assert 'decode_seconds_bucket{le="+Inf"} 4' in text
+    assert 'decode_seconds_count 4' in text
+
+
+def test_noop_metrics():
+    metrics, exporters = create_metrics()
+
+    assert metrics is NOOP_METRICS
+    assert exporters == []
+
+    histogram = metrics.histogram('decode_seconds', 'Decode time', ['action'])
+    with histogram.labels('U').time():
+        pass
+    metrics.counter('events_total', 'Events').inc()
+
+    assert metrics.render() == ''
+
+
+def test_metrics_server():
+    metrics = Metrics()
+    metrics.counter('events_total', 'Events').inc()
+
+    server = MetricsServer(metrics, port=0, host='127.0.0.1')
+    server.start()
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics') as response:
+            assert 'events_total 1' in response.read().decode()
+    finally:
+        server.stop()
+
+
+def test_metrics_file_writer(tmp_path):
+    metrics = Metrics()
+    metrics.counter('events_total', 'Events').inc()
+
+    path = tmp_path / 'pgevents.prom'
+    MetricsFileWriter(metrics, str(path)).write()
+
+    assert 'events_total 1' in path.read_text()
@@ -7,7 +7,7 @@ from pgoutput_parser import (
     DeleteMessage,
     RelationMessage
 )
-from pgoutput_parser.base import BaseMessage
+from pgoutput_parser.base import UNCHANGED, BaseMessage
 
 
 # Test InsertMessage decoding
@@ -88,4 +88,4 @@ def test_decode_tuple_null_and_unchanged():
     result = base_message_instance.decode_tuple()
 
     # Assertions
-    assert result == {'col1': None, 'col2': None}
+    assert result == {'col1': None, 'col2': UNCHANGED}
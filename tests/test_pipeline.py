@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from common.qconnector.q_connector import identity_encoder
+from pgoutput_parser import BytesIODecoder
+from pgoutput_parser.plan import DecodePlan
+from common.utils import key_hash_bucket
+from producer.pipeline import PROCESS, THREAD, EncodingPipeline, encode_change
+
+
+def test_completed_in_order():
+    pipeline = EncodingPipeline(workers=2, executor=THREAD)
+    release = threading.Event()
+
+    pipeline.submit('first', release.wait)
+    pipeline.mark('first', 10)
+    pipeline.submit('second', lambda: 'done')
+
+    # the oldest entry is still running, nothing may overtake it
+    assert list(pipeline.completed()) == []
+    assert len(pipeline) == 3
+    assert pipeline.running() is not None
+
+    release.set()
+    entries = list(pipeline.completed(wait=True))
+
+    assert [(msg, lsn) for msg, lsn, _ in entries] == [('first', None), ('first', 10), ('second', None)]
+    assert entries[2][2].result() == 'done'
+    assert len(pipeline) == 0
+    assert pipeline.running() is None
+
+    pipeline.shutdown()
+
+
+def test_completed_waits_when_full():
+    pipeline = EncodingPipeline(workers=1, executor=THREAD, max_pending=1)
+
+    pipeline.submit('first', time.sleep, 0.05)
+    pipeline.mark('first', 10)
+
+    # more than max_pending entries are queued, so the oldest one is waited for
+    assert [lsn for _, lsn, _ in pipeline.completed()] == [None, 10]
+
+    pipeline.shutdown()
+
+
+def test_submit_change(update_payload, delete_payload, mock_schema):
+    pipeline = EncodingPipeline(workers=2, executor=PROCESS)
+    pipeline.relation(
+        mock_schema['relation_id'], BytesIODecoder, mock_schema['table_name'], mock_schema, None,
+        'test.public.users', identity_encoder
+    )
+
+    pipeline.submit_change('update', mock_schema['relation_id'], 'U', update_payload.payload)
+    pipeline.submit_change('delete', mock_schema['relation_id'], 'D', delete_payload.payload)
+
+    entries = list(pipeline.completed(wait=True))
+
+    assert [msg for msg, _, _ in entries] == ['update', 'delete']
+    assert [future.result()[0] for _, _, future in entries] == ['test.public.users', 'test.public.users']
+    assert json.loads(entries[0][2].result()[1])['diff'] == {'full_name': 'Myles'}
+
+    pipeline.shutdown()
+
+
+def test_submit_change_after_relation_change(update_payload, mock_schema):
+    pipeline = EncodingPipeline(workers=1, executor=PROCESS)
+    relation_id = mock_schema['relation_id']
+
+    pipeline.relation(relation_id, BytesIODecoder, mock_schema['table_name'], mock_schema, None, 'old', identity_encoder)
+    pipeline.submit_change('first', relation_id, 'U', update_payload.payload)
+    pipeline.relation(relation_id, BytesIODecoder, mock_schema['table_name'], mock_schema, None, 'new', identity_encoder)
+    pipeline.submit_change('second', relation_id, 'U', update_payload.payload)
+
+    # the worker drops the context it cached once the relation is sent again
+    assert [future.result()[0] for _, _, future in pipeline.completed(wait=True)] == ['old', 'new']
+
+    pipeline.shutdown()
+
+
+def test_submit_change_sends_only_the_payload(update_payload, mock_schema):
+    pipeline = EncodingPipeline(workers=1, executor=THREAD)
+    relation_id = mock_schema['relation_id']
+    pipeline.relation(relation_id, BytesIODecoder, mock_schema['table_name'], mock_schema, None, 'users', identity_encoder)
+
+    executor = pipeline._EncodingPipeline__executor
+    with mock.patch.object(executor, 'submit', wraps=executor.submit) as submit:
+        pipeline.submit_change('first', relation_id, 'U', update_payload.payload)
+        assert [future.result()[0] for _, _, future in pipeline.completed(wait=True)] == ['users']
+
+        # the worker missed the context once and got the change again with it
+        assert submit.call_args_list[0][0][1:] == (relation_id, mock.ANY, 'U', update_payload.payload)
+        assert len(submit.call_args_list[1][0]) == 6
+
+        submit.reset_mock()
+        for _ in range(3):
+            pipeline.submit_change('update', relation_id, 'U', update_payload.payload)
+        results = [future.result() for _, _, future in pipeline.completed(wait=True)]
+
+    # from then on changes carry only their payload
+    assert [call[0][1:] for call in submit.call_args_list] == [(relation_id, mock.ANY, 'U', update_payload.payload)] * 3
+    assert [routing_key for routing_key, _, _ in results] == ['users'] * 3
+
+    pipeline.shutdown()
+
+
+def test_unknown_executor():
+    with pytest.raises(ValueError):
+        EncodingPipeline(workers=1, executor='unknown')
+
+
+def test_encode_change(update_payload, mock_schema):
+    routing_key, body, content_encoding = encode_change(
+        BytesIODecoder, 'U', mock_schema['table_name'], update_payload.payload, mock_schema, None,
+        'test.public.users', identity_encoder
+    )
+
+    assert routing_key == 'test.public.users'
+    assert json.loads(body)['diff'] == {'full_name': 'Myles'}
+    assert content_encoding is None
+
+
+def test_encode_change_buckets(update_payload, mock_schema):
+    routing_key, body, _ = encode_change(
+        BytesIODecoder, 'U', mock_schema['table_name'], update_payload.payload, mock_schema, None,
+        'test.public.users', identity_encoder, buckets=8
+    )
+
+    assert routing_key == f"test.public.users.{key_hash_bucket(json.loads(body)['id'], 8)}"
+
+
+def test_encode_change_shape(update_payload, mock_schema):
+    _, body, _ = encode_change(
+        BytesIODecoder, 'U', mock_schema['table_name'], update_payload.payload, mock_schema,
+        DecodePlan(shape='key-only'), 'test.public.users', identity_encoder
+    )
+
+    assert {'old', 'new', 'diff'} & set(json.loads(body)) == set()
@@ -0,0 +1,84 @@
+from unittest import mock
+
+import pytest
+
+from producer.publication import publication_target, sync_publication
+from producer.table_config import TableConfig, load_table_config
+from producer.table_filter import TableFilter
+
+
+@pytest.fixture(autouse=True)
+def quote_ident():
+    with mock.patch('psycopg2.extensions.quote_ident', side_effect=lambda name, context: f'"{name}"'):
+        yield
+
+
+@pytest.fixture
+def mock_cursor():
+    cur = mock.Mock()
+    cur.fetchall.return_value = [('public', 'users'), ('public', 'user_settings'), ('sales', 'orders')]
+    return cur
+
+
+def render(composable):
+    return composable.as_string(mock.Mock())
+
+
+def test_load_table_config(tmp_path):
+    path = tmp_path / 'tables.json'
+    path.write_text('{"public.users": {"where": "org_id = 42", "columns": ["id", "email"]}}')
+
+    config = load_table_config(str(path))
+    assert config['public.users'].where == 'org_id = 42'
+    assert config['public.users'].columns == ['id', 'email']
+
+    assert load_table_config('{"public.users": {}}')['public.users'].filtered is False
+    assert load_table_config(None) == {}
+
+    assert load_table_config('{"public.users": {"shape": "diff-only"}}')['public.users'].shape == 'diff-only'
+    with pytest.raises(ValueError):
+        load_table_config('{"public.users": {"shape": "everything"}}')
+
+
+def test_publication_target_filters(mock_cursor):
+    table_config = {'public.users': TableConfig(where='org_id = 42', columns=['id', 'email'])}
+
+    target = publication_target(mock_cursor, TableFilter('public.users,sales.orders'), table_config, 150000)
+
+    assert render(target) == 'TABLE "public"."users" ("id", "email") WHERE (org_id = 42), TABLE "sales"."orders"'
+    mock_cursor.execute.assert_not_called()
+
+
+def test_publication_target_filters_need_postgres_15(mock_cursor):
+    table_config = {'public.users': TableConfig(where='org_id = 42')}
+
+    with pytest.raises(ValueError):
+        publication_target(mock_cursor, TableFilter('public.users'), table_config, 140000)
+
+
+def test_publication_target_schema_and_patterns(mock_cursor):
+    target = publication_target(mock_cursor, TableFilter('public.user_*,sales.*'), {}, 150000)
+    assert render(target) == 'TABLE "public"."user_settings", TABLES IN SCHEMA "sales"'
+
+    # schemas are resolved to their tables before postgres 15
+    target = publication_target(mock_cursor, TableFilter('sales.*'), {}, 140000)
+    assert render(target) == 'TABLE "sales"."orders"'
+
+
+def test_publication_target_all_tables(mock_cursor):
+    assert render(publication_target(mock_cursor, TableFilter(None), {}, 150000)) == 'ALL TABLES'
+
+
+def test_sync_publication():
+    conn = mock.MagicMock(server_version=160000)
+    cur = conn.cursor.return_value.__enter__.return_value
+
+    cur.fetchone.return_value = None
+    sync_publication(conn, 'events', TableFilter('public.users'), {})
+    assert render(cur.execute.call_args[0][0]) == 'CREATE PUBLICATION "events" FOR TABLE "public"."users"'
+
+    cur.fetchone.return_value = (False,)
+    sync_publication(conn, 'events', TableFilter('public.users'), {})
+    assert render(cur.execute.call_args[0][0]) == 'ALTER PUBLICATION "events" SET TABLE "public"."users"'
+
+    conn.commit.assert_called()
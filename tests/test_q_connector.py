@@ -0,0 +1,55 @@
+import pytest
+
+from common.qconnector import QConnector
+
+
+class ListConnector(QConnector):
+    """Connector implementing only the abstract methods, publishing into a list"""
+
+    def __init__(self):
+        super().__init__()
+        self.published = []
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, routing_key, payload):
+        self.published.append((routing_key, payload))
+
+    def consume_stream(self, callback_fn):
+        pass
+
+    def consume_all(self):
+        return []
+
+    def consume_batches(self, callback_fn, batch_size, batch_timeout_ms):
+        pass
+
+    def acknowledge_message(self, delivery_tag, multiple=False):
+        pass
+
+    def reject_message(self, delivery_tag, requeue=False):
+        pass
+
+
+def test_publish_batch():
+    connector = ListConnector()
+
+    connector.publish_batch([('test.a', '{}'), ('test.b', '[]')])
+
+    assert connector.published == [('test.a', '{}'), ('test.b', '[]')]
+
+
+def test_publish_encoded():
+    connector = ListConnector()
+
+    body, content_encoding = connector.encode('{}')
+    connector.publish_encoded(routing_key='test.a', body=body, content_encoding=content_encoding)
+    assert connector.published == [('test.a', '{}')]
+
+    # an encoded body can't be published without its content encoding
+    with pytest.raises(ValueError):
+        connector.publish_encoded(routing_key='test.b', body=b'...', content_encoding='br')
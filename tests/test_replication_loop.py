@@ -0,0 +1,34 @@
+from unittest import mock
+
+from producer.replication_loop import StatusUpdates
+
+
+def test_status_updates_wait_for_start():
+    status = StatusUpdates(interval=0)
+
+    # before replication started the connection may hold an exported snapshot
+    status.keepalive()
+    assert not status.started
+
+    cursor = mock.Mock()
+    status.start(cursor)
+    status.write_lsn, status.apply_lsn = 20, 10
+    status.keepalive()
+
+    assert status.started
+    cursor.send_feedback.assert_called_once_with(write_lsn=20, flush_lsn=0, apply_lsn=10, force=True)
+
+
+def test_status_updates_interval():
+    status = StatusUpdates(interval=10)
+    cursor = mock.Mock()
+
+    with mock.patch('time.monotonic', side_effect=[100, 105, 111]):
+        status.start(cursor)
+        status.keepalive()
+        cursor.send_feedback.assert_not_called()
+
+        status.flush_lsn = 5
+        status.keepalive()
+
+    cursor.send_feedback.assert_called_once_with(write_lsn=0, flush_lsn=5, apply_lsn=0, force=True)
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from common.compression import compress
+from common.serialization import (
+    JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPE, Serializer, decode_body, dumps, loads
+)
+
+
+def event():
+    return {
+        'table_name': 'public.users',
+        'new': {'id': 1, 'full_name': 'Ozzy'},
+        'id': 1,
+        'old': {'id': 1, 'full_name': 'John'},
+        'diff': {'full_name': 'Ozzy'},
+        'action': 'U',
+        'recorded_at': '2023-11-17T13:44:14.700844+00:00'
+    }
+
+
+@pytest.mark.parametrize('serializer', ['json', 'orjson'])
+def test_json_round_trip(serializer):
+    pytest.importorskip(serializer)
+
+    body = dumps(event(), serializer)
+
+    assert loads(body, JSON_CONTENT_TYPE) == event()
+    assert Serializer(serializer).content_type == JSON_CONTENT_TYPE
+
+
+def test_unknown_serializer():
+    with pytest.raises(ValueError):
+        Serializer('xml')
+
+    with pytest.raises(ValueError):
+        loads(b'{}', 'application/xml')
+
+
+def test_serializer_dumps():
+    assert Serializer('json').dumps(event()) == json.dumps(event()).encode()
+
+
+def test_orjson_serializer():
+    orjson = pytest.importorskip('orjson')
+
+    assert Serializer('orjson').dumps(event()) == orjson.dumps(event())
+
+
+def test_msgpack_serializer():
+    pytest.importorskip('msgpack')
+    serializer = Serializer('msgpack')
+
+    body = serializer.dumps(event())
+
+    assert serializer.content_type == MSGPACK_CONTENT_TYPE
+    assert loads(body, MSGPACK_CONTENT_TYPE) == event()
+
+
+def test_decode_body():
+    # JSON is handed on as text, like before content types were set
+    assert decode_body(compress('{"id": 1}'), 'br') == '{"id": 1}'
+    assert decode_body(compress('{"id": 1}'), 'br', JSON_CONTENT_TYPE) == '{"id": 1}'
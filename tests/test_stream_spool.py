@@ -0,0 +1,43 @@
+from producer.stream_spool import StreamSpool
+
+
+def test_commit_replays_in_order():
+    spool = StreamSpool()
+
+    spool.append(700, 700, 10, b'U1')
+    spool.append(700, 700, 20, b'U2')
+
+    assert 700 in spool
+    assert list(spool.commit(700)) == [(10, b'U1'), (20, b'U2')]
+    assert len(spool) == 0
+
+
+def test_rolls_over_to_disk():
+    spool = StreamSpool(max_memory=16)
+
+    for lsn in range(100):
+        spool.append(700, 700, lsn, b'U' * 32)
+
+    assert len(list(spool.commit(700))) == 100
+
+
+def test_abort_transaction():
+    spool = StreamSpool()
+
+    spool.append(700, 700, 10, b'U1')
+    spool.abort(700, 700)
+
+    assert 700 not in spool
+    assert list(spool.commit(700)) == []
+
+
+def test_abort_subtransaction():
+    spool = StreamSpool()
+
+    spool.append(700, 700, 10, b'U1')
+    spool.append(700, 701, 20, b'R1')
+    spool.append(700, 701, 30, b'U2')
+    spool.append(700, 700, 40, b'U3')
+    spool.abort(700, 701)
+
+    assert list(spool.commit(700)) == [(10, b'U1'), (20, b'R1'), (40, b'U3')]
@@ -0,0 +1,40 @@
+from producer.table_filter import TableFilter
+
+
+def test_exact_names():
+    table_filter = TableFilter('public.users, public.reports')
+
+    assert table_filter.exact
+    assert table_filter.matches('public.users')
+    assert not table_filter.matches('public.user')
+    assert not table_filter.matches('public.users_archive')
+    assert table_filter.wal2json_add_tables() == 'public.reports,public.users'
+
+
+def test_schema_wildcard():
+    table_filter = TableFilter('public.*,audit.logs')
+
+    assert not table_filter.exact
+    assert table_filter.matches('public.users')
+    assert table_filter.matches('audit.logs')
+    assert not table_filter.matches('audit.events')
+    assert table_filter.wal2json_add_tables() == 'audit.logs,public.*'
+
+
+def test_glob_and_regex():
+    table_filter = TableFilter(['public.user_*', r're:sales\.orders_\d{4}'])
+
+    assert table_filter.matches('public.user_settings')
+    assert not table_filter.matches('public.users')
+    assert table_filter.matches('sales.orders_2024')
+    assert not table_filter.matches('sales.orders_2024_old')
+    assert table_filter.wal2json_add_tables() is None
+
+
+def test_match_all():
+    for tables in [None, '', '*', '.*']:
+        table_filter = TableFilter(tables)
+
+        assert table_filter.match_all
+        assert table_filter.matches('any.table')
+        assert table_filter.wal2json_add_tables() is None
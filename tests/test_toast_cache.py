@@ -0,0 +1,70 @@
+from common.metrics import Metrics
+from producer.toast_cache import ToastCache
+
+
+def test_fill():
+    metrics = Metrics()
+    cache = ToastCache(max_entries=10, min_value_size=50, metrics=metrics)
+
+    cache.remember(1, 7, {'id': 7, 'name': 'Mike', 'bio': 'x' * 100})
+    assert len(cache) == 1
+
+    row = {'id': 7}
+    assert cache.fill(1, 7, row, ['bio', 'avatar']) == ['avatar']
+    assert row == {'id': 7, 'bio': 'x' * 100}
+
+    assert 'pgevents_toast_cache_hits_total 1' in metrics.render()
+    assert 'pgevents_toast_cache_misses_total 1' in metrics.render()
+
+
+def test_eviction():
+    cache = ToastCache(max_entries=2, max_memory=250, min_value_size=0)
+
+    cache.remember(1, 1, {'bio': 'a' * 100})
+    cache.remember(1, 2, {'bio': 'b' * 100})
+    cache.fill(1, 1, {}, ['bio'])
+
+    # least recently used value goes first
+    cache.remember(1, 3, {'bio': 'c' * 100})
+    assert len(cache) == 2
+    assert cache.fill(1, 2, {}, ['bio']) == ['bio']
+
+    # memory cap
+    cache.remember(1, 4, {'bio': 'd' * 200})
+    assert cache.memory <= 250
+    assert len(cache) == 1
+
+
+def test_forget():
+    cache = ToastCache(max_entries=10, min_value_size=0)
+
+    cache.remember(1, 1, {'bio': 'a' * 100})
+    cache.forget(1, 1, ['id', 'bio'])
+
+    assert len(cache) == 0
+    assert cache.memory == 0
+
+
+def test_converted_json_values_are_measured_by_content():
+    cache = ToastCache(max_entries=10, min_value_size=256)
+
+    cache.remember(1, 1, {'company': {'name': 'F' * 300}, 'tags': ['a', 'b']})
+
+    assert len(cache) == 1
+    assert cache.memory >= 300
+
+
+def test_apply():
+    cache = ToastCache(max_entries=10, min_value_size=0)
+    columns = ['id', 'bio', 'avatar']
+
+    cache.apply(1, {'id': 7, 'action': 'U', 'new': {'id': 7, 'bio': 'Drummer'}}, columns)
+
+    # unchanged columns are filled in, the ones the cache never saw stay unchanged
+    event = {'id': 7, 'action': 'U', 'new': {'id': 7}, 'unchanged': ['bio', 'avatar']}
+    cache.apply(1, event, columns)
+    assert event['new'] == {'id': 7, 'bio': 'Drummer'}
+    assert event['unchanged'] == ['avatar']
+
+    cache.apply(1, {'id': 7, 'action': 'D', 'old': {'id': 7}}, columns)
+    assert len(cache) == 0
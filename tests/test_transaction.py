@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from producer.transaction import TransactionBuffer
+
+
+def test_envelope():
+    transaction = TransactionBuffer(mode='envelope')
+    assert not transaction.in_progress
+
+    transaction.begin(700, 0)
+    assert transaction.in_progress
+
+    transaction.add('test.public.users', {'table_name': 'public.users', 'id': 1})
+    transaction.add('test.public.orders', {'table_name': 'public.orders', 'id': 2})
+    transaction.add('test.public.users', {'table_name': 'public.users', 'id': 3})
+
+    messages = transaction.commit(100)
+
+    assert not transaction.in_progress
+    assert [routing_key for routing_key, _ in messages] == ['test.public.users', 'test.public.orders']
+
+    envelope = json.loads(messages[0][1])
+    assert envelope['xid'] == 700
+    assert envelope['commit_lsn'] == 100
+    assert envelope['commit_ts'] == '2000-01-01T00:00:00+00:00'
+    assert envelope['table_name'] == 'public.users'
+    assert [event['id'] for event in envelope['events']] == [1, 3]
+
+
+def test_batch():
+    transaction = TransactionBuffer(mode='batch')
+
+    transaction.begin(700, 0)
+    transaction.add('test.public.users', {'table_name': 'public.users', 'id': 1})
+    transaction.add('test.public.users', {'table_name': 'public.users', 'id': 2})
+
+    messages = transaction.commit(100, 1000000)
+
+    assert len(messages) == 2
+    assert json.loads(messages[1][1])['transaction'] == {
+        'xid': 700,
+        'commit_lsn': 100,
+        'commit_ts': '2000-01-01T00:00:01+00:00'
+    }
+
+
+def test_max_events():
+    transaction = TransactionBuffer(mode='envelope', max_events=2)
+
+    transaction.begin(700, 0, 100)
+    assert transaction.add('test.public.users', {'table_name': 'public.users', 'id': 1}) == []
+    assert transaction.add('test.public.users', {'table_name': 'public.users', 'id': 2}) == []
+
+    # the third event doesn't fit, the events held so far are the first part
+    messages = transaction.add('test.public.users', {'table_name': 'public.users', 'id': 3})
+    envelope = json.loads(messages[0][1])
+    assert [event['id'] for event in envelope['events']] == [1, 2]
+    assert envelope['part'] == 1
+    assert envelope['commit_lsn'] == 100
+    assert len(transaction) == 1
+
+    envelope = json.loads(transaction.commit(100)[0][1])
+    assert [event['id'] for event in envelope['events']] == [3]
+    assert (envelope['part'], envelope['last_part']) == (2, True)
+
+    # the next transaction starts over
+    transaction.begin(701, 0, 200)
+    transaction.add('test.public.users', {'table_name': 'public.users', 'id': 4})
+    assert 'part' not in json.loads(transaction.commit(200)[0][1])
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        TransactionBuffer(mode='unknown')
+
+    with pytest.raises(ValueError):
+        TransactionBuffer(max_events=0)
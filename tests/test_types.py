@@ -0,0 +1,193 @@
+import struct
+from unittest import mock
+
+import pytest
+
+from pgoutput_parser import BytesIODecoder, MemoryViewDecoder
+from pgoutput_parser.plan import DecodePlan
+from pgoutput_parser.types import (
+    TypeRegistry, binary_column_converters, binary_to_array, binary_to_date, binary_to_hex, binary_to_inet,
+    binary_to_interval, binary_to_numeric, binary_to_text, binary_to_time, binary_to_timestamp, binary_to_timestamptz,
+    binary_to_timetz, resolve_binary_types, text_to_numeric, text_to_timestamp
+)
+
+
+def test_registry_opt_in(mock_schema):
+    registry = TypeRegistry('int4, jsonb')
+
+    converters = registry.column_converters(mock_schema)
+
+    assert converters[0] is int
+    assert converters[1] is None
+    assert converters[2] is not None
+    assert converters[3] is None
+
+
+def test_registry_without_types(mock_schema):
+    assert TypeRegistry().column_converters(mock_schema) is None
+    assert TypeRegistry('bool').column_converters(mock_schema) is None
+
+
+def test_registry_unknown_type():
+    with pytest.raises(ValueError):
+        TypeRegistry('money')
+
+
+def test_registry_register(mock_schema):
+    registry = TypeRegistry()
+    registry.register(25, str.upper)
+
+    assert registry.column_converters(mock_schema)[1] is str.upper
+
+
+def test_text_to_numeric():
+    assert text_to_numeric('42') == 42
+    assert text_to_numeric('-7') == -7
+
+    # fractional values keep every digit
+    assert text_to_numeric('4.25') == '4.25'
+    assert text_to_numeric('12345678901234567890.10') == '12345678901234567890.10'
+
+    assert text_to_numeric('NaN') == 'NaN'
+    assert text_to_numeric('Infinity') == 'Infinity'
+    assert text_to_numeric('-Infinity') == '-Infinity'
+
+
+def test_text_to_timestamp():
+    assert text_to_timestamp('2023-11-17 13:44:14.700844+00') == '2023-11-17T13:44:14.700844+00:00'
+    assert text_to_timestamp('infinity') == 'infinity'
+
+
+@pytest.mark.parametrize('decoder', [BytesIODecoder, MemoryViewDecoder])
+def test_typed_decoding(decoder, update_payload, mock_schema):
+    plan = DecodePlan(converters=TypeRegistry('all').column_converters(mock_schema))
+
+    parsed_message = decoder.decode_update_message(mock_schema['table_name'], update_payload.payload, mock_schema, plan)
+
+    assert parsed_message['id'] == 1
+    assert parsed_message['new'] == {
+        'id': 1,
+        'full_name': 'Myles',
+        'company': {'name': 'Fyle'},
+        'created_at': '2023-11-17T13:44:14.700844+00:00',
+        'updated_at': '2023-11-17T13:44:14.700844+00:00'
+    }
+    assert parsed_message['diff'] == {'full_name': 'Myles'}
+
+
+def test_binary_to_numeric():
+    # 12345.678 is the digits 1, 2345, 6780 with weight 1 and scale 3
+    value = struct.pack('>hhHh3h', 3, 1, 0, 3, 1, 2345, 6780)
+    assert binary_to_numeric(value) == '12345.678'
+
+    # 0.10 with scale 2 keeps its trailing zero like the text representation
+    value = struct.pack('>hhHh1h', 1, -1, 0x4000, 2, 1000)
+    assert binary_to_numeric(value) == '-0.10'
+
+    value = struct.pack('>hhHh1h', 1, 1, 0x4000, 0, 42)
+    assert binary_to_numeric(value) == -420000
+
+    assert binary_to_numeric(struct.pack('>hhHh', 0, 0, 0, 0)) == 0
+
+    assert binary_to_numeric(struct.pack('>hhHh', 0, 0, 0xC000, 0)) == 'NaN'
+    assert binary_to_numeric(struct.pack('>hhHh', 0, 0, 0xD000, 0)) == 'Infinity'
+    assert binary_to_numeric(struct.pack('>hhHh', 0, 0, 0xF000, 0)) == '-Infinity'
+
+
+def test_binary_to_timestamptz():
+    assert binary_to_timestamptz(struct.pack('>q', 0)) == '2000-01-01T00:00:00+00:00'
+    assert binary_to_timestamptz(struct.pack('>q', 2 ** 63 - 1)) == 'infinity'
+
+
+def test_binary_to_timestamp_out_of_python_range():
+    # 8000 years after the postgres epoch, python's datetime ends with 9999
+    days = 2921940
+    assert binary_to_timestamp(struct.pack('>q', days * 86400 * 10 ** 6)) == '10000-01-01 00:00:00'
+    assert binary_to_timestamptz(struct.pack('>q', days * 86400 * 10 ** 6 + 1500000)) == '10000-01-01 00:00:01.5+00'
+    assert binary_to_timestamp(struct.pack('>q', -730120 * 86400 * 10 ** 6)) == '0001-12-31 00:00:00 BC'
+
+
+def test_binary_to_date():
+    assert binary_to_date(struct.pack('>i', 1)) == '2000-01-02'
+    assert binary_to_date(struct.pack('>i', 2921940)) == '10000-01-01'
+    assert binary_to_date(struct.pack('>i', -730120)) == '0001-12-31 BC'
+    assert binary_to_date(struct.pack('>i', 2 ** 31 - 1)) == 'infinity'
+
+
+def test_binary_to_time_and_interval():
+    assert binary_to_time(struct.pack('>q', 3723 * 10 ** 6)) == '01:02:03'
+    assert binary_to_time(struct.pack('>q', 86400 * 10 ** 6)) == '24:00:00'
+    assert binary_to_timetz(struct.pack('>qi', 3723 * 10 ** 6, -3600)) == '01:02:03+01:00'
+
+    # 1 year 2 mons -3 days +04:05:06.5
+    assert binary_to_interval(struct.pack('>qii', 14706500000, -3, 14)) == '1 year 2 mons -3 days +04:05:06.5'
+    assert binary_to_interval(struct.pack('>qii', 0, 0, 0)) == '00:00:00'
+    assert binary_to_interval(struct.pack('>qii', -10 ** 6, -1, 0)) == '-1 days -00:00:01'
+
+
+def test_binary_to_inet():
+    assert binary_to_inet(bytes([2, 32, 0, 4, 10, 0, 0, 1])) == '10.0.0.1'
+    assert binary_to_inet(bytes([2, 24, 1, 4, 10, 0, 0, 0])) == '10.0.0.0/24'
+    assert binary_to_inet(bytes([3, 128, 0, 16]) + bytes(15) + b'\x01') == '::1'
+
+
+def test_binary_to_array():
+    # int4[][] {{1,2},{3,NULL}}
+    value = (
+        struct.pack('>iiI', 2, 1, 23) + struct.pack('>ii', 2, 1) + struct.pack('>ii', 2, 1)
+        + b''.join(struct.pack('>ii', 4, number) for number in (1, 2, 3)) + struct.pack('>i', -1)
+    )
+    assert binary_to_array(value) == [[1, 2], [3, None]]
+
+    assert binary_to_array(struct.pack('>iiI', 0, 0, 25)) == []
+
+
+def test_binary_column_converters(mock_schema):
+    converters = binary_column_converters(mock_schema)
+
+    assert len(converters) == 5
+    assert binary_column_converters({'columns': [{'name': 'point', 'type_id': 600}]}) == [binary_to_hex]
+    assert binary_column_converters({'columns': [{'name': 'mood', 'type_id': 16500}]}, {16500: binary_to_text}) == [binary_to_text]
+
+
+def test_resolve_binary_types():
+    cursor = mock.Mock()
+    cursor.fetchall.side_effect = [
+        # enum, array of the enum, domain over text, composite type
+        [(16500, 'e', 0, 0, 'E'), (16501, 'b', 0, 16500, 'A'), (16502, 'd', 25, 0, 'S'), (16503, 'c', 0, 0, 'C')]
+    ]
+
+    resolved = resolve_binary_types(cursor, [16500, 16501, 16502, 16503])
+
+    assert resolved[16500] is binary_to_text
+    assert resolved[16502] is binary_to_text
+    assert 16503 not in resolved
+
+    # 'happy' as the only element of an enum array
+    value = struct.pack('>iiI', 1, 0, 16500) + struct.pack('>ii', 1, 1) + struct.pack('>i', 5) + b'happy'
+    assert resolved[16501](value) == ['happy']
+
+
+@pytest.mark.parametrize('decoder', [BytesIODecoder, MemoryViewDecoder])
+def test_binary_decoding(decoder, mock_schema):
+    plan = DecodePlan(binary_converters=binary_column_converters(mock_schema))
+
+    tuple_data = (
+        b'\x00\x05'
+        b'b\x00\x00\x00\x04\x00\x00\x00\x07'
+        b'b\x00\x00\x00\x05Myles'
+        b'b\x00\x00\x00\x11\x01{"name": "Fyle"}'
+        b'n'
+        b'b\x00\x00\x00\x08' + struct.pack('>q', 0)
+    )
+    payload = b'D\x00\x00@\x01O' + tuple_data
+
+    parsed_message = decoder.decode_delete_message(mock_schema['table_name'], payload, mock_schema, plan)
+
+    assert parsed_message['old'] == {
+        'id': 7,
+        'full_name': 'Myles',
+        'company': {'name': 'Fyle'},
+        'created_at': None,
+        'updated_at': '2000-01-01T00:00:00+00:00'
+    }
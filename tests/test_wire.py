@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from common.serialization import Serializer, loads
+from common.wire import CompactTemplate, SchemaRegistry, UnknownSchemaError, bitmap, bitmap_columns, compact_content_type
+
+
+COLUMNS = ['id', 'full_name', 'company', 'created_at', 'updated_at']
+
+
+def update_event():
+    return {
+        'table_name': 'public.users',
+        'new': {'id': '1', 'full_name': 'Ozzy', 'company': None},
+        'id': '1',
+        'old': {'id': '1', 'full_name': 'John', 'company': None},
+        'diff': {'full_name': 'Ozzy'},
+        'action': 'U',
+        'recorded_at': '2023-11-17T13:44:14.700844+00:00',
+        'unchanged': ['created_at']
+    }
+
+
+@pytest.mark.parametrize('serializer', ['json', 'orjson', 'msgpack'])
+def test_compact_round_trip(serializer):
+    pytest.importorskip(serializer)
+    template = CompactTemplate(Serializer(serializer), 'public.users', COLUMNS)
+    content_type = compact_content_type(template.serializer)
+
+    registry = SchemaRegistry()
+    assert registry.decode(loads(template.schema_message(), content_type)) is None
+    assert len(registry) == 1
+
+    assert registry.decode(loads(template.dumps(update_event()), content_type)) == update_event()
+
+
+def test_compact_is_smaller():
+    template = CompactTemplate(Serializer('json'), 'public.users', COLUMNS)
+
+    assert len(template.dumps(update_event())) < len(json.dumps(update_event()))
+
+
+def test_compact_unknown_schema():
+    template = CompactTemplate(Serializer('json'), 'public.users', COLUMNS)
+
+    with pytest.raises(UnknownSchemaError):
+        SchemaRegistry().decode(json.loads(template.dumps(update_event())))
+
+
+def test_compact_event_outside_layout():
+    template = CompactTemplate(Serializer('json'), 'public.users', ['id'])
+
+    # an event with columns the layout doesn't know is sent as it is
+    assert json.loads(template.dumps(update_event())) == update_event()
+
+
+def test_bitmap_many_columns():
+    columns = [f'col{i}' for i in range(100)]
+
+    assert bitmap_columns(columns, bitmap(columns, {'col0', 'col99'})) == ['col0', 'col99']
+
+
+@pytest.mark.parametrize('sections', [('diff',), ('new', 'diff'), ()])
+def test_compact_shaped_event(sections):
+    template = CompactTemplate(Serializer('json'), 'public.users', COLUMNS)
+    event = {key: value for key, value in update_event().items() if key not in {'old', 'new', 'diff'} - set(sections)}
+
+    registry = SchemaRegistry()
+    registry.decode(json.loads(template.schema_message()))
+
+    assert registry.decode(json.loads(template.dumps(event))) == event
@@ -0,0 +1,23 @@
+import threading
+
+from consumer.worker_pool import WorkerPool
+
+
+def test_unordered():
+    pool = WorkerPool(workers=4)
+
+    futures = [pool.submit(None, lambda i: i * 2, i) for i in range(10)]
+
+    assert [future.result() for future in futures] == [i * 2 for i in range(10)]
+    pool.shutdown()
+
+
+def test_ordered_keys_share_a_worker():
+    pool = WorkerPool(workers=4, ordered=True)
+
+    futures = [pool.submit(('public.users', i % 2), threading.current_thread) for i in range(10)]
+    threads = [future.result() for future in futures]
+
+    assert len({thread.name for thread in threads[0::2]}) == 1
+    assert len({thread.name for thread in threads[1::2]}) == 1
+    pool.shutdown()